@@ -0,0 +1,270 @@
+import heapq
+import math
+import time
+import itertools
+import threading
+from concurrent.futures import Future
+
+
+class Overloaded(Exception):
+    """Raised when a request would wait longer than the admission controller allows"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"{reason}, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def parse_weights(spec):
+    """Parse client weights such as 'tenant-a=2,tenant-b=0.5' into a dict"""
+    weights = {}
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        client, _, weight = part.partition('=')
+        try:
+            weights[client.strip()] = float(weight)
+        except ValueError:
+            raise ValueError(f"Invalid client weight '{part.strip()}', use client=weight")
+        if weights[client.strip()] <= 0:
+            raise ValueError(f"Client weight for '{client.strip()}' must be positive")
+    return weights
+
+
+class _FairClock:
+    """Self-clocked fair queueing tags: a client's next item starts where its last one finished,
+    or at the current virtual time if it has been idle, and finishes cost / weight later."""
+
+    def __init__(self, weights):
+        self.weights = weights
+        self.now = 0.0
+        self._finish = {}
+
+    def tag(self, client, cost):
+        return self.commit(client, self.peek(client, cost))
+
+    def peek(self, client, cost):
+        """The tag the client's next item would get, without taking it"""
+        return max(self.now, self._finish.get(client, 0.0)) + cost / self.weights.get(client, 1.0)
+
+    def commit(self, client, tag):
+        self._finish[client] = tag
+        return tag
+
+    def advance(self, tag):
+        self.now = max(self.now, tag)
+        # Clients that have caught up with the clock would restart from it anyway
+        for client in [client for client, finish in self._finish.items() if finish <= self.now]:
+            del self._finish[client]
+
+
+class Ticket:
+    """A request's place in the admission queue"""
+
+    def __init__(self, client, cost, tag):
+        self.client = client
+        self.cost = cost
+        self.tag = tag
+        self.granted_at = None
+        self._event = threading.Event()
+        self._callbacks = []
+
+    def wait(self):
+        self._event.wait()
+
+    async def wait_async(self):
+        """Await the grant without holding a thread"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            if not future.done():
+                future.set_result(None)
+        self._add_callback(lambda: loop.call_soon_threadsafe(wake))
+        await future
+
+    def _add_callback(self, callback):
+        # _grant() runs under the controller's lock, so the event can't be set between check and append
+        if self._event.is_set():
+            callback()
+        else:
+            self._callbacks.append(callback)
+
+    def _grant(self):
+        self.granted_at = time.perf_counter()
+        self._event.set()
+        for callback in self._callbacks:
+            callback()
+
+
+class AdmissionController:
+    """Admits requests to work that is costly to run, fairly across clients.
+
+    At most `max_active` requests run at once and at most `per_client` of
+    them for any one client. The rest wait and are granted in order of
+    their fair-queueing tag, which grows with the request's cost (e.g. its
+    pages) divided by its client's weight, so a one-page document from a
+    quiet client goes ahead of the next part of a large batch. A request
+    whose estimated wait is longer than `max_wait` seconds is turned away
+    with Overloaded, as is a client's request beyond `max_queued_per_client`
+    waiting ones. Waits are estimated from the measured seconds per unit of
+    cost of the requests that finished before.
+    """
+
+    def __init__(self, max_active, per_client, max_wait, max_queued_per_client=8, weights=None):
+        self.max_active = max_active
+        self.per_client = per_client
+        self.max_wait = max_wait
+        self.max_queued_per_client = max_queued_per_client
+        self._clock = _FairClock(weights or {})
+        self._lock = threading.Lock()
+        self._active = []
+        self._waiting = []
+        self._seconds_per_cost = None
+        self._stats = {'admitted': 0, 'rejected': 0}
+
+    def enter(self, client, cost):
+        """Queue a request, returning its Ticket, or raise Overloaded if it should be shed"""
+        cost = max(1, cost)
+        with self._lock:
+            queued = sum(1 for ticket in self._waiting if ticket.client == client)
+            if queued >= self.max_queued_per_client:
+                self._stats['rejected'] += 1
+                raise Overloaded(f"Too many requests waiting for client {client}",
+                                 max(1, math.ceil(self._estimate(float('inf')))))
+            # The tag is only taken once the request is admitted, so a shed request doesn't push the client back
+            ticket = Ticket(client, cost, self._clock.peek(client, cost))
+            self._waiting.append(ticket)
+            self._dispatch()
+            if ticket.granted_at is None:
+                wait = self._estimate(ticket.tag)
+                if wait > self.max_wait:
+                    self._waiting.remove(ticket)
+                    self._stats['rejected'] += 1
+                    raise Overloaded(f"Server is busy, estimated wait {wait:.0f}s", max(1, math.ceil(wait)))
+            self._clock.commit(client, ticket.tag)
+            self._stats['admitted'] += 1
+        return ticket
+
+    def leave(self, ticket):
+        """Finish a granted request or withdraw a waiting one (safe to call more than once)"""
+        with self._lock:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+            elif ticket in self._active:
+                self._active.remove(ticket)
+                seconds = (time.perf_counter() - ticket.granted_at) / ticket.cost
+                self._seconds_per_cost = seconds if self._seconds_per_cost is None else \
+                    0.8 * self._seconds_per_cost + 0.2 * seconds
+            else:
+                return
+            self._dispatch()
+
+    def admit(self, client, cost):
+        """Context manager that waits for admission and leaves once the work is done"""
+        return _Admission(self, client, cost)
+
+    def _estimate(self, tag):
+        """Seconds until a waiting request with `tag` is granted: until a slot frees, plus the work queued ahead of it"""
+        rate = self._seconds_per_cost or 1.0
+        now = time.perf_counter()
+        remaining = [max(0.0, ticket.cost * rate - (now - ticket.granted_at)) for ticket in self._active]
+        soonest = min(remaining) if len(remaining) >= self.max_active else 0.0
+        ahead = sum(ticket.cost for ticket in self._waiting if ticket.tag < tag)
+        return soonest + ahead * rate / max(1, self.max_active)
+
+    def _dispatch(self):
+        while len(self._active) < self.max_active:
+            counts = {}
+            for ticket in self._active:
+                counts[ticket.client] = counts.get(ticket.client, 0) + 1
+            eligible = [ticket for ticket in self._waiting if counts.get(ticket.client, 0) < self.per_client]
+            if not eligible:
+                return
+            ticket = min(eligible, key=lambda ticket: ticket.tag)
+            self._waiting.remove(ticket)
+            self._active.append(ticket)
+            self._clock.advance(ticket.tag)
+            ticket._grant()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, active=len(self._active), waiting=len(self._waiting),
+                        waiting_cost=sum(ticket.cost for ticket in self._waiting),
+                        seconds_per_cost=self._seconds_per_cost)
+
+
+class _Admission:
+    def __init__(self, controller, client, cost):
+        self.controller = controller
+        self.ticket = controller.enter(client, cost)
+
+    def __enter__(self):
+        try:
+            self.ticket.wait()
+        except BaseException:
+            self.controller.leave(self.ticket)
+            raise
+        return self.ticket
+
+    def __exit__(self, *exc):
+        self.controller.leave(self.ticket)
+
+
+class FairScheduler:
+    """Feeds an executor from per-client queues with weighted fair queueing.
+
+    Only `slots` tasks are handed to the executor at a time; the rest wait
+    here, so a client that submits hundreds of pages does not put them all
+    ahead of another client's single page. `executor()` returns the
+    executor to submit to. The returned futures can be cancelled while
+    they are still waiting here.
+    """
+
+    def __init__(self, executor, slots, weights=None):
+        self._executor = executor
+        self.slots = slots
+        self._clock = _FairClock(weights or {})
+        self._lock = threading.Lock()
+        self._heap = []
+        self._order = itertools.count()
+        self._in_flight = 0
+
+    def submit(self, client, fn, *args):
+        future = Future()
+        with self._lock:
+            heapq.heappush(self._heap, (self._clock.tag(client, 1), next(self._order), future, fn, args))
+        self._dispatch()
+        return future
+
+    def waiting(self):
+        with self._lock:
+            return len(self._heap)
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                if self._in_flight >= self.slots or not self._heap:
+                    return
+                tag, _, future, fn, args = heapq.heappop(self._heap)
+                self._clock.advance(tag)
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._in_flight += 1
+            try:
+                inner = self._executor().submit(fn, *args)
+            except BaseException as e:
+                self._finished(future, None, e)
+                continue
+            inner.add_done_callback(lambda inner, future=future: self._finished(future, inner))
+
+    def _finished(self, future, inner, error=None):
+        with self._lock:
+            self._in_flight -= 1
+        if inner is not None:
+            error = inner.exception() if not inner.cancelled() else RuntimeError('OCR task was cancelled')
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(inner.result())
+        self._dispatch()
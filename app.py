@@ -1,22 +1,321 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Request, Response, request, jsonify, render_template_string
 import requests
 import os
+import io
+import gzip
 import json
-import re
+import time
+import uuid
+import hashlib
+import mimetypes
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from werkzeug.utils import secure_filename
+from webhook_client import WebhookClient
+from upload_sessions import IncompleteUpload, UploadFinalized, UploadLimit, UploadSessions
+from admission import AdmissionController, Overloaded, parse_weights
+from document_store import DocumentStore
+import local_extract
+from resume_parser import extract_text, parse_resume_data
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, StageTimings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Uploads up to this size are buffered in memory; larger ones spill to an
+# anonymous temp file. Either way they are forwarded to n8n without a named
+# file on disk.
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', 4 * 1024 * 1024))
+
+class UploadBuffer(tempfile.SpooledTemporaryFile):
+    """Spooled buffer for an incoming file that counts and hashes the bytes written to it"""
+
+    def __init__(self):
+        super().__init__(max_size=UPLOAD_SPOOL_THRESHOLD)
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        self._sha256.update(data)
+        return super().write(data)
+
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+class UploadRequest(Request):
+    # Werkzeug writes each multipart file part into the stream returned here
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadBuffer()
+
+    # Multipart parsing happens lazily on first access to request.files
+    def _load_form_data(self):
+        with metrics.timings.stage('upload'):
+            super()._load_form_data()
+
+class MultipartBody:
+    """File-like multipart/form-data body that streams its file part.
+
+    Unlike `requests.post(files=...)`, the file is never read into memory
+    as a whole; requests sends it in blocks with a known Content-Length.
+    """
+
+    def __init__(self, fields, file_field, filename, fileobj, file_size, content_type):
+        boundary = uuid.uuid4().hex
+        head = ''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        )
+        head += (f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                 f'Content-Type: {content_type}\r\n\r\n')
+        tail = f'\r\n--{boundary}--\r\n'
+        self._head = head.encode('utf-8')
+        self._tail = tail.encode('utf-8')
+        self._file = fileobj
+        self._start = fileobj.tell()
+        self.len = len(self._head) + file_size + len(self._tail)
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        self.rewind()
+
+    def rewind(self):
+        self._file.seek(self._start)
+        self._parts = [io.BytesIO(self._head), self._file, io.BytesIO(self._tail)]
+
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and (size < 0 or size > 0):
+            chunk = self._parts[0].read(size)
+            if not chunk:
+                self._parts.pop(0)
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b''.join(chunks)
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 
 # n8n Webhook URL
-WEBHOOK_URL = "http://localhost:5678/webhook/DOC-OCR"
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', "http://localhost:5678/webhook/DOC-OCR")
+
+# Shared keep-alive connection pool to the webhook. Size it to the number
+# of uploads n8n can work on at once; extra uploads wait for a connection.
+WEBHOOK_POOL_SIZE = int(os.environ.get('WEBHOOK_POOL_SIZE', 10))
+WEBHOOK_CONNECT_TIMEOUT = float(os.environ.get('WEBHOOK_CONNECT_TIMEOUT', 5))
+WEBHOOK_READ_TIMEOUT = float(os.environ.get('WEBHOOK_READ_TIMEOUT', 30))
+WEBHOOK_RETRIES = int(os.environ.get('WEBHOOK_RETRIES', 2))
+WEBHOOK_BACKOFF = float(os.environ.get('WEBHOOK_BACKOFF', 0.5))
+WEBHOOK_BACKOFF_MAX = float(os.environ.get('WEBHOOK_BACKOFF_MAX', 8))
+
+# How uploads are processed. 'webhook' (the default) forwards them to n8n.
+# 'direct' extracts PDFs and images in this process with the pdf_ocr
+# pipeline, skipping the round trip through n8n and the OCR service; other
+# file types still go to the webhook unless DIRECT_WEBHOOK_FALLBACK=0.
+PROCESSING_MODES = ('webhook', 'direct')
+PROCESSING_MODE = os.environ.get('PROCESSING_MODE', 'webhook')
+if PROCESSING_MODE not in PROCESSING_MODES:
+    raise ValueError(f"Unknown PROCESSING_MODE '{PROCESSING_MODE}', choose one of: {', '.join(PROCESSING_MODES)}")
+DIRECT_WEBHOOK_FALLBACK = os.environ.get('DIRECT_WEBHOOK_FALLBACK', '1') == '1'
+# Uploads extracted at once in direct mode; their pages share pdf_ocr's OCR worker pool
+DIRECT_WORKERS = int(os.environ.get('DIRECT_WORKERS', 4))
+
+# Admission control for uploads: at most ADMISSION_MAX_ACTIVE are processed
+# at once (default: the webhook pool, or DIRECT_WORKERS in direct mode; 0
+# turns it off), at most ADMISSION_PER_CLIENT of them for one client. The
+# rest wait in weighted fair order, smaller files first; files are costed at
+# one unit per started ADMISSION_COST_BYTES. An upload whose estimated wait
+# exceeds ADMISSION_MAX_WAIT seconds, or that would be more than
+# ADMISSION_MAX_QUEUED waiting for its client, gets a 429 with Retry-After.
+# Clients are told apart by ADMISSION_CLIENT_HEADER, or by address without
+# it; the header is passed on to the webhook so n8n can forward it to the OCR
+# service. ADMISSION_WEIGHTS such as 'tenant-a=2' give clients a larger share.
+ADMISSION_MAX_ACTIVE = int(os.environ.get('ADMISSION_MAX_ACTIVE',
+                                          DIRECT_WORKERS if PROCESSING_MODE == 'direct' else WEBHOOK_POOL_SIZE))
+ADMISSION_PER_CLIENT = int(os.environ.get('ADMISSION_PER_CLIENT', 2))
+ADMISSION_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', 30))
+ADMISSION_MAX_QUEUED = int(os.environ.get('ADMISSION_MAX_QUEUED', 8))
+ADMISSION_COST_BYTES = int(os.environ.get('ADMISSION_COST_BYTES', 1024 * 1024))
+ADMISSION_CLIENT_HEADER = os.environ.get('ADMISSION_CLIENT_HEADER', 'X-Client-Id')
+ADMISSION_WEIGHTS = parse_weights(os.environ.get('ADMISSION_WEIGHTS', ''))
+
+admission = AdmissionController(ADMISSION_MAX_ACTIVE, ADMISSION_PER_CLIENT, ADMISSION_MAX_WAIT,
+                                ADMISSION_MAX_QUEUED, ADMISSION_WEIGHTS) if ADMISSION_MAX_ACTIVE > 0 else None
 
 # Configuration
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB max file size
-ALLOWED_EXTENSIONS = {'txt "\[0:14\]": "txt",', 'pdf', 'doc', 'docx', 'csv', 'json', 'xml', 'html', 'md', 'py', 'js', 'css', 'xlsx', 'xls', 'png', 'jpg', 'jpeg'}
+ALLOWED_EXTENSIONS = {'txt', 'pdf', 'doc', 'docx', 'csv', 'json', 'xml', 'html', 'md', 'py', 'js', 'css', 'xlsx', 'xls', 'png', 'jpg', 'jpeg'}
 
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
+# Text, markup, CSV, JSON, DOCX and XLSX uploads are read in this process
+# with streaming readers instead of going through n8n; PDFs, images and
+# legacy .doc/.xls files still go to the webhook (or direct mode).
+# LOCAL_EXTRACT=0 sends everything to the webhook. Text is cut after
+# LOCAL_MAX_CHARS characters and split into pages of about LOCAL_PAGE_CHARS,
+# besides the DOCX page breaks and XLSX sheets. Files of LOCAL_QUEUE_BYTES
+# or more are only read once admission control lets them in, like uploads
+# for the webhook, so large files can't tie up every worker at once.
+LOCAL_EXTRACT = os.environ.get('LOCAL_EXTRACT', '1') == '1'
+LOCAL_MAX_CHARS = int(os.environ.get('LOCAL_MAX_CHARS', 10 * 1000 * 1000))
+LOCAL_PAGE_CHARS = int(os.environ.get('LOCAL_PAGE_CHARS', 20000))
+LOCAL_QUEUE_BYTES = int(os.environ.get('LOCAL_QUEUE_BYTES', 1024 * 1024))
+
+# Chunked uploads (/api/uploads) for files up to CHUNKED_MAX_FILE_SIZE: the
+# file is sent as CHUNK_SIZE pieces (each within MAX_FILE_SIZE) that can be
+# retried on their own, and assembled under UPLOAD_SESSION_DIR. Sessions
+# idle for UPLOAD_SESSION_TTL seconds are dropped. Chunks that arrive ahead
+# of the running hash are held in memory up to UPLOAD_HASH_BUFFER_MB per upload.
+# A client may have UPLOAD_SESSIONS_PER_CLIENT uploads open, and all open
+# uploads together may reserve at most UPLOAD_SESSIONS_MAX_MB of disk.
+CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', 8 * 1024 * 1024))
+CHUNKED_MAX_FILE_SIZE = int(os.environ.get('CHUNKED_MAX_FILE_SIZE', 1024 * 1024 * 1024))
+UPLOAD_SESSION_DIR = os.environ.get('UPLOAD_SESSION_DIR', os.path.join(tempfile.gettempdir(), 'upload_sessions'))
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 3600))
+UPLOAD_HASH_BUFFER_MB = int(os.environ.get('UPLOAD_HASH_BUFFER_MB', 64))
+UPLOAD_SESSIONS_PER_CLIENT = int(os.environ.get('UPLOAD_SESSIONS_PER_CLIENT', 4))
+UPLOAD_SESSIONS_MAX_MB = int(os.environ.get('UPLOAD_SESSIONS_MAX_MB', 8192))
+
+upload_sessions = UploadSessions(UPLOAD_SESSION_DIR, UPLOAD_SESSION_TTL, UPLOAD_HASH_BUFFER_MB * 1024 * 1024,
+                                 UPLOAD_SESSIONS_PER_CLIENT, UPLOAD_SESSIONS_MAX_MB * 1024 * 1024)
+
+# Every processed document's text, page offsets and parsed fields are kept
+# in a SQLite file keyed by the file's SHA-256 and indexed for /api/search.
+# It lives next to the app by default, not in the temp dir, where cleaners
+# and reboots would wipe it. Set DOCUMENT_STORE_PATH empty to keep nothing.
+DOCUMENT_STORE_PATH = os.environ.get('DOCUMENT_STORE_PATH',
+                                     os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'document_store.db'))
+
+document_store = DocumentStore(DOCUMENT_STORE_PATH) if DOCUMENT_STORE_PATH else None
+# One writer, so indexing never holds up a response or contends for the database lock
+_store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='document-store')
+# Documents queued for the store, by SHA-256, so a read that follows the upload waits for its write
+_pending_documents = {}
+_pending_lock = threading.Lock()
+
+# Responses of COMPRESS_MIN_BYTES or more (JSON, HTML and text) are
+# compressed for clients that accept it: with brotli if the optional brotli
+# package is installed, else gzip. 0 turns compression off.
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain')
+# Pages returned by /api/documents/<sha256>/pages when no count is given, and at most
+TEXT_PAGES_DEFAULT = int(os.environ.get('TEXT_PAGES_DEFAULT', 5))
+TEXT_PAGES_MAX = int(os.environ.get('TEXT_PAGES_MAX', 50))
+
+webhook = WebhookClient(WEBHOOK_URL, WEBHOOK_POOL_SIZE, WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT,
+                        WEBHOOK_RETRIES, WEBHOOK_BACKOFF, WEBHOOK_BACKOFF_MAX)
+
+class UploadMetrics(MetricsRegistry):
+    """Prometheus metrics of the upload proxy, served at /metrics.
+
+    Stage timings also go out per request in the Server-Timing header.
+    `webhook_stats()` returns the webhook client's current stats.
+    """
+
+    def __init__(self, webhook_stats):
+        super().__init__()
+        self.timings = StageTimings(self.histogram('upload_stage_seconds', 'Time spent in each stage of an upload',
+                                                   ['stage']))
+        self.request_seconds = self.histogram('upload_request_seconds', 'Request handling time', ['route', 'status'])
+        self.bytes_uploaded = self.counter('upload_bytes_total', 'Bytes of uploaded files forwarded to the webhook')
+        self.gauge('upload_webhook_in_flight', 'Uploads holding a webhook connection',
+                   fn=lambda: min(webhook_stats()['in_use'], WEBHOOK_POOL_SIZE))
+        self.gauge('upload_webhook_queue_depth', 'Uploads waiting for a free webhook connection',
+                   fn=lambda: max(0, webhook_stats()['in_use'] - WEBHOOK_POOL_SIZE))
+        self.counter('upload_webhook_requests_total', 'Uploads posted to the webhook',
+                     fn=lambda: webhook_stats()['requests'])
+        self.counter('upload_webhook_retries_total', 'Webhook calls retried after an error',
+                     fn=lambda: webhook_stats()['retries'])
+        self.counter('upload_webhook_failures_total', 'Uploads that failed after all retries',
+                     fn=lambda: webhook_stats()['failures'])
+        if admission is not None:
+            self.gauge('upload_admission_requests', 'Uploads being processed or waiting for admission, by state',
+                       ['state'], fn=lambda: [({'state': state}, admission.stats()[state])
+                                              for state in ('active', 'waiting')])
+            self.counter('upload_admission_decisions_total', 'Uploads admitted or turned away with a 429',
+                         ['decision'], fn=lambda: [({'decision': decision}, admission.stats()[decision])
+                                                   for decision in ('admitted', 'rejected')])
+
+    def finish_request(self, response, route):
+        """Record the request duration and add its Server-Timing header"""
+        timer = self.timings.current()
+        if timer is not None:
+            self.request_seconds.observe(timer.elapsed(), route=route or 'unmatched', status=response.status_code)
+            response.headers['Server-Timing'] = timer.server_timing()
+        return response
+
+metrics = UploadMetrics(lambda: webhook.stats())
+
+_pdf_ocr = None
+_direct_executor = None
+_direct_lock = threading.Lock()
+
+def get_direct_pipeline():
+    """Import the pdf_ocr pipeline and start the pool direct extractions run on, on first use"""
+    global _pdf_ocr, _direct_executor
+    with _direct_lock:
+        if _pdf_ocr is None:
+            # Only direct mode needs the OCR stack (pytesseract, pdf2image, Poppler)
+            import pdf_ocr
+            _direct_executor = ThreadPoolExecutor(max_workers=DIRECT_WORKERS, thread_name_prefix='direct')
+            _pdf_ocr = pdf_ocr
+    return _pdf_ocr, _direct_executor
+
+def use_direct(filename):
+    """Whether an upload is extracted in this process rather than sent to the webhook"""
+    if PROCESSING_MODE != 'direct':
+        return False
+    pdf_ocr, _ = get_direct_pipeline()
+    return filename.lower().endswith(('.pdf',) + pdf_ocr.IMAGE_EXTENSIONS)
+
+def extract_direct(filename, path, digest, timer, client=None):
+    """Extract a file on disk whose SHA-256 is `digest` with the pdf_ocr pipeline.
+
+    Returns the reply the OCR service's /process-pdfs would have given.
+    """
+    pdf_ocr, _ = get_direct_pipeline()
+    # Stages timed inside pdf_ocr count towards this request's Server-Timing
+    pdf_ocr.timings.begin(timer)
+    # and its pages take their fair turn on the OCR pool with other clients'
+    pdf_ocr.set_client(client)
+    extracted = pdf_ocr.extract_document(path, digest)
+    return {'info': f"Title: {filename}", **extracted, 'file_key_used': 'file'}
+
+def extract_direct_upload(filename, stream, timer, client=None):
+    """Spool an upload to disk, hashing it on the way, and extract it with extract_direct()"""
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1].lower())
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        return extract_direct(filename, path, digest.hexdigest(), timer, client)
+    finally:
+        os.remove(path)
+
+def use_local(filename):
+    """Whether an upload's text is read in this process by one of the local_extract readers"""
+    return LOCAL_EXTRACT and local_extract.can_extract(filename)
+
+def extract_local(filename, stream):
+    """Read an upload with its local_extract reader, returning the reply or None to send it to the webhook instead"""
+    start = stream.tell()
+    extracted = local_extract.extract_file(stream, filename, LOCAL_MAX_CHARS, LOCAL_PAGE_CHARS)
+    stream.seek(start)
+    if extracted is None:
+        return None
+    return {'info': f"Title: {filename}", **extracted, 'file_key_used': 'file'}
+
+def render_metrics(registry):
+    # In direct mode the pipeline's own metrics (pages, cache, OCR stages) are served too
+    return registry.render() + (_pdf_ocr.metrics.render() if _pdf_ocr is not None else '')
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -31,40 +330,264 @@ def format_file_size(size_bytes):
         i += 1
     return f"{size_bytes:.1f}{size_names[i]}"
 
-def parse_resume_data(text_content):
-    """Parse resume/CV text content and extract structured information"""
-    if not text_content:
-        return None
-    
-    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-    emails = re.findall(email_pattern, text_content)
-    
-    phone_pattern = r'[\+]?[1-9]?[0-9]{7,15}'
-    phones = re.findall(phone_pattern, text_content)
-    
-    linkedin_pattern = r'linkedin\.com/in/[\w-]+'
-    linkedin = re.findall(linkedin_pattern, text_content.lower())
-    
-    lines = text_content.split('\n')
-    potential_name = None
-    for line in lines[:5]:
-        line = line.strip()
-        if line and len(line.split()) <= 4 and any(word[0].isupper() for word in line.split() if word):
-            potential_name = line
-            break
-    
+def webhook_result(filename, status_code, response_text):
+    """Turn the n8n webhook's reply into the /api/upload response body and status"""
+    if status_code != 200:
+        return {'error': f'n8n webhook returned status {status_code}: {response_text}'}, 500
+
+    try:
+        response_data = json.loads(response_text)
+    except ValueError:
+        # Not JSON, so the reply is the text
+        return upload_result(filename, parse_resume_data(response_text), response_text)
+    return reply_result(filename, response_data)
+
+def reply_result(filename, response_data):
+    """Turn a decoded extraction reply (from n8n, direct mode or a local reader) into the response body and status"""
+    # Parse the document text itself, not the escaped JSON around it
+    text_parts = set()
+    text_content = extract_text(response_data, text_parts)
+    parsed_data = parse_resume_data(text_content)
+    if parsed_data:
+        # The text goes out once, in response.raw_text; the rest of the reply stays in raw_response
+        raw_text = json.dumps(_without_text(response_data, text_parts), ensure_ascii=False)
+    else:
+        raw_text = json.dumps(response_data, ensure_ascii=False)
+    return upload_result(filename, parsed_data, raw_text)
+
+def upload_result(filename, parsed_data, raw_text):
     return {
-        'name': potential_name,
-        'emails': emails,
-        'phones': phones,
-        'linkedin': linkedin[0] if linkedin else None,
-        'raw_text': text_content
-    }
+        'success': True,
+        'message': 'File processed successfully',
+        'filename': filename,
+        'response': parsed_data or {'raw_text': raw_text},
+        'raw_response': raw_text
+    }, 200
+
+def _without_text(payload, parts, path=()):
+    """A copy of a decoded webhook reply without the strings the text was joined from (their paths in `parts`)"""
+    if isinstance(payload, dict):
+        return {key: _without_text(value, parts, path + (key,)) for key, value in payload.items()
+                if path + (key,) not in parts}
+    if isinstance(payload, list):
+        return [_without_text(item, parts, path + (index,)) for index, item in enumerate(payload)
+                if path + (index,) not in parts]
+    return payload
+
+def select_fields(body, fields):
+    """Keep only the comma-separated `fields` of a response body, e.g. 'filename,response.emails'.
+
+    A name with a dot picks one key of a nested object. Unknown names are
+    ignored; without `fields` the body is returned whole.
+    """
+    if not fields:
+        return body
+    selected = {}
+    for field in fields.split(','):
+        key, _, subkey = field.strip().partition('.')
+        if key not in body:
+            continue
+        if not subkey:
+            selected[key] = body[key]
+        elif isinstance(body[key], dict) and subkey in body[key] and selected.get(key) is not body[key]:
+            selected.setdefault(key, {})[subkey] = body[key][subkey]
+    return selected
+
+def upload_response(result, digest, values):
+    """Apply an upload request's text= and fields= options to its response body.
+
+    With text=pages the document text is left out when it can be read page
+    by page from the document store instead; the body then says how many
+    pages there are and where to get them (text_url).
+    """
+    fields = result.get('response') or {}
+    if values.get('text') == 'pages' and _stored(digest, fields):
+        result = dict(result, response={key: value for key, value in fields.items() if key != 'raw_text'},
+                      sha256=digest, pages=len(_stored_offsets(result, fields['raw_text'])),
+                      text_url=f'/api/documents/{digest}/pages')
+    return select_fields(result, values.get('fields'))
+
+def _stored_offsets(result, text):
+    """Page offsets from the OCR service's reply if it sent usable ones, else the whole text as one page"""
+    try:
+        offsets = json.loads(result['raw_response']).get('page_offsets')
+    except (ValueError, AttributeError):
+        offsets = None
+    if isinstance(offsets, list) and offsets and all(isinstance(offset, int) and 0 <= offset <= len(text)
+                                                     for offset in offsets):
+        return offsets
+    return [0]
+
+def store_result(digest, filename, file_size, content_type, result):
+    """Queue a processed document for the document store and its search index"""
+    fields = result.get('response') or {}
+    if not _stored(digest, fields):
+        return
+    text = fields['raw_text']
+    offsets = _stored_offsets(result, text)
+    fields = {key: value for key, value in fields.items() if key != 'raw_text'}
+
+    def put():
+        try:
+            document_store.put(digest, filename, text, offsets, fields, file_size, content_type)
+        except Exception as e:
+            print(f"Could not store {filename} ({digest}): {e}")
+
+    def done(future):
+        with _pending_lock:
+            if _pending_documents.get(digest) is future:
+                del _pending_documents[digest]
+    with _pending_lock:
+        future = _pending_documents[digest] = _store_executor.submit(put)
+    future.add_done_callback(done)
+
+def _stored(digest, fields):
+    # Without extracted text the reply itself stands in for it, and isn't worth indexing
+    return document_store is not None and bool(digest) and 'emails' in fields
+
+def wait_stored(digest, timeout=30):
+    """Wait for a document queued by store_result() to be written, if it still is queued"""
+    with _pending_lock:
+        future = _pending_documents.get(digest)
+    if future is not None:
+        try:
+            future.result(timeout)
+        except Exception:
+            pass
+
+def document_pages(sha256, values):
+    """Read pages of a stored document's text from request values, returning (body, status)"""
+    try:
+        start = max(1, int(values.get('start') or 1))
+        count = min(TEXT_PAGES_MAX, max(1, int(values.get('count') or TEXT_PAGES_DEFAULT)))
+    except ValueError:
+        return {'error': 'start and count must be numbers'}, 400
+    wait_stored(sha256)
+    result = document_store.pages(sha256, start, count) if document_store else None
+    if result is None:
+        return {'error': 'Document not found'}, 404
+    end = start + len(result['items'])
+    return dict(result, start=start, next=end if end <= result['pages'] else None), 200
+
+def get_stored_document(sha256, values):
+    """Look up a stored document for /api/documents/<sha256>, returning (body, status)"""
+    wait_stored(sha256)
+    document = document_store.get(sha256) if document_store else None
+    if document is None:
+        return {'error': 'Document not found'}, 404
+    return select_fields(document, values.get('fields')), 200
+
+def compress_body(data, accept_encodings):
+    """Compress a response body in the best encoding the client accepts, returning (data, encoding or None)"""
+    encoding = accept_encodings.best_match(['br', 'gzip'] if brotli is not None else ['gzip'])
+    if encoding == 'br':
+        return brotli.compress(data, quality=4), encoding
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=5), encoding
+    return data, None
+
+def compressible(response):
+    return COMPRESS_MIN_BYTES > 0 and response.mimetype in COMPRESSIBLE_TYPES and \
+        'Content-Encoding' not in response.headers
+
+def compress_response(response, accept_encodings):
+    """Compress a buffered response for the client if it is large enough to be worth it"""
+    if response.direct_passthrough or response.is_streamed or not compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) >= COMPRESS_MIN_BYTES:
+        data, encoding = compress_body(data, accept_encodings)
+        if encoding is not None:
+            response.set_data(data)
+            response.headers['Content-Encoding'] = encoding
+    return response
+
+def upload_client():
+    """Name the client of the current request, for admission control"""
+    return request.headers.get(ADMISSION_CLIENT_HEADER) or request.remote_addr or 'unknown'
+
+def upload_cost(file_size):
+    return 1 + file_size // ADMISSION_COST_BYTES
+
+@contextmanager
+def admitted(client, file_size):
+    """Wait for the client's turn to process an upload, raising Overloaded if it should be turned away"""
+    if admission is None:
+        yield
+        return
+    ticket = admission.enter(client, upload_cost(file_size))
+    try:
+        with metrics.timings.stage('admission'):
+            ticket.wait()
+        yield
+    finally:
+        admission.leave(ticket)
+
+def retry_later(e):
+    return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+
+def process_upload(filename, stream, file_size, content_type, client, path=None, digest=None):
+    """Extract text from an upload in this process or through the webhook, returning (body, status).
+
+    `path` and `digest` are given when the file is already on disk with a
+    known SHA-256, as chunked uploads are. Raises Overloaded if admission
+    control turns the upload away; small files read locally are never queued.
+    """
+    reply = None
+    if use_local(filename):
+        # Small files are read here in milliseconds, so they don't queue behind uploads that need OCR
+        with admitted(client, file_size) if file_size >= LOCAL_QUEUE_BYTES else nullcontext():
+            with metrics.timings.stage('extract'):
+                reply = extract_local(filename, stream)
+    if reply is not None:
+        with metrics.timings.stage('parse'):
+            result, status = reply_result(filename, reply)
+    else:
+        with admitted(client, file_size):
+            result, status = _process_admitted_upload(filename, stream, file_size, content_type, client, path,
+                                                      digest)
+    if status == 200:
+        store_result(digest, filename, file_size, content_type, result)
+    return result, status
+
+def _process_admitted_upload(filename, stream, file_size, content_type, client, path, digest):
+    metrics.bytes_uploaded.inc(file_size)
+    if use_direct(filename):
+        _, executor = get_direct_pipeline()
+        timer = metrics.timings.current()
+        with metrics.timings.stage('extract'):
+            if path is not None:
+                reply = executor.submit(extract_direct, filename, path, digest, timer, client).result()
+            else:
+                reply = executor.submit(extract_direct_upload, filename, stream, timer, client).result()
+        with metrics.timings.stage('parse'):
+            return reply_result(filename, reply)
+    if PROCESSING_MODE == 'direct' and not DIRECT_WEBHOOK_FALLBACK:
+        return {'error': 'Only PDFs and images can be processed directly'}, 400
+
+    try:
+        data = {
+            'filename': filename,
+            'content_type': content_type,
+            'file_size': file_size
+        }
+        if digest:
+            # Lets the workflow recognise a document it has seen before
+            data['sha256'] = digest
+        body = MultipartBody(data, 'file', filename, stream, file_size, content_type)
+        with metrics.timings.stage('webhook'):
+            response = webhook.post(body, headers={'Content-Type': body.content_type, ADMISSION_CLIENT_HEADER: client})
+        with metrics.timings.stage('parse'):
+            return webhook_result(filename, response.status_code, response.text)
+
+    except requests.RequestException as e:
+        return {'error': f'Failed to connect to n8n: {str(e)}'}, 500
 
 # Routes
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return render_template_string(HTML_TEMPLATE, chunk_size=CHUNK_SIZE)
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -81,57 +604,165 @@ def upload_file():
             return jsonify({'error': f'File type not allowed. Supported types: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
             
         filename = secure_filename(file.filename)
-        temp_path = os.path.join('uploads', filename)
-        os.makedirs('uploads', exist_ok=True)
-        file.save(temp_path)
-        
-        try:
-            with open(temp_path, 'rb') as f:
-                files = {'file': (filename, f, file.content_type)}
-                data = {
-                    'filename': filename,
-                    'content_type': file.content_type,
-                    'file_size': os.path.getsize(temp_path)
-                }
-                response = requests.post(WEBHOOK_URL, files=files, data=data, timeout=30)
-                
-            os.remove(temp_path)
-            
-            if response.status_code != 200:
-                return jsonify({'error': f'n8n webhook returned status {response.status_code}: {response.text}'}), 500
-                
-            # Get raw response
-            try:
-                response_data = response.json()
-                # If JSON, convert to string for parsing
-                raw_text = json.dumps(response_data, ensure_ascii=False)
-            except:
-                raw_text = response.text
-                
-            # Parse the raw response for resume data
-            parsed_data = parse_resume_data(raw_text)
-            
-            return jsonify({
-                'success': True,
-                'message': 'File processed successfully',
-                'filename': filename,
-                'response': parsed_data or {'raw_text': raw_text},
-                'raw_response': raw_text
-            })
-            
-        except requests.RequestException as e:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            return jsonify({'error': f'Failed to connect to n8n: {str(e)}'}), 500
-            
+
+        # The upload was already spooled (sized and hashed) while the request was parsed
+        stream = file.stream
+        digest = None
+        if isinstance(stream, UploadBuffer):
+            file_size = stream.size
+            digest = stream.sha256()
+        else:
+            file_size = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+
+        result, status = process_upload(filename, stream, file_size, file.content_type or 'application/octet-stream',
+                                        upload_client(), digest=digest)
+        if status == 200:
+            result = upload_response(result, digest, request.values)
+        return jsonify(result), status
+
+    except Overloaded as e:
+        return retry_later(e)
     except Exception as e:
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            os.remove(temp_path)
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+def new_upload_session(payload, client):
+    """Validate a chunked upload request and open its session, returning (body, status)"""
+    filename = secure_filename(str(payload.get('filename') or ''))
+    if not filename:
+        return {'error': 'No file selected'}, 400
+    if not allowed_file(filename):
+        return {'error': f'File type not allowed. Supported types: {", ".join(ALLOWED_EXTENSIONS)}'}, 400
+    try:
+        size = int(payload.get('size'))
+    except (TypeError, ValueError):
+        return {'error': 'size must be the file size in bytes'}, 400
+    if size <= 0:
+        return {'error': 'File is empty'}, 400
+    if size > CHUNKED_MAX_FILE_SIZE:
+        return {'error': f'File is larger than the {format_file_size(CHUNKED_MAX_FILE_SIZE)} limit'}, 413
+    try:
+        session = upload_sessions.create(filename, size, CHUNK_SIZE, client)
+    except UploadLimit as e:
+        return {'error': str(e)}, 429
+    return dict(session.to_dict(), upload_url=f'/api/uploads/{session.id}'), 201
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    try:
+        result, status = new_upload_session(request.get_json(silent=True) or {}, upload_client())
+        return jsonify(result), status
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found or expired'}), 404
+    return jsonify(session.to_dict())
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_upload_chunk(upload_id, index):
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found or expired'}), 404
+    with metrics.timings.stage('upload'):
+        data = request.get_data(cache=False)
+    try:
+        session.write_chunk(index, data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'chunk': index, 'chunks_received': len(session.received), 'chunks': session.chunk_count})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found or expired'}), 404
+    try:
+        digest = session.finalize()
+    except IncompleteUpload as e:
+        return jsonify({'error': str(e), 'missing': e.missing}), 409
+    except UploadFinalized as e:
+        return jsonify({'error': str(e)}), 409
+    succeeded = False
+    try:
+        expected = (request.get_json(silent=True) or {}).get('sha256')
+        if expected and expected.lower() != digest:
+            return jsonify({'error': 'Assembled file does not match the given sha256', 'sha256': digest}), 422
+        content_type = mimetypes.guess_type(session.filename)[0] or 'application/octet-stream'
+        result, status = process_upload(session.filename, session.open(), session.size, content_type,
+                                        upload_client(), session.path, digest)
+        if status == 200:
+            succeeded = True
+            result = upload_response(dict(result, sha256=digest), digest, request.args)
+        return jsonify(result), status
+    except Overloaded as e:
+        return retry_later(e)
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+    finally:
+        if succeeded:
+            upload_sessions.remove(upload_id)
+        else:
+            # Keep the assembled file so the client only has to call /complete again
+            session.reopen()
+
+def search_documents(values):
+    """Run an /api/search query from request values, returning (body, status)"""
+    if document_store is None:
+        return {'error': 'Document store is disabled'}, 404
+    query = (values.get('q') or '').strip()
+    if not query:
+        return {'error': 'Missing search query q'}, 400
+    try:
+        limit = min(100, max(1, int(values.get('limit') or 20)))
+        offset = max(0, int(values.get('offset') or 0))
+    except ValueError:
+        return {'error': 'limit and offset must be numbers'}, 400
+    started = time.perf_counter()
+    result = document_store.search(query, limit, offset)
+    took_ms = round((time.perf_counter() - started) * 1000, 1)
+    return dict(result, query=query, limit=limit, offset=offset, took_ms=took_ms), 200
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    try:
+        result, status = search_documents(request.args)
+        return jsonify(result), status
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/documents/<sha256>', methods=['GET'])
+def get_document(sha256):
+    result, status = get_stored_document(sha256.lower(), request.args)
+    return jsonify(result), status
+
+@app.route('/api/documents/<sha256>/pages', methods=['GET'])
+def get_document_pages(sha256):
+    result, status = document_pages(sha256.lower(), request.args)
+    return jsonify(result), status
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'message': 'File upload API is running'})
+    return jsonify({'status': 'healthy', 'message': 'File upload API is running', 'processing_mode': PROCESSING_MODE,
+                    'webhook_pool': webhook.stats(), 'admission': admission.stats() if admission else None,
+                    'document_store': document_store.stats() if document_store else None})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(render_metrics(metrics), mimetype=METRICS_CONTENT_TYPE)
+
+@app.before_request
+def start_request_timer():
+    metrics.timings.begin()
+
+@app.after_request
+def add_server_timing(response):
+    with metrics.timings.stage('compress'):
+        response = compress_response(response, request.accept_encodings)
+    return metrics.finish_request(response, request.url_rule.rule if request.url_rule else None)
 
 # HTML template (same as provided, with updated JavaScript)
 HTML_TEMPLATE = """
@@ -527,6 +1158,10 @@ HTML_TEMPLATE = """
             transition: width 0.3s ease;
             animation: progress-animation 2s ease-in-out infinite;
         }
+        .progress-fill.determinate {
+            width: 0;
+            animation: none;
+        }
         @keyframes progress-animation {
             0%, 100% { width: 30%; }
             50% { width: 80%; }
@@ -545,7 +1180,7 @@ HTML_TEMPLATE = """
                     <div class="upload-area" id="uploadArea">
                         <i class="fas fa-cloud-upload-alt upload-icon"></i>
                         <div class="upload-text">Drop your file here or click to browse</div>
-                        <div class="upload-subtext">Supports documents, images, and text files up to 16MB</div>
+                        <div class="upload-subtext">Supports documents, images, and text files; large files are sent in resumable chunks</div>
                         <div class="file-input-wrapper">
                             <input type="file" id="fileInput" name="file" class="file-input" required>
                             <button type="button" class="file-input-button">
@@ -695,7 +1330,7 @@ HTML_TEMPLATE = """
             const documentInfo = document.getElementById('documentInfo');
             const extractedText = document.getElementById('extractedText');
             const rawResponse = document.getElementById('rawResponse');
-            extractedContent = data.raw_response || '';
+            extractedContent = '';
             let infoHTML = `
                 <div class="info-item">
                     <div class="info-label">File Name</div>
@@ -745,16 +1380,68 @@ HTML_TEMPLATE = """
                 }
             }
             documentInfo.innerHTML = infoHTML;
-            extractedText.textContent = extractedContent || 'No text content extracted';
-            extractedText.innerHTML = marked.parse(extractedContent || 'No text content extracted');
-            rawResponse.textContent = extractedContent || 'No response received';
+            pageObserver.disconnect();
+            pagedText = null;
+            if (data.text_url) {
+                // Long documents come a few pages at a time, as they are scrolled into view
+                extractedText.innerHTML = '';
+                const sentinel = document.createElement('div');
+                extractedText.appendChild(sentinel);
+                pagedText = { url: data.text_url, documentUrl: `/api/documents/${data.sha256}`, next: 1, sentinel };
+                pageObserver.observe(sentinel);
+            } else {
+                extractedContent = (data.response && data.response.raw_text) || '';
+                extractedText.innerHTML = marked.parse(extractedContent || 'No text content extracted');
+            }
+            rawResponse.textContent = data.raw_response || 'No response received';
             resultsSection.classList.add('show');
             window.scrollTo({
                 top: resultsSection.offsetTop,
                 behavior: 'smooth'
             });
         }
-        function copyToClipboard() {
+        const TEXT_PAGES_PER_FETCH = 5;
+        let pagedText = null;
+        const pageObserver = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) loadTextPages();
+        }, { root: document.getElementById('extractedText'), rootMargin: '400px' });
+        async function loadTextPages() {
+            const paged = pagedText;
+            if (!paged || paged.loading || !paged.next) return;
+            paged.loading = true;
+            try {
+                const response = await fetch(`${paged.url}?start=${paged.next}&count=${TEXT_PAGES_PER_FETCH}`);
+                const data = await response.json();
+                if (!response.ok) throw new Error(data.error);
+                if (paged !== pagedText) return;
+                for (const item of data.items) {
+                    const page = document.createElement('div');
+                    page.innerHTML = marked.parse(item.text || '');
+                    paged.sentinel.before(page);
+                }
+                paged.next = data.next;
+            } catch (error) {
+                showError(`Could not load the text: ${error.message}`);
+                paged.next = null;
+            } finally {
+                paged.loading = false;
+            }
+            if (paged !== pagedText) return;
+            pageObserver.unobserve(paged.sentinel);
+            // Observing again reports at once whether more pages are still in view
+            if (paged.next) pageObserver.observe(paged.sentinel);
+        }
+        // Copy and download need the whole text, which paged results only fetch then
+        async function fullText() {
+            if (!extractedContent && pagedText) {
+                const response = await fetch(`${pagedText.documentUrl}?fields=text`);
+                const data = await response.json();
+                extractedContent = response.ok ? data.text || '' : '';
+            }
+            return extractedContent;
+        }
+        async function copyToClipboard() {
+            await fullText();
             if (!extractedContent) {
                 showError('No text to copy');
                 return;
@@ -771,7 +1458,8 @@ HTML_TEMPLATE = """
             }
             document.body.removeChild(textarea);
         }
-        function downloadText() {
+        async function downloadText() {
+            await fullText();
             if (!extractedContent) {
                 showError('No text to download');
                 return;
@@ -793,12 +1481,88 @@ HTML_TEMPLATE = """
             document.getElementById('resultsSection').classList.remove('show');
             document.getElementById('errorDiv').classList.remove('show');
             extractedContent = '';
+            pagedText = null;
+            pageObserver.disconnect();
             currentFileName = '';
             window.scrollTo({ top: 0, behavior: 'smooth' });
         }
         document.querySelector('.file-input-button').addEventListener('click', () => {
             fileInput.click();
         });
+        // Files larger than one chunk go through /api/uploads: a few chunks in
+        // flight at once, each retried on its own when the connection drops
+        const CHUNK_SIZE = {{ chunk_size }};
+        const CHUNK_WORKERS = 4;
+        const CHUNK_RETRIES = 5;
+        const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+        // Leave the text out of the result when it can be read page by page, and skip what isn't shown
+        const RESULT_OPTIONS = '?text=pages&fields=filename,sha256,text_url,response,raw_response';
+        // A busy server answers 429 with how long to wait before trying again
+        async function fetchWhenAdmitted(url, options, attempts = 3) {
+            for (let attempt = 0; ; attempt++) {
+                const response = await fetch(url, options);
+                if (response.status !== 429 || attempt >= attempts) return response;
+                const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 5;
+                await sleep(retryAfter * 1000 * (1 + Math.random() * 0.2));
+            }
+        }
+        async function putChunk(session, file, index) {
+            const start = index * session.chunk_size;
+            const blob = file.slice(start, Math.min(start + session.chunk_size, file.size));
+            for (let attempt = 0; ; attempt++) {
+                let response = null;
+                try {
+                    response = await fetch(`${session.upload_url}/chunks/${index}`, { method: 'PUT', body: blob });
+                    if (response.ok) return;
+                } catch (error) {
+                    if (attempt >= CHUNK_RETRIES) throw error;
+                }
+                if (response) {
+                    // Client errors other than throttling won't go away on a retry
+                    const retryable = response.status >= 500 || response.status === 429;
+                    if (!retryable || attempt >= CHUNK_RETRIES) {
+                        const data = await response.json().catch(() => ({}));
+                        throw new Error(data.error || `Chunk ${index} failed with status ${response.status}`);
+                    }
+                }
+                await sleep(Math.min(30000, 500 * 2 ** attempt) * (0.5 + Math.random()));
+            }
+        }
+        async function putChunks(session, file, indexes, onChunk) {
+            const queue = indexes.slice();
+            const worker = async () => {
+                while (queue.length) {
+                    await putChunk(session, file, queue.shift());
+                    onChunk();
+                }
+            };
+            await Promise.all(Array.from({ length: Math.min(CHUNK_WORKERS, queue.length) }, worker));
+        }
+        async function uploadChunked(file, progressFill) {
+            const created = await fetch('/api/uploads', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ filename: file.name, size: file.size })
+            });
+            const session = await created.json();
+            if (!created.ok) return { response: created, data: session };
+            let done = 0;
+            const onChunk = () => {
+                done++;
+                progressFill.style.width = `${Math.round(100 * done / session.chunks)}%`;
+            };
+            await putChunks(session, file, session.missing, onChunk);
+            let response = await fetchWhenAdmitted(`${session.upload_url}/complete${RESULT_OPTIONS}`, { method: 'POST' });
+            if (response.status === 409) {
+                // Some chunks never made it; send those again and finish once more
+                const data = await response.json();
+                // Without missing chunks, another request is already completing the upload
+                if (!data.missing) return { response, data };
+                await putChunks(session, file, data.missing, onChunk);
+                response = await fetchWhenAdmitted(`${session.upload_url}/complete${RESULT_OPTIONS}`, { method: 'POST' });
+            }
+            return { response, data: await response.json() };
+        }
         document.getElementById('uploadForm').addEventListener('submit', async function(e) {
             e.preventDefault();
             const fileInput = document.getElementById('fileInput');
@@ -819,12 +1583,21 @@ HTML_TEMPLATE = """
             progressBar.classList.add('show');
             errorDiv.classList.remove('show');
             resultsSection.classList.remove('show');
+            const progressFill = progressBar.querySelector('.progress-fill');
+            const chunked = fileInput.files[0].size > CHUNK_SIZE;
+            progressFill.classList.toggle('determinate', chunked);
+            progressFill.style.width = '';
             try {
-                const response = await fetch('/api/upload', {
-                    method: 'POST',
-                    body: formData
-                });
-                const data = await response.json();
+                let response, data;
+                if (chunked) {
+                    ({ response, data } = await uploadChunked(fileInput.files[0], progressFill));
+                } else {
+                    response = await fetchWhenAdmitted(`/api/upload${RESULT_OPTIONS}`, {
+                        method: 'POST',
+                        body: formData
+                    });
+                    data = await response.json();
+                }
                 if (response.ok) {
                     displayResults(data);
                 } else {
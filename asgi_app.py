@@ -0,0 +1,293 @@
+from quart import Quart, Request, Response, request, jsonify, render_template_string
+from quart.formparser import FormDataParser
+from quart.wrappers.response import DataBody
+from werkzeug.utils import secure_filename
+import httpx
+import os
+import asyncio
+import mimetypes
+from contextlib import asynccontextmanager, nullcontext
+
+from app import (
+    HTML_TEMPLATE, ALLOWED_EXTENSIONS, MAX_FILE_SIZE, WEBHOOK_URL, WEBHOOK_POOL_SIZE,
+    WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT, WEBHOOK_RETRIES, WEBHOOK_BACKOFF,
+    WEBHOOK_BACKOFF_MAX, PROCESSING_MODE, DIRECT_WEBHOOK_FALLBACK, UploadBuffer, MultipartBody, UploadMetrics,
+    CHUNK_SIZE, ADMISSION_CLIENT_HEADER, admission, allowed_file, webhook_result, get_direct_pipeline, use_direct,
+    extract_direct, extract_direct_upload, render_metrics, upload_sessions, new_upload_session, upload_cost,
+    COMPRESS_MIN_BYTES, document_store, store_result, search_documents, upload_response, get_stored_document,
+    document_pages, compressible, compress_body, reply_result, use_local, extract_local, LOCAL_QUEUE_BYTES
+)
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from webhook_client import AsyncWebhookClient
+from upload_sessions import IncompleteUpload, UploadFinalized
+from admission import Overloaded
+
+# ASGI version of app.py: same routes and responses, but /api/upload awaits
+# the n8n webhook instead of holding a worker thread while it waits.
+# Run with e.g. `hypercorn asgi_app:app --bind 0.0.0.0:5000`.
+
+class UploadRequest(Request):
+    # Spool and size uploads the same way the Flask app does
+    def make_form_data_parser(self):
+        return FormDataParser(
+            max_content_length=self.max_content_length,
+            max_form_memory_size=self.max_form_memory_size,
+            max_form_parts=self.max_form_parts,
+            cls=self.parameter_storage_class,
+            stream_factory=lambda *args, **kwargs: UploadBuffer(),
+        )
+
+    async def _load_form_data(self):
+        with metrics.timings.stage('upload'):
+            await super()._load_form_data()
+
+app = Quart(__name__)
+app.request_class = UploadRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+
+webhook = None
+metrics = UploadMetrics(lambda: webhook.stats())
+
+@app.before_serving
+async def open_webhook_client():
+    global webhook
+    webhook = AsyncWebhookClient(WEBHOOK_URL, WEBHOOK_POOL_SIZE, WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT,
+                                 WEBHOOK_RETRIES, WEBHOOK_BACKOFF, WEBHOOK_BACKOFF_MAX)
+
+@app.after_serving
+async def close_webhook_client():
+    await webhook.aclose()
+
+@app.route('/')
+async def index():
+    return await render_template_string(HTML_TEMPLATE, chunk_size=CHUNK_SIZE)
+
+def upload_client():
+    return request.headers.get(ADMISSION_CLIENT_HEADER) or request.remote_addr or 'unknown'
+
+def retry_later(e):
+    return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+
+@asynccontextmanager
+async def admitted(client, file_size):
+    """Async counterpart of app.admitted"""
+    if admission is None:
+        yield
+        return
+    ticket = admission.enter(client, upload_cost(file_size))
+    try:
+        # Waiting uploads hold no thread, only their place in the queue
+        with metrics.timings.stage('admission'):
+            await ticket.wait_async()
+        yield
+    finally:
+        admission.leave(ticket)
+
+async def process_upload(filename, stream, file_size, content_type, client, path=None, digest=None):
+    """Async counterpart of app.process_upload, returning (body, status)"""
+    reply = None
+    if use_local(filename):
+        async with admitted(client, file_size) if file_size >= LOCAL_QUEUE_BYTES else nullcontext():
+            with metrics.timings.stage('extract'):
+                reply = await asyncio.to_thread(extract_local, filename, stream)
+    if reply is not None:
+        with metrics.timings.stage('parse'):
+            result, status = reply_result(filename, reply)
+    else:
+        async with admitted(client, file_size):
+            result, status = await _process_admitted_upload(filename, stream, file_size, content_type, client,
+                                                            path, digest)
+    if status == 200:
+        store_result(digest, filename, file_size, content_type, result)
+    return result, status
+
+async def _process_admitted_upload(filename, stream, file_size, content_type, client, path, digest):
+    metrics.bytes_uploaded.inc(file_size)
+    if use_direct(filename):
+        _, executor = get_direct_pipeline()
+        loop = asyncio.get_running_loop()
+        timer = metrics.timings.current()
+        with metrics.timings.stage('extract'):
+            if path is not None:
+                reply = await loop.run_in_executor(
+                    executor, extract_direct, filename, path, digest, timer, client)
+            else:
+                reply = await loop.run_in_executor(
+                    executor, extract_direct_upload, filename, stream, timer, client)
+        with metrics.timings.stage('parse'):
+            return reply_result(filename, reply)
+    if PROCESSING_MODE == 'direct' and not DIRECT_WEBHOOK_FALLBACK:
+        return {'error': 'Only PDFs and images can be processed directly'}, 400
+
+    try:
+        data = {
+            'filename': filename,
+            'content_type': content_type,
+            'file_size': file_size
+        }
+        if digest:
+            data['sha256'] = digest
+        body = MultipartBody(data, 'file', filename, stream, file_size, content_type)
+        with metrics.timings.stage('webhook'):
+            response = await webhook.post(body, headers={'Content-Type': body.content_type,
+                                                         ADMISSION_CLIENT_HEADER: client})
+        with metrics.timings.stage('parse'):
+            return webhook_result(filename, response.status_code, response.text)
+
+    except httpx.HTTPError as e:
+        return {'error': f'Failed to connect to n8n: {str(e)}'}, 500
+
+@app.route('/api/upload', methods=['POST'])
+async def upload_file():
+    try:
+        files = await request.files
+        if 'file' not in files:
+            return jsonify({'error': 'No file provided'}), 400
+
+        file = files['file']
+
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+
+        if not allowed_file(file.filename):
+            return jsonify({'error': f'File type not allowed. Supported types: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
+
+        filename = secure_filename(file.filename)
+
+        stream = file.stream
+        digest = None
+        if isinstance(stream, UploadBuffer):
+            file_size = stream.size
+            digest = stream.sha256()
+        else:
+            file_size = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+
+        result, status = await process_upload(filename, stream, file_size,
+                                              file.content_type or 'application/octet-stream', upload_client(),
+                                              digest=digest)
+        if status == 200:
+            result = upload_response(result, digest, await request.values)
+        return jsonify(result), status
+
+    except Overloaded as e:
+        return retry_later(e)
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/uploads', methods=['POST'])
+async def create_upload():
+    try:
+        result, status = new_upload_session(await request.get_json(silent=True) or {}, upload_client())
+        return jsonify(result), status
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+async def get_upload(upload_id):
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found or expired'}), 404
+    return jsonify(session.to_dict())
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+async def put_upload_chunk(upload_id, index):
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found or expired'}), 404
+    with metrics.timings.stage('upload'):
+        data = await request.get_data(cache=False)
+    try:
+        # Writing and hashing a chunk is blocking file work
+        await asyncio.to_thread(session.write_chunk, index, data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'chunk': index, 'chunks_received': len(session.received), 'chunks': session.chunk_count})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+async def complete_upload(upload_id):
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found or expired'}), 404
+    try:
+        digest = session.finalize()
+    except IncompleteUpload as e:
+        return jsonify({'error': str(e), 'missing': e.missing}), 409
+    except UploadFinalized as e:
+        return jsonify({'error': str(e)}), 409
+    succeeded = False
+    try:
+        expected = (await request.get_json(silent=True) or {}).get('sha256')
+        if expected and expected.lower() != digest:
+            return jsonify({'error': 'Assembled file does not match the given sha256', 'sha256': digest}), 422
+        content_type = mimetypes.guess_type(session.filename)[0] or 'application/octet-stream'
+        result, status = await process_upload(session.filename, session.open(), session.size, content_type,
+                                              upload_client(), session.path, digest)
+        if status == 200:
+            succeeded = True
+            result = upload_response(dict(result, sha256=digest), digest, request.args)
+        return jsonify(result), status
+    except Overloaded as e:
+        return retry_later(e)
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+    finally:
+        if succeeded:
+            upload_sessions.remove(upload_id)
+        else:
+            session.reopen()
+
+@app.route('/api/search', methods=['GET'])
+async def search():
+    try:
+        # SQLite queries block, so they run off the event loop
+        result, status = await asyncio.to_thread(search_documents, request.args)
+        return jsonify(result), status
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/documents/<sha256>', methods=['GET'])
+async def get_document(sha256):
+    result, status = await asyncio.to_thread(get_stored_document, sha256.lower(), request.args)
+    return jsonify(result), status
+
+@app.route('/api/documents/<sha256>/pages', methods=['GET'])
+async def get_document_pages(sha256):
+    result, status = await asyncio.to_thread(document_pages, sha256.lower(), request.args)
+    return jsonify(result), status
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    return jsonify({'status': 'healthy', 'message': 'File upload API is running', 'processing_mode': PROCESSING_MODE,
+                    'webhook_pool': webhook.stats(), 'admission': admission.stats() if admission else None,
+                    'document_store': document_store.stats() if document_store else None})
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_endpoint():
+    return Response(render_metrics(metrics), mimetype=METRICS_CONTENT_TYPE)
+
+@app.before_request
+async def start_request_timer():
+    metrics.timings.begin()
+
+async def compress_response(response, accept_encodings):
+    """Compress a buffered response for the client if it is large enough to be worth it"""
+    if not isinstance(response.response, DataBody) or not compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = await response.get_data()
+    if len(data) >= COMPRESS_MIN_BYTES:
+        data, encoding = compress_body(data, accept_encodings)
+        if encoding is not None:
+            response.set_data(data)
+            response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.after_request
+async def add_server_timing(response):
+    with metrics.timings.stage('compress'):
+        response = await compress_response(response, request.accept_encodings)
+    return metrics.finish_request(response, request.url_rule.rule if request.url_rule else None)
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000, debug=True)
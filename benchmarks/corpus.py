@@ -0,0 +1,156 @@
+"""Synthetic PDF corpus for benchmarking.
+
+Generates three kinds of documents, each with a ``<name>.txt`` ground
+truth next to it and an entry in ``manifest.json``:
+
+- text PDFs with a real text layer
+- scanned PDFs, where each page is an image rendered at a given DPI
+- mixed PDFs alternating text and scanned pages
+
+Only Pillow and the standard library are needed.
+"""
+import os
+import json
+import zlib
+import random
+import argparse
+from PIL import Image, ImageDraw, ImageFont
+
+PAGE_WIDTH_PT = 612
+PAGE_HEIGHT_PT = 792
+MARGIN_PT = 72
+FONT_SIZE_PT = 11
+LINE_HEIGHT_PT = 15
+
+WORDS = (
+    'experience engineer project team data python analysis management design '
+    'system customer development report software cloud service quality process '
+    'university degree skills leadership research contract agreement payment '
+    'invoice delivery schedule review policy security network training support'
+).split()
+
+
+def make_page_lines(rng, lines=40, words_per_line=9):
+    return [' '.join(rng.choice(WORDS) for _ in range(words_per_line)).capitalize() for _ in range(lines)]
+
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def render_page_image(lines, dpi, noise=0.0, rng=None):
+    """Rasterize page text the way a scanner would, as an 8-bit grayscale image"""
+    scale = dpi / 72
+    image = Image.new('L', (int(PAGE_WIDTH_PT * scale), int(PAGE_HEIGHT_PT * scale)), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=max(6, int(FONT_SIZE_PT * scale)))
+    y = MARGIN_PT * scale
+    for line in lines:
+        draw.text((MARGIN_PT * scale, y), line, font=font, fill=0)
+        y += LINE_HEIGHT_PT * scale
+    if noise and rng is not None:
+        pixels = image.load()
+        for _ in range(int(image.width * image.height * noise)):
+            pixels[rng.randrange(image.width), rng.randrange(image.height)] = rng.choice((0, 255))
+    return image
+
+
+def write_pdf(path, pages):
+    """Write a PDF whose pages are ('text', lines) or ('image', PIL image) tuples"""
+    objects = []
+
+    def add(data):
+        objects.append(data)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    page_ids = []
+    for kind, content in pages:
+        resources = f'/Font << /F1 {font} 0 R >>'
+        if kind == 'text':
+            ops = ['BT', f'/F1 {FONT_SIZE_PT} Tf', f'{LINE_HEIGHT_PT} TL',
+                   f'{MARGIN_PT} {PAGE_HEIGHT_PT - MARGIN_PT} Td']
+            ops += [f'({_pdf_escape(line)}) Tj T*' for line in content]
+            ops.append('ET')
+            stream = '\n'.join(ops).encode('latin-1')
+        else:
+            image = content.convert('L')
+            data = zlib.compress(image.tobytes())
+            xobject = add(
+                f'<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} '
+                f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>\n'
+                .encode('ascii') + b'stream\n' + data + b'\nendstream'
+            )
+            resources += f' /XObject << /Im1 {xobject} 0 R >>'
+            stream = f'q {PAGE_WIDTH_PT} 0 0 {PAGE_HEIGHT_PT} 0 0 cm /Im1 Do Q'.encode('ascii')
+        contents = add(f'<< /Length {len(stream)} >>\n'.encode('ascii') + b'stream\n' + stream + b'\nendstream')
+        page_ids.append(add(
+            f'<< /Type /Page /Parent {pages_obj} 0 R /MediaBox [0 0 {PAGE_WIDTH_PT} {PAGE_HEIGHT_PT}] '
+            f'/Resources << {resources} >> /Contents {contents} 0 R >>'.encode('ascii')
+        ))
+
+    objects[catalog - 1] = f'<< /Type /Catalog /Pages {pages_obj} 0 R >>'.encode('ascii')
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    objects[pages_obj - 1] = f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode('ascii')
+
+    out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, data in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n'.encode('ascii') + data + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('ascii')
+    out += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode('ascii')
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode('ascii')
+
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def generate_corpus(out_dir, documents=3, pages=4, scan_dpis=(150, 200, 300), noise=0.0, seed=42):
+    """Generate the corpus into out_dir and return its manifest"""
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = []
+
+    def emit(name, kind, page_specs, dpi=None):
+        path = os.path.join(out_dir, f'{name}.pdf')
+        write_pdf(path, [spec for spec, _ in page_specs])
+        with open(os.path.join(out_dir, f'{name}.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join('\n'.join(lines) for _, lines in page_specs))
+        manifest.append({'file': f'{name}.pdf', 'kind': kind, 'pages': len(page_specs), 'dpi': dpi,
+                         'bytes': os.path.getsize(path)})
+
+    for i in range(documents):
+        page_lines = [make_page_lines(rng) for _ in range(pages)]
+        emit(f'text-{i}', 'text', [(('text', lines), lines) for lines in page_lines])
+
+        for dpi in scan_dpis:
+            page_lines = [make_page_lines(rng) for _ in range(pages)]
+            emit(f'scan-{dpi}dpi-{i}', 'scanned',
+                 [(('image', render_page_image(lines, dpi, noise, rng)), lines) for lines in page_lines], dpi)
+
+        page_lines = [make_page_lines(rng) for _ in range(pages)]
+        emit(f'mixed-{i}', 'mixed',
+             [((('text', lines) if n % 2 == 0 else ('image', render_page_image(lines, scan_dpis[0], noise, rng))),
+               lines) for n, lines in enumerate(page_lines)], scan_dpis[0])
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic PDF benchmark corpus')
+    parser.add_argument('out_dir')
+    parser.add_argument('--documents', type=int, default=3, help='documents of each kind')
+    parser.add_argument('--pages', type=int, default=4, help='pages per document')
+    parser.add_argument('--scan-dpi', type=int, nargs='+', default=[150, 200, 300])
+    parser.add_argument('--noise', type=float, default=0.0, help='fraction of scanned pixels flipped to simulate noise')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    manifest = generate_corpus(args.out_dir, args.documents, args.pages, tuple(args.scan_dpi), args.noise, args.seed)
+    print(f"Wrote {len(manifest)} documents to {args.out_dir}")
@@ -0,0 +1,313 @@
+"""Reproducible throughput/latency benchmark for pdf_ocr.py and app.py.
+
+Generates (or reuses) a synthetic corpus, starts a stub n8n webhook and
+both services as subprocesses, drives them at a fixed concurrency and
+prints a JSON report that can be compared across commits:
+
+    python -m benchmarks.run --concurrency 4 --requests 40 --output bench.json
+
+Peak RSS and CPU utilisation cover each service's whole process tree
+(OCR workers and tesseract subprocesses included). They use psutil when
+installed and /proc otherwise.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.stub_webhook import LatencyModel, start_stub_webhook
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _proc_tree_usage(pid):
+    """Return (rss_bytes, cpu_seconds) summed over a process and its descendants"""
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return 0, 0.0
+        rss = cpu = 0
+        for proc in procs:
+            try:
+                rss += proc.memory_info().rss
+                times = proc.cpu_times()
+                cpu += times.user + times.system + times.children_user + times.children_system
+            except psutil.NoSuchProcess:
+                pass
+        return rss, cpu
+
+    if not os.path.isdir('/proc'):
+        return None, None
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                parents.setdefault(int(fields[1]), []).append(int(entry))
+            except OSError:
+                pass
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    ticks = os.sysconf('SC_CLK_TCK')
+    rss = cpu = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(parents.get(current, []))
+        try:
+            with open(f'/proc/{current}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{current}/statm') as f:
+                rss += int(f.read().split()[1]) * page_size
+        except OSError:
+            continue
+        # utime, stime, cutime, cstime
+        cpu += sum(int(value) for value in fields[11:15]) / ticks
+    return rss, cpu
+
+
+class ResourceSampler:
+    """Samples a process tree's RSS and CPU time on a background thread"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        _, self._cpu_start = _proc_tree_usage(self.pid)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        _, cpu_end = _proc_tree_usage(self.pid)
+        self.wall = time.perf_counter() - self._started
+        self.cpu_seconds = None if cpu_end is None else cpu_end - self._cpu_start
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss, _ = _proc_tree_usage(self.pid)
+            if rss:
+                self.peak_rss = max(self.peak_rss, rss)
+            self._stop.wait(self.interval)
+
+    def report(self):
+        cores = os.cpu_count() or 1
+        return {
+            'peak_rss_mb': round(self.peak_rss / (1024 * 1024), 1) if self.peak_rss else None,
+            'cpu_seconds': round(self.cpu_seconds, 3) if self.cpu_seconds is not None else None,
+            'cpu_utilization': round(self.cpu_seconds / (self.wall * cores), 4)
+            if self.cpu_seconds is not None and self.wall else None,
+        }
+
+
+def start_service(module, port, env, log_path):
+    """Start a Flask service module with `flask run` and wait until it answers"""
+    log = open(log_path, 'wb')
+    # Every driver thread connects from 127.0.0.1, so per-client admission would
+    # turn the offered concurrency into 429s; it is off unless `env` turns it on
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'flask', '--app', module, 'run', '--port', str(port),
+         '--no-reload', '--no-debugger', '--with-threads'],
+        cwd=REPO_ROOT, env=dict(os.environ, **dict({'ADMISSION_MAX_ACTIVE': '0'}, **env)), stdout=log,
+        stderr=subprocess.STDOUT
+    )
+    health = {'pdf_ocr': '/health', 'app': '/api/health'}[module]
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{module} exited during startup, see {log_path}")
+        try:
+            if requests.get(f'http://127.0.0.1:{port}{health}', timeout=1).ok:
+                return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{module} did not become healthy, see {log_path}")
+
+
+def drive(url, field, documents, corpus_dir, concurrency, total_requests):
+    """POST documents round-robin at a fixed concurrency, returning per-request samples"""
+    local = threading.local()
+    payloads = {}
+    for document in documents:
+        with open(os.path.join(corpus_dir, document['file']), 'rb') as f:
+            payloads[document['file']] = f.read()
+
+    def one(index):
+        document = documents[index % len(documents)]
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = local.session.post(url, files={field: (document['file'], payloads[document['file']],
+                                                              'application/pdf')}, timeout=600)
+            status = response.status_code
+        except requests.RequestException:
+            status = 'connection_error'
+        return {'latency': time.perf_counter() - started, 'status': status, 'pages': document['pages']}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(total_requests)))
+
+
+def summarize(samples, wall_seconds):
+    latencies = sorted(sample['latency'] * 1000 for sample in samples)
+    ok = [sample for sample in samples if sample['status'] == 200]
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+    return {
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'status_counts': statuses,
+        'wall_seconds': round(wall_seconds, 3),
+        'requests_per_sec': round(len(samples) / wall_seconds, 3),
+        'pages_per_sec': round(sum(sample['pages'] for sample in ok) / wall_seconds, 3),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 1),
+            'p95': round(percentile(latencies, 95), 1),
+            'p99': round(percentile(latencies, 99), 1),
+            'mean': round(sum(latencies) / len(latencies), 1),
+            'max': round(latencies[-1], 1),
+        },
+    }
+
+
+def benchmark_service(name, module, url_path, field, env, args, documents, corpus_dir, work_dir):
+    port = _free_port()
+    # Each run gets an empty document store, rather than adding to the shared one in the temp dir
+    env = dict({'DOCUMENT_STORE_PATH': os.path.join(work_dir, f'{name}-documents.db')}, **env)
+    process = start_service(module, port, env, os.path.join(work_dir, f'{name}.log'))
+    try:
+        url = f'http://127.0.0.1:{port}{url_path}'
+        if args.warmup:
+            drive(url, field, documents, corpus_dir, 1, args.warmup)
+        with ResourceSampler(process.pid) as sampler:
+            samples = drive(url, field, documents, corpus_dir, args.concurrency, args.requests)
+        result = summarize(samples, sampler.wall)
+        result.update(sampler.report())
+        return result
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pdf_ocr.py and app.py')
+    parser.add_argument('--target', choices=('ocr', 'upload', 'both'), default='both')
+    parser.add_argument('--corpus', help='existing corpus directory with manifest.json (generated if omitted)')
+    parser.add_argument('--kinds', nargs='+', default=['text', 'scanned', 'mixed'],
+                        help='document kinds from the corpus to send')
+    parser.add_argument('--documents', type=int, default=2, help='documents of each kind when generating')
+    parser.add_argument('--pages', type=int, default=4, help='pages per document when generating')
+    parser.add_argument('--scan-dpi', type=int, nargs='+', default=[150, 200, 300])
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--with-cache', action='store_true', help='leave the OCR result cache enabled')
+    parser.add_argument('--latency-dist', choices=('fixed', 'uniform', 'lognormal'), default='fixed')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='stub webhook latency')
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--sigma', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of stub webhook calls that fail')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='ocr-bench-') as work_dir:
+        corpus_dir = args.corpus or os.path.join(work_dir, 'corpus')
+        if args.corpus:
+            with open(os.path.join(corpus_dir, 'manifest.json'), encoding='utf-8') as f:
+                manifest = json.load(f)
+        else:
+            manifest = generate_corpus(corpus_dir, args.documents, args.pages, tuple(args.scan_dpi), seed=args.seed)
+        documents = [document for document in manifest if document['kind'] in args.kinds]
+
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'config': vars(args),
+            'corpus': {'documents': len(documents), 'pages': sum(document['pages'] for document in documents)},
+            'results': {},
+        }
+
+        if args.target in ('ocr', 'both'):
+            env = {'OCR_CACHE_DIR': os.path.join(work_dir, 'cache')}
+            if not args.with_cache:
+                env.update(OCR_CACHE_MEMORY_MB='0', OCR_CACHE_DISK_MB='0')
+            report['results']['ocr'] = benchmark_service('pdf_ocr', 'pdf_ocr', '/process-pdfs', 'file0', env,
+                                                         args, documents, corpus_dir, work_dir)
+
+        if args.target in ('upload', 'both'):
+            latency = LatencyModel(args.latency_dist, args.latency_ms, args.jitter_ms, args.sigma, args.seed)
+            stub = start_stub_webhook(latency=latency, error_rate=args.error_rate,
+                                      error_status=args.error_status, seed=args.seed)
+            try:
+                result = benchmark_service('app', 'app', '/api/upload', 'file', {'WEBHOOK_URL': stub.url},
+                                           args, documents, corpus_dir, work_dir)
+                result['stub_webhook'] = dict(stub.stats)
+                report['results']['upload'] = result
+            finally:
+                stub.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
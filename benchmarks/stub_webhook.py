@@ -0,0 +1,120 @@
+"""Local stand-in for the n8n webhook.
+
+Accepts the multipart POST that app.py sends to WEBHOOK_URL, waits for a
+sampled latency, and answers with an n8n-style JSON body, or with an
+error status at the configured rate.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SAMPLE_TEXT = ("Jane Doe\nSenior Data Engineer\njane.doe@example.com | +201001234567 | "
+               "linkedin.com/in/jane-doe\n\nExperience\nBuilt OCR pipelines and data platforms.")
+
+
+class LatencyModel:
+    """Samples response latencies in seconds.
+
+    `dist` is 'fixed' (always `latency_ms`), 'uniform' (`latency_ms` ±
+    `jitter_ms`) or 'lognormal' (median `latency_ms`, shape `sigma`).
+    """
+
+    def __init__(self, dist='fixed', latency_ms=50.0, jitter_ms=0.0, sigma=0.5, seed=None):
+        self.dist = dist
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.sigma = sigma
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            if self.dist == 'uniform':
+                ms = self._rng.uniform(self.latency_ms - self.jitter_ms, self.latency_ms + self.jitter_ms)
+            elif self.dist == 'lognormal':
+                ms = self.latency_ms * self._rng.lognormvariate(0, self.sigma)
+            else:
+                ms = self.latency_ms
+        return max(0.0, ms) / 1000
+
+
+class StubWebhookServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency, error_rate=0.0, error_status=503, seed=None):
+        super().__init__(address, StubWebhookHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'bytes_received': 0}
+
+    def next_outcome(self, size):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['bytes_received'] += size
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.stats['errors'] += 1
+        return failed
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/webhook/DOC-OCR'
+
+
+class StubWebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        remaining = length
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, 64 * 1024)))
+
+        time.sleep(self.server.latency.sample())
+        if self.server.next_outcome(length):
+            self._send(self.server.error_status, {'message': 'Stub webhook error'})
+        else:
+            self._send(200, [{'text': SAMPLE_TEXT, 'file_size': length}])
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_webhook(host='127.0.0.1', port=0, latency=None, error_rate=0.0, error_status=503, seed=None):
+    """Start the stub server on a background thread and return it"""
+    server = StubWebhookServer((host, port), latency or LatencyModel(), error_rate, error_status, seed)
+    threading.Thread(target=server.serve_forever, name='stub-webhook', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a stand-in for the n8n webhook')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5678)
+    parser.add_argument('--latency-dist', choices=('fixed', 'uniform', 'lognormal'), default='fixed')
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--sigma', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    args = parser.parse_args()
+
+    latency = LatencyModel(args.latency_dist, args.latency_ms, args.jitter_ms, args.sigma)
+    server = StubWebhookServer((args.host, args.port), latency, args.error_rate, args.error_status)
+    print(f"Stub webhook listening on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,198 @@
+import os
+import re
+import html
+import json
+import time
+import zlib
+import bisect
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Words of a search query; a trailing * makes a word a prefix
+_QUERY_TERM_RE = re.compile(r'[\w@.+\'-]+\*?')
+
+
+def _terms(query):
+    """Split a search query into (term, is_prefix) pairs"""
+    terms = []
+    for token in _QUERY_TERM_RE.findall(query):
+        prefix = token.endswith('*')
+        token = token.rstrip('*').strip('.\'-')
+        if token:
+            terms.append((token, prefix))
+    return terms
+
+
+def _fts_query(terms):
+    # Every term is quoted, so user input can't be read as FTS5 syntax
+    return ' '.join('"{}"{}'.format(term.replace('"', '""'), '*' if prefix else '') for term, prefix in terms)
+
+
+def _fields_text(fields):
+    """The parsed fields as one searchable string"""
+    fields = fields or {}
+    values = [fields.get('name'), fields.get('linkedin')] + list(fields.get('emails') or []) + \
+        list(fields.get('phones') or [])
+    return ' '.join(value for value in values if value)
+
+
+class DocumentStore:
+    """Extracted documents kept in a SQLite file, keyed by content SHA-256, with a full-text index.
+
+    Each document's text is stored zlib-compressed along with the offset at
+    which each page starts and its parsed resume fields. An FTS5 index over
+    the text, file name and fields is updated as documents are added. The
+    index keeps no copy of the text (it is contentless), so search snippets
+    are cut from the compressed text of the hits only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._db().executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY, sha256 TEXT UNIQUE NOT NULL, filename TEXT, size INTEGER,
+                content_type TEXT, pages INTEGER, page_offsets TEXT, fields TEXT, text BLOB,
+                created REAL, updated REAL);
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                text, filename, fields, content='', tokenize='unicode61 remove_diacritics 2');
+        """)
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def put(self, sha256, filename, text, page_offsets=None, fields=None, size=None, content_type=None):
+        """Add or update a document and its index entry"""
+        page_offsets = page_offsets or [0]
+        now = time.time()
+        compressed = zlib.compress(text.encode('utf-8'), 6)
+        with self._transaction() as db:
+            row = db.execute('SELECT id, filename, fields, text FROM documents WHERE sha256 = ?', (sha256,)).fetchone()
+            if row is not None:
+                doc_id, old_filename, old_fields, old_text = row
+                # A contentless index forgets nothing by itself: the old values must be handed back to delete them
+                db.execute("INSERT INTO documents_fts (documents_fts, rowid, text, filename, fields) "
+                           "VALUES ('delete', ?, ?, ?, ?)",
+                           (doc_id, zlib.decompress(old_text).decode('utf-8'), old_filename,
+                            _fields_text(json.loads(old_fields))))
+                db.execute('UPDATE documents SET filename = ?, size = ?, content_type = ?, pages = ?, '
+                           'page_offsets = ?, fields = ?, text = ?, updated = ? WHERE id = ?',
+                           (filename, size, content_type, len(page_offsets), json.dumps(page_offsets),
+                            json.dumps(fields), compressed, now, doc_id))
+            else:
+                doc_id = db.execute('INSERT INTO documents (sha256, filename, size, content_type, pages, page_offsets, '
+                                    'fields, text, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                    (sha256, filename, size, content_type, len(page_offsets),
+                                     json.dumps(page_offsets), json.dumps(fields), compressed, now, now)).lastrowid
+            db.execute('INSERT INTO documents_fts (rowid, text, filename, fields) VALUES (?, ?, ?, ?)',
+                       (doc_id, text, filename, _fields_text(fields)))
+
+    def get(self, sha256):
+        """Return a stored document as a dict, or None"""
+        row = self._db().execute('SELECT sha256, filename, size, content_type, pages, page_offsets, fields, text, '
+                                 'created, updated FROM documents WHERE sha256 = ?', (sha256,)).fetchone()
+        if row is None:
+            return None
+        sha256, filename, size, content_type, pages, page_offsets, fields, text, created, updated = row
+        return {'sha256': sha256, 'filename': filename, 'size': size, 'content_type': content_type,
+                'pages': pages, 'page_offsets': json.loads(page_offsets), 'fields': json.loads(fields),
+                'text': zlib.decompress(text).decode('utf-8'), 'created': created, 'updated': updated}
+
+    def pages(self, sha256, start=1, count=5):
+        """Return `count` pages of a stored document's text from page `start` (1-based), or None.
+
+        The result has the document's page count and a list of {'page', 'text'} items.
+        """
+        row = self._db().execute('SELECT pages, page_offsets, text FROM documents WHERE sha256 = ?',
+                                 (sha256,)).fetchone()
+        if row is None:
+            return None
+        pages, page_offsets, text = row
+        page_offsets = json.loads(page_offsets)
+        text = zlib.decompress(text).decode('utf-8')
+        ends = page_offsets[1:] + [len(text)]
+        items = [{'page': page, 'text': text[page_offsets[page - 1]:ends[page - 1]]}
+                 for page in range(max(1, start), min(pages, start + count - 1) + 1)]
+        return {'sha256': sha256, 'pages': pages, 'items': items}
+
+    def search(self, query, limit=20, offset=0, snippet_chars=160):
+        """Return the best matching documents for a query, best first.
+
+        Hits are ranked by BM25, with matches in the file name and parsed
+        fields weighted above matches in the body. Each hit has a snippet
+        around its first match, with matches wrapped in <mark> and the
+        rest HTML-escaped, and the page that match is on.
+        """
+        terms = _terms(query)
+        if not terms:
+            return {'hits': [], 'has_more': False}
+        # Ranking inside the FTS table lets SQLite stop at the top hits before touching the documents
+        rows = self._db().execute(
+            'SELECT d.sha256, d.filename, d.pages, d.page_offsets, d.fields, d.text, d.updated, hits.rank '
+            'FROM (SELECT rowid, rank FROM documents_fts '
+            "      WHERE documents_fts MATCH ? AND rank MATCH 'bm25(1.0, 4.0, 4.0)' "
+            '      ORDER BY rank LIMIT ? OFFSET ?) hits '
+            'JOIN documents d ON d.id = hits.rowid ORDER BY hits.rank',
+            (_fts_query(terms), limit + 1, offset)).fetchall()
+        pattern = re.compile('|'.join(re.escape(term) + (r'\w*' if prefix else '') for term, prefix in terms),
+                             re.IGNORECASE)
+        hits = []
+        for sha256, filename, pages, page_offsets, fields, text, updated, score in rows[:limit]:
+            snippet, page = _snippet(zlib.decompress(text).decode('utf-8'), json.loads(page_offsets), pattern,
+                                     snippet_chars)
+            hits.append({'sha256': sha256, 'filename': filename, 'pages': pages, 'page': page,
+                         'score': round(-score, 3), 'snippet': snippet, 'fields': json.loads(fields),
+                         'updated': updated})
+        return {'hits': hits, 'has_more': len(rows) > limit}
+
+    def stats(self):
+        documents, = self._db().execute('SELECT COUNT(*) FROM documents').fetchone()
+        page_count, page_size = (self._db().execute(f'PRAGMA {name}').fetchone()[0]
+                                 for name in ('page_count', 'page_size'))
+        return {'documents': documents, 'bytes': page_count * page_size}
+
+
+def _snippet(text, page_offsets, pattern, width):
+    """Cut about `width` characters of text around the first match, returning (snippet html, page number)"""
+    match = pattern.search(text)
+    if match is None:
+        # Matched on the file name or fields only
+        return html.escape(text[:width]).replace('\n', ' ').strip() + ('…' if len(text) > width else ''), None
+    start = max(0, match.start() - width // 2)
+    end = min(len(text), start + width)
+    # Don't cut words in half at either end
+    if start > 0:
+        space = text.find(' ', start, match.start())
+        start = space + 1 if space != -1 else start
+    if end < len(text):
+        space = text.rfind(' ', match.end(), end)
+        end = space if space != -1 else end
+    parts = []
+    position = start
+    for found in pattern.finditer(text, start, end):
+        parts.append(html.escape(text[position:found.start()]))
+        parts.append(f'<mark>{html.escape(found.group())}</mark>')
+        position = found.end()
+    parts.append(html.escape(text[position:end]))
+    snippet = ''.join(parts).replace('\n', ' ').strip()
+    page = bisect.bisect_right(page_offsets, match.start()) if page_offsets else None
+    return ('…' if start > 0 else '') + snippet + ('…' if end < len(text) else ''), page
@@ -0,0 +1,548 @@
+import io
+import re
+import csv
+import json
+import codecs
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+
+# Bytes read from an upload at a time; readers never hold more of the file than this
+READ_SIZE = 64 * 1024
+
+_SPACE_RE = re.compile(r'\s+')
+
+
+class TextBuilder:
+    """Collects extracted text and where its pages start, up to `max_chars` characters.
+
+    Besides the page breaks a format has (DOCX page breaks, XLSX sheets),
+    a new page is started at the first line end after `page_chars`
+    characters, so long documents can still be read a page at a time.
+    Readers write many lines at once where they can, as each call costs
+    more than a line of text does.
+    """
+
+    def __init__(self, max_chars, page_chars):
+        self.max_chars = max_chars
+        self.page_chars = page_chars
+        self.length = 0
+        self.page_offsets = [0]
+        self.truncated = False
+        self._parts = []
+        self._line = []
+
+    def write(self, text):
+        if self.truncated or not text:
+            return
+        room = self.max_chars - self.length
+        if len(text) > room:
+            text = text[:room]
+            self.truncated = True
+        self._parts.append(text)
+        start = self.length
+        self.length += len(text)
+        while self.page_chars:
+            due = self.page_offsets[-1] + self.page_chars
+            if due > self.length:
+                break
+            newline = text.find('\n', max(0, due - start - 1))
+            if newline == -1:
+                break
+            self.page_offsets.append(start + newline + 1)
+
+    def write_line(self, line):
+        if line:
+            self.write(line + '\n')
+
+    def write_lines(self, lines):
+        if lines:
+            self.write('\n'.join(lines) + '\n')
+
+    def add(self, text):
+        """Add inline text to the current line, whose whitespace is collapsed when it ends"""
+        self._line.append(text)
+
+    def end_line(self):
+        self.write_line(_SPACE_RE.sub(' ', ''.join(self._line)).strip())
+        self._line = []
+
+    def page_break(self):
+        self.end_line()
+        if self.length > self.page_offsets[-1]:
+            self.page_offsets.append(self.length)
+
+    def result(self):
+        self.end_line()
+        offsets = self.page_offsets
+        if len(offsets) > 1 and offsets[-1] >= self.length:
+            offsets = offsets[:-1]
+        return {'text': ''.join(self._parts), 'page_offsets': offsets, 'pages': len(offsets),
+                'truncated': self.truncated}
+
+
+def _text_stream(stream):
+    """Wrap a binary upload for reading text in its detected encoding: a BOM's, else UTF-8, else cp1252"""
+    start = stream.tell()
+    head = stream.read(READ_SIZE)
+    stream.seek(start)
+    encoding = 'utf-8'
+    for bom, bom_encoding in ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'),
+                              (codecs.BOM_UTF16_BE, 'utf-16')):
+        if head.startswith(bom):
+            encoding = bom_encoding
+            break
+    else:
+        try:
+            # Unless the sample is the whole file, a character cut in half at its end is no error
+            codecs.getincrementaldecoder('utf-8')().decode(head, final=len(head) < READ_SIZE)
+        except UnicodeDecodeError:
+            encoding = 'cp1252'
+    return io.TextIOWrapper(stream, encoding=encoding, errors='replace', newline='')
+
+
+def _detached(read):
+    """Run a reader on the text stream of an upload, leaving the upload itself open"""
+    def reader(stream, out):
+        text = _text_stream(stream)
+        try:
+            read(text, out)
+        finally:
+            text.detach()
+    return reader
+
+
+@_detached
+def read_text(text, out):
+    for chunk in iter(lambda: text.read(READ_SIZE), ''):
+        # A form feed is a page break in plain text
+        *pages, rest = chunk.split('\f')
+        for page in pages:
+            out.write(page + '\n')
+            out.page_break()
+        out.write(rest)
+        if out.truncated:
+            return
+
+
+_BLOCK_TAGS = {'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption', 'footer',
+               'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre',
+               'section', 'table', 'td', 'th', 'title', 'tr', 'ul'}
+
+
+class _HTMLText(HTMLParser):
+    def __init__(self, out):
+        super().__init__()
+        self.out = out
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style', 'template'):
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.out.end_line()
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style', 'template'):
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK_TAGS:
+            self.out.end_line()
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.out.add(data)
+
+
+@_detached
+def read_html(text, out):
+    parser = _HTMLText(out)
+    for chunk in iter(lambda: text.read(READ_SIZE), ''):
+        parser.feed(chunk)
+        if out.truncated:
+            return
+    parser.close()
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _parse_xml(stream, target, out):
+    """Feed an XML stream through expat to a parser target, without building a tree, until `out` is truncated"""
+    parser = ET.XMLParser(target=target)
+    for chunk in iter(lambda: stream.read(READ_SIZE), b''):
+        parser.feed(chunk)
+        if out.truncated:
+            return
+    parser.close()
+
+
+class _XMLText:
+    """Parser target writing each element's text on its own line"""
+
+    def __init__(self, out):
+        self.out = out
+
+    def start(self, tag, attrs):
+        self.out.end_line()
+
+    def end(self, tag):
+        self.out.end_line()
+
+    def data(self, data):
+        self.out.add(data)
+
+    def close(self):
+        pass
+
+
+def read_xml(stream, out):
+    _parse_xml(stream, _XMLText(out), out)
+
+
+class _DocxText:
+    """Parser target for word/document.xml: paragraphs become lines, page breaks start pages"""
+
+    def __init__(self, out):
+        self.out = out
+        self._in_text = False
+
+    def start(self, tag, attrs):
+        name = _local_name(tag)
+        if name == 't':
+            self._in_text = True
+        elif name == 'tab':
+            self.out.add('\t')
+        elif name in ('br', 'cr'):
+            if any(_local_name(key) == 'type' and value == 'page' for key, value in attrs.items()):
+                self.out.page_break()
+            else:
+                self.out.end_line()
+        elif name == 'lastRenderedPageBreak':
+            # Where Word last laid out a page break
+            self.out.page_break()
+
+    def end(self, tag):
+        name = _local_name(tag)
+        if name == 't':
+            self._in_text = False
+        elif name == 'p':
+            self.out.end_line()
+
+    def data(self, data):
+        if self._in_text:
+            self.out.add(data)
+
+    def close(self):
+        pass
+
+
+def read_docx(stream, out):
+    with zipfile.ZipFile(stream) as docx, docx.open('word/document.xml') as document:
+        _parse_xml(document, _DocxText(out), out)
+
+
+class _SharedStrings:
+    """Parser target collecting xl/sharedStrings.xml, skipping phonetic runs.
+
+    Collecting stops (`truncated`) after `max_chars` characters, as no more
+    than that could be written out; cells referring past it come out empty.
+    """
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.length = 0
+        self.truncated = False
+        self.strings = []
+        self._parts = None
+        self._in_text = False
+        self._phonetic = 0
+
+    def start(self, tag, attrs):
+        name = _local_name(tag)
+        if name == 'si':
+            self._parts = []
+        elif name == 'rPh':
+            self._phonetic += 1
+        elif name == 't':
+            self._in_text = not self._phonetic
+
+    def end(self, tag):
+        name = _local_name(tag)
+        if name == 'si' and not self.truncated:
+            self.strings.append(''.join(self._parts))
+            self._parts = None
+            # Each string costs at least the tab before it, so a table of empty ones is capped too
+            self.length += 1
+            self.truncated = self.length > self.max_chars
+        elif name == 'rPh':
+            self._phonetic -= 1
+        elif name == 't':
+            self._in_text = False
+
+    def data(self, data):
+        if self._in_text and self._parts is not None and not self.truncated:
+            self._parts.append(data)
+            self.length += len(data)
+            self.truncated = self.length > self.max_chars
+
+    def close(self):
+        return self.strings
+
+
+def _column_index(reference):
+    """Zero-based column of a cell reference such as 'AB12'"""
+    index = 0
+    for char in reference:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - ord('A') + 1
+    return index - 1
+
+
+class _SheetText:
+    """Parser target for a worksheet: each row becomes a tab-separated line"""
+
+    def __init__(self, out, shared_strings):
+        self.out = out
+        self.shared_strings = shared_strings
+        self._row = []
+        self._cell = None
+        self._value = []
+        self._in_value = False
+
+    def start(self, tag, attrs):
+        name = _local_name(tag)
+        if name == 'row':
+            self._row = []
+        elif name == 'c':
+            self._cell = (attrs.get('r', ''), attrs.get('t', 'n'))
+            self._value = []
+        elif name in ('v', 't') and self._cell is not None:
+            self._in_value = True
+
+    def end(self, tag):
+        name = _local_name(tag)
+        if name in ('v', 't'):
+            self._in_value = False
+        elif name == 'c' and self._cell is not None:
+            reference, kind = self._cell
+            value = ''.join(self._value)
+            if kind == 's':
+                value = self.shared_strings[int(value)] if value.isdigit() and int(value) < len(self.shared_strings) \
+                    else ''
+            elif kind == 'b':
+                value = 'TRUE' if value == '1' else 'FALSE'
+            column = _column_index(reference) if reference else len(self._row)
+            if column >= len(self._row):
+                self._row.extend([''] * (column - len(self._row)))
+                self._row.append(value)
+            self._cell = None
+        elif name == 'row':
+            self.out.write_line('\t'.join(self._row).rstrip())
+
+    def data(self, data):
+        if self._in_value:
+            self._value.append(data)
+
+    def close(self):
+        pass
+
+
+def _sheets(xlsx):
+    """(name, part name) of each worksheet of an XLSX file, in workbook order"""
+    relationships = {}
+    with xlsx.open('xl/_rels/workbook.xml.rels') as rels:
+        for _, element in ET.iterparse(rels):
+            if _local_name(element.tag) == 'Relationship':
+                target = element.get('Target', '')
+                relationships[element.get('Id')] = target.lstrip('/') if target.startswith('/') else \
+                    posixpath.normpath(posixpath.join('xl', target))
+    sheets = []
+    with xlsx.open('xl/workbook.xml') as workbook:
+        for _, element in ET.iterparse(workbook):
+            if _local_name(element.tag) == 'sheet':
+                relationship = next((value for key, value in element.attrib.items() if _local_name(key) == 'id'),
+                                    None)
+                if relationship in relationships:
+                    sheets.append((element.get('name'), relationships[relationship]))
+    return sheets
+
+
+def read_xlsx(stream, out):
+    with zipfile.ZipFile(stream) as xlsx:
+        shared_strings = []
+        if 'xl/sharedStrings.xml' in xlsx.namelist():
+            # The string table is the one part that must be held in memory, since any cell can refer to any string
+            target = _SharedStrings(out.max_chars)
+            with xlsx.open('xl/sharedStrings.xml') as strings:
+                _parse_xml(strings, target, target)
+            shared_strings = target.strings
+        for name, part in _sheets(xlsx):
+            out.page_break()
+            out.write_line(name)
+            with xlsx.open(part) as sheet:
+                _parse_xml(sheet, _SheetText(out, shared_strings), out)
+            if out.truncated:
+                return
+
+
+@_detached
+def read_csv(text, out):
+    start = text.tell()
+    sample = text.read(READ_SIZE)
+    text.seek(start)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+    lines = []
+    for row in csv.reader(text, dialect):
+        line = '\t'.join(cell.strip() for cell in row).rstrip()
+        if line:
+            lines.append(line)
+        if len(lines) >= 1000:
+            out.write_lines(lines)
+            lines = []
+            if out.truncated:
+                return
+    out.write_lines(lines)
+
+
+_JSON_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+_JSON_SCALAR = r'(?:-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null)(?![\w.+-])'
+# One step through a JSON document: a key with its value (or the bracket
+# opening it), a value in an array, or a closing bracket. Commas are skipped.
+_JSON_TOKEN_RE = re.compile(rf"""[\s,]*(?:
+    (?P<key>{_JSON_STRING})\s*:\s*(?:(?P<string>{_JSON_STRING})|(?P<scalar>{_JSON_SCALAR})|(?P<open>[{{\[]))
+  | (?P<item_string>{_JSON_STRING})(?!\s*:)
+  | (?P<item_scalar>{_JSON_SCALAR})
+  | (?P<item_open>[{{\[])
+  | (?P<close>[}}\]]))""", re.VERBOSE)
+_SPACE_TO_END_RE = re.compile(r'[\s,]*\Z')
+# The opening quote of the string a token is cut off in: a key's, or its value's once the key is complete
+_OPEN_STRING_RE = re.compile(rf'[\s,]*(?:{_JSON_STRING}\s*:\s*)?"')
+# The inside of a string up to its closing quote (or a backslash the next chunk finishes)
+_STRING_BODY_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*')
+
+
+def _json_string(token):
+    return json.loads(token) if '\\' in token else token[1:-1]
+
+
+@_detached
+def read_json(text, out):
+    """Write each value of a JSON document (or of several, as in JSON Lines) on a line, after its key.
+
+    The document is tokenized a chunk at a time, so its size doesn't matter.
+    While a long string is cut off, each chunk is only scanned for its
+    closing quote, not tokenized again from the string's start. Raises
+    ValueError if it isn't JSON.
+    """
+    stack = []  # (bracket, key) of each open object or array
+    buffer = ''
+    final = False
+    scan = None  # where to look for the end of a string the buffer ends in
+    while not final:
+        chunk = text.read(READ_SIZE)
+        final = not chunk
+        buffer += chunk
+        if scan is not None and not final:
+            scan = _STRING_BODY_RE.match(buffer, scan).end()
+            if scan == len(buffer) or buffer[scan] != '"':
+                continue
+        scan = None
+        position = 0
+        lines = []
+        while True:
+            match = _JSON_TOKEN_RE.match(buffer, position)
+            if match is None:
+                if final:
+                    if buffer[position:].strip(' \t\r\n,'):
+                        raise ValueError('Invalid JSON')
+                    break
+                # Only a string can run on for long before it matches
+                opening = _OPEN_STRING_RE.match(buffer, position)
+                if opening is not None:
+                    body = _STRING_BODY_RE.match(buffer, opening.end()).end()
+                    if body == len(buffer) or buffer[body] != '"':
+                        scan = body
+                        break
+                if len(buffer) - position > 1024:
+                    raise ValueError('Invalid JSON')
+                break
+            # A token at the end of the buffer may go on in the next chunk, or turn out to be a key
+            if not final and _SPACE_TO_END_RE.match(buffer, match.end()):
+                break
+            position = match.end()
+            kind = match.lastgroup
+            in_object = bool(stack) and stack[-1][0] == '{'
+            if kind != 'close' and kind.startswith('item_') == in_object:
+                # Keys only go in objects, bare values only in arrays or at the top
+                raise ValueError('Invalid JSON')
+            if kind in ('string', 'scalar'):
+                value = match.group(kind)
+                if value != 'null':
+                    key = _json_string(match.group('key'))
+                    lines.append(f"{key}: {_json_string(value) if kind == 'string' else value}")
+            elif kind == 'open':
+                stack.append((match.group(kind), _json_string(match.group('key'))))
+            elif kind in ('item_string', 'item_scalar'):
+                value = match.group(kind)
+                if value != 'null':
+                    key = stack[-1][1] if stack else None
+                    value = _json_string(value) if kind == 'item_string' else value
+                    lines.append(f'{key}: {value}' if key else value)
+            elif kind == 'item_open':
+                stack.append((match.group(kind), stack[-1][1] if stack else None))
+            elif not stack or stack.pop()[0] != {'}': '{', ']': '['}[match.group(kind)]:
+                raise ValueError('Unbalanced JSON brackets')
+        buffer = buffer[position:]
+        out.write_lines(lines)
+        if out.truncated:
+            return
+    if stack:
+        raise ValueError('Unexpected end of JSON')
+
+
+# Readers by file extension. Legacy binary .doc and .xls files aren't among
+# them and go to the webhook like PDFs and images.
+READERS = {
+    'txt': read_text, 'md': read_text, 'py': read_text, 'js': read_text, 'css': read_text,
+    'html': read_html, 'htm': read_html, 'xml': read_xml, 'csv': read_csv, 'json': read_json,
+    'docx': read_docx, 'xlsx': read_xlsx,
+}
+
+# Structured formats that are read as plain text when they turn out to be malformed
+_TEXT_FALLBACK = {'xml', 'csv', 'json'}
+
+
+def extension(filename):
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+
+def can_extract(filename):
+    return extension(filename) in READERS
+
+
+def extract_file(stream, filename, max_chars, page_chars):
+    """Extract the text of a file from a seekable binary stream, choosing the reader by its extension.
+
+    Returns a dict with `text`, `page_offsets`, `pages`, `truncated` and
+    `format`, or None if the file can't be read here (a damaged DOCX or
+    XLSX, say) and should go to the webhook instead.
+    """
+    fmt = extension(filename)
+    start = stream.tell()
+    out = TextBuilder(max_chars, page_chars)
+    try:
+        READERS[fmt](stream, out)
+    except (ValueError, ET.ParseError, csv.Error, zipfile.BadZipFile, KeyError, EOFError) as e:
+        stream.seek(start)
+        if fmt not in _TEXT_FALLBACK:
+            print(f"Could not read {filename} as {fmt}: {e}")
+            return None
+        out = TextBuilder(max_chars, page_chars)
+        read_text(stream, out)
+    return dict(out.result(), format=fmt)
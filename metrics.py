@@ -0,0 +1,197 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+
+class _Value(_Metric):
+    """A single number per label set, kept here or read from `fn()` at scrape time.
+
+    `fn` returns a number, or for labelled metrics a list of (labels, value).
+    """
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self._fn = fn
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        if self._fn is not None:
+            value = self._fn()
+            if self.labels:
+                return [(self.name, labels, sample) for labels, sample in value]
+            return [(self.name, {}, value)]
+        with self._lock:
+            return [(self.name, dict(zip(self.labels, key)), value) for key, value in self._values.items()]
+
+
+class Counter(_Value):
+    kind = 'counter'
+
+
+class Gauge(_Value):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                labels = dict(zip(self.labels, key))
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f'{self.name}_bucket', dict(labels, le=_format_value(bound)), count))
+                samples.append((f'{self.name}_sum', labels, total))
+                samples.append((f'{self.name}_count', labels, counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """Holds a service's metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=(), fn=None):
+        return self._add(Counter(name, help, labels, fn))
+
+    def gauge(self, name, help, labels=(), fn=None):
+        return self._add(Gauge(name, help, labels, fn))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTimer:
+    """Time spent in each stage of one request, for its Server-Timing header"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def to_dict(self):
+        """Stage durations in milliseconds, plus the request total so far"""
+        with self._lock:
+            stages = {stage: round(seconds * 1000, 1) for stage, seconds in self._stages.items()}
+        stages['total'] = round(self.elapsed() * 1000, 1)
+        return stages
+
+    def server_timing(self):
+        return ', '.join(f'{stage};dur={ms}' for stage, ms in self.to_dict().items())
+
+
+class StageTimings:
+    """Records stage durations into a histogram and into the current request's timer.
+
+    The current timer follows the request through contextvars, so code deep
+    in the call stack can time itself with `with timings.stage('render'):`
+    without the timer being passed down. Stages timed outside a request
+    only go to the histogram.
+    """
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self._current = contextvars.ContextVar('request_timer', default=None)
+
+    def begin(self, timer=None):
+        """Make `timer` (a new one by default) the current request's timer"""
+        timer = timer or RequestTimer()
+        self._current.set(timer)
+        return timer
+
+    def current(self):
+        return self._current.get()
+
+    def record(self, stage, seconds):
+        self.histogram.observe(seconds, stage=stage)
+        timer = self._current.get()
+        if timer is not None:
+            timer.add(stage, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def make_key(digest, params):
+    """Build a cache key from a content digest and the parameters that affect the result"""
+    encoded = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{digest}|{encoded}".encode('utf-8')).hexdigest()
+
+
+class OCRCache:
+    """Two-tier cache for OCR results.
+
+    An in-memory LRU bounded by `memory_bytes` sits in front of an on-disk
+    store under `directory` bounded by `disk_bytes`. Values must be JSON
+    serializable. Either tier is disabled by giving it a budget of 0.
+    """
+
+    def __init__(self, directory, memory_bytes, disk_bytes):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (value, size)
+        self._memory_used = 0
+        self._disk = OrderedDict()  # key -> size, least recently used first
+        self._disk_used = 0
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+        if self.disk_bytes > 0:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_disk_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def _load_disk_index(self):
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.json'):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_used += size
+        self._evict_disk()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return entry[0]
+            on_disk = key in self._disk
+
+        if on_disk:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    data = f.read()
+                value = json.loads(data)
+                os.utime(self._path(key))
+            except (OSError, ValueError):
+                with self._lock:
+                    self._forget_disk(key)
+            else:
+                with self._lock:
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                    self._stats['disk_hits'] += 1
+                    self._remember(key, value, len(data))
+                return value
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        data = json.dumps(value).encode('utf-8')
+        if 0 < len(data) <= self.disk_bytes:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial entry
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._forget_disk(key)
+                self._disk[key] = len(data)
+                self._disk_used += len(data)
+                self._evict_disk()
+        with self._lock:
+            self._remember(key, value, len(data))
+
+    def _remember(self, key, value, size):
+        if size > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= old[1]
+        self._memory[key] = (value, size)
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_used -= evicted_size
+            self._stats['evictions'] += 1
+
+    def _forget_disk(self, key):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_used -= size
+
+    def _evict_disk(self):
+        while self._disk_used > self.disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_used -= size
+            self._stats['evictions'] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_used,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_used,
+            })
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
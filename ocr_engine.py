@@ -0,0 +1,92 @@
+import importlib.util
+import pytesseract
+
+ENGINES = ('pytesseract', 'tesserocr')
+
+
+class PytesseractEngine:
+    """Runs the tesseract binary once per page through pytesseract"""
+
+    name = 'pytesseract'
+
+    def __init__(self, lang, psm):
+        self.lang = lang
+        self.config = f'--psm {psm}'
+
+    def version(self):
+        return str(pytesseract.get_tesseract_version())
+
+    def image_to_string(self, image):
+        return pytesseract.image_to_string(image, lang=self.lang, config=self.config)
+
+    def recognize(self, image):
+        """Return the page text and the mean confidence (0-100) of its words, or None if it has none"""
+        data = pytesseract.image_to_data(image, lang=self.lang, config=self.config,
+                                         output_type=pytesseract.Output.DICT)
+        # Rebuild the text from the word boxes, one line per line and a blank line between paragraphs
+        lines = {}
+        confidences = []
+        for i, word in enumerate(data['text']):
+            if not word.strip():
+                continue
+            confidence = float(data['conf'][i])
+            if confidence >= 0:
+                confidences.append(confidence)
+            lines.setdefault((data['block_num'][i], data['par_num'][i], data['line_num'][i]), []).append(word)
+        text = []
+        paragraph = None
+        for (block, par, _), words in lines.items():
+            if paragraph is not None and paragraph != (block, par):
+                text.append('')
+            text.append(' '.join(words))
+            paragraph = (block, par)
+        return '\n'.join(text), sum(confidences) / len(confidences) if confidences else None
+
+
+class TesserocrEngine:
+    """Keeps one libtesseract API handle loaded for the life of the process.
+
+    The traineddata is loaded once and pages are handed over as in-memory
+    images, so there is no process spawn or temp file per page.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, lang, psm):
+        # Imported here so OMP_THREAD_LIMIT is already set when libtesseract loads
+        import tesserocr
+        self.tesserocr = tesserocr
+        self.api = tesserocr.PyTessBaseAPI(lang=lang, psm=psm)
+
+    def version(self):
+        return self.tesserocr.tesseract_version().split()[1]
+
+    def image_to_string(self, image):
+        self.api.SetImage(image)
+        text = self.api.GetUTF8Text()
+        self.api.Clear()
+        return text
+
+    def recognize(self, image):
+        """Return the page text and the mean confidence (0-100) of its words, or None if it has none"""
+        self.api.SetImage(image)
+        text = self.api.GetUTF8Text()
+        confidence = self.api.MeanTextConf()
+        self.api.Clear()
+        return text, confidence if text.strip() else None
+
+
+def resolve_engine(name):
+    """Return the engine that will actually be used for `name`, falling back to pytesseract"""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown OCR engine '{name}', choose one of: {', '.join(ENGINES)}")
+    if name == 'tesserocr' and importlib.util.find_spec('tesserocr') is None:
+        print("Warning: tesserocr is not installed, falling back to pytesseract")
+        return 'pytesseract'
+    return name
+
+
+def create_engine(name, lang, psm):
+    if resolve_engine(name) == 'tesserocr':
+        return TesserocrEngine(lang, psm)
+    return PytesseractEngine(lang, psm)
@@ -0,0 +1,117 @@
+import time
+import uuid
+import queue
+import threading
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, payload):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = 'queued'
+        self.pages_done = 0
+        self.pages_total = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def progress(self, done, total):
+        self.pages_done = done
+        self.pages_total = total
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': {'pages_done': self.pages_done, 'pages_total': self.pages_total},
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobManager:
+    """Runs submitted jobs on a fixed set of runner threads behind a bounded queue.
+
+    `run(job)` does the work and returns the job's result; it can report
+    progress through `job.progress(done, total)`. Finished jobs are kept
+    for `ttl` seconds and then forgotten.
+    """
+
+    def __init__(self, run, runners, max_queued, ttl):
+        self._run = run
+        self._ttl = ttl
+        self._runners = runners
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._avg_duration = None
+        for i in range(runners):
+            threading.Thread(target=self._worker, name=f'ocr-job-runner-{i}', daemon=True).start()
+
+    def submit(self, payload):
+        self._purge()
+        job = Job(payload)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFull(self.retry_after())
+        return job
+
+    def get(self, job_id):
+        self._purge()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def retry_after(self):
+        """Estimate in whole seconds how long until a queue slot frees up"""
+        average = self._avg_duration or 1.0
+        return max(1, int(average * (self._queue.qsize() / self._runners) + 0.5))
+
+    def _purge(self):
+        cutoff = time.time() - self._ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job.status = 'running'
+            job.started_at = time.time()
+            try:
+                job.result = self._run(job)
+                job.status = 'done'
+            except Exception as e:
+                print(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = 'failed'
+            finally:
+                job.finished_at = time.time()
+                duration = job.finished_at - job.started_at
+                with self._lock:
+                    self._avg_duration = duration if self._avg_duration is None else \
+                        0.8 * self._avg_duration + 0.2 * duration
+                job.payload = None
+                self._queue.task_done()
@@ -0,0 +1,168 @@
+import statistics
+from PIL import Image, ImageChops, ImageOps, ImageStat
+
+# Pages are summarised from a copy this wide, so the cost doesn't grow with DPI
+SIGNATURE_WIDTH = 512
+# Width of the copy ink is measured on
+INK_WIDTH = 128
+# Grey levels below the paper colour a pixel must be to count as ink
+INK_CONTRAST = 48
+# Difference-hash bits two pages may differ by and still be compared in detail
+DHASH_MAX_DISTANCE = 16
+
+
+def otsu_threshold(gray):
+    """Pick the grey level that best separates ink from background (Otsu's method)"""
+    histogram = gray.histogram()[:256]
+    total = sum(histogram)
+    if not total:
+        return 128
+    sum_all = sum(level * count for level, count in enumerate(histogram))
+    sum_background = 0
+    weight_background = 0
+    best_level, best_variance = 128, -1.0
+    for level, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += level * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+
+def binarize(image):
+    """Convert a page to pure black and white using an Otsu threshold"""
+    gray = image.convert('L')
+    threshold = otsu_threshold(gray)
+    return gray.point(lambda value: 255 if value > threshold else 0, mode='1')
+
+
+def estimate_line_height(image, min_lines=3):
+    """Median height in pixels of the text lines on a page, or None if too few are found"""
+    gray = image.convert('L')
+    threshold = otsu_threshold(gray)
+    ink = gray.point(lambda value: 1 if value <= threshold else 0).convert('F')
+    # Squash every row to a single pixel: its value is the row's ink coverage
+    squashed = ink.resize((1, ink.height), Image.BOX)
+    profile = [squashed.getpixel((0, y)) for y in range(squashed.height)]
+
+    heights = []
+    run = 0
+    for coverage in profile:
+        if coverage > 0.003:
+            run += 1
+        else:
+            if run > 1:
+                heights.append(run)
+            run = 0
+    if run > 1:
+        heights.append(run)
+
+    if len(heights) < min_lines:
+        return None
+    return statistics.median(heights)
+
+
+def choose_dpi(preview, preview_dpi, target_line_px, min_dpi, max_dpi, max_pixels, default_dpi):
+    """Pick a render DPI from a low-resolution preview of the page.
+
+    The DPI is chosen so body-text lines come out about `target_line_px`
+    tall, then capped so the page's physical size never renders to more
+    than `max_pixels`. Pages with no detectable text lines use `default_dpi`.
+    """
+    line_height = estimate_line_height(preview)
+    if line_height:
+        dpi = target_line_px * preview_dpi / line_height
+    else:
+        dpi = default_dpi
+
+    width_in = preview.width / preview_dpi
+    height_in = preview.height / preview_dpi
+    if width_in and height_in:
+        dpi = min(dpi, (max_pixels / (width_in * height_in)) ** 0.5)
+
+    # Round so neighbouring pages share a DPI and can be rendered together
+    return int(max(min_dpi, min(max_dpi, dpi)) // 10 * 10)
+
+
+def _span(profile, relative_coverage):
+    # Scattered noise adds a little ink everywhere, so the cut-off follows the densest row or column
+    cutoff = max(0.01, relative_coverage * max(profile))
+    inked = [i for i, coverage in enumerate(profile) if coverage >= cutoff]
+    return (inked[0], inked[-1] + 1) if inked else None
+
+
+def _content_box(ink, relative_coverage=0.15):
+    """Bounding box of the rows and columns with a fair share of the page's ink"""
+    rows = ink.resize((1, ink.height), Image.BOX)
+    columns = ink.resize((ink.width, 1), Image.BOX)
+    vertical = _span([rows.getpixel((0, y)) for y in range(ink.height)], relative_coverage)
+    horizontal = _span([columns.getpixel((x, 0)) for x in range(ink.width)], relative_coverage)
+    if vertical is None or horizontal is None:
+        return None
+    return horizontal[0], vertical[0], horizontal[1], vertical[1]
+
+
+class PageSignature:
+    """Cheap summary of a page for blank and near-duplicate detection.
+
+    `ink` is the share of a heavily downscaled copy that is darker than the
+    paper; isolated specks of scanner noise average out at that scale, text
+    lines don't. The inked area is cropped and contrast-stretched, so a page
+    scanned twice with a different offset or exposure still looks the same:
+    `dhash` is a 64-bit difference hash of it and `thumbnail` a copy just
+    sharp enough to tell words apart, for confirming hash matches.
+    """
+
+    def __init__(self, image, thumbnail_size=(192, 256)):
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('L')
+        if image.width > SIGNATURE_WIDTH:
+            image = image.resize((SIGNATURE_WIDTH, max(1, round(image.height * SIGNATURE_WIDTH / image.width))),
+                                 Image.BOX)
+        gray = image.convert('L')
+        scale = max(1, gray.width // INK_WIDTH)
+        coarse = gray.reduce(scale)
+        histogram = coarse.histogram()
+        # The most common grey level is the paper
+        cutoff = max(0, max(range(256), key=histogram.__getitem__) - INK_CONTRAST)
+        self.ink = sum(histogram[:cutoff]) / (coarse.width * coarse.height)
+
+        self.dhash = self.thumbnail = None
+        box = _content_box(gray.point(lambda value: 1 if value < cutoff else 0).convert('F'))
+        if box is not None and self.ink > 0:
+            content = ImageOps.autocontrast(gray.crop(box))
+            self.thumbnail = content.resize(thumbnail_size, Image.BOX)
+            # One byte per pixel of the L-mode 9x8 image, row by row
+            pixels = content.resize((9, 8), Image.BOX).tobytes()
+            self.dhash = sum(1 << i for i, (left, right) in
+                             enumerate((row[x], row[x + 1]) for row in (pixels[y * 9:y * 9 + 9] for y in range(8))
+                                       for x in range(8))
+                             if left > right)
+
+    def similarity(self, other):
+        """Normalised cross-correlation of the two thumbnails, from -1 to 1"""
+        if self.thumbnail is None or other.thumbnail is None:
+            return 0.0
+        mine, theirs = ImageStat.Stat(self.thumbnail), ImageStat.Stat(other.thumbnail)
+        spread = mine.stddev[0] * theirs.stddev[0]
+        if not spread:
+            return 0.0
+        # multiply() scales the product down by 255
+        product = ImageStat.Stat(ImageChops.multiply(self.thumbnail, other.thumbnail)).mean[0] * 255
+        return (product - mine.mean[0] * theirs.mean[0]) / spread
+
+    def matches(self, other, min_similarity):
+        """Whether `other` looks like the same page"""
+        if self.dhash is None or other.dhash is None:
+            return False
+        if bin(self.dhash ^ other.dhash).count('1') > DHASH_MAX_DISTANCE:
+            return False
+        return self.similarity(other) >= min_similarity
@@ -0,0 +1,271 @@
+import json
+import time
+import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+# A page of a document leased to a worker
+QueueTask = namedtuple('QueueTask', ['id', 'job_id', 'page', 'attempts'])
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class SQLiteBroker:
+    """Page task queue in a SQLite file, shared by processes on one host.
+
+    A frontend submits a document with the pages it needs OCR'd; workers
+    lease one page task at a time and post its result or failure. A lease
+    that is not completed within `lease_seconds` (the worker crashed or
+    hung) makes the task available again, up to `max_attempts` leases.
+    Results are accepted from any worker that ran the task, first one wins.
+    """
+
+    def __init__(self, path, lease_seconds=120, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._db().executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, suffix TEXT, document BLOB, created REAL);
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT, page INTEGER, state TEXT,
+                attempts INTEGER DEFAULT 0, worker TEXT, lease_until REAL, result TEXT);
+            CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, id);
+            CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job_id, state);
+        """)
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def submit(self, job_id, document, suffix, page_numbers):
+        """Queue OCR of the given pages of a document (bytes, with its file suffix)"""
+        with self._transaction() as db:
+            db.execute('INSERT INTO jobs VALUES (?, ?, ?, ?)', (job_id, suffix, document, time.time()))
+            db.executemany("INSERT INTO tasks (job_id, page, state) VALUES (?, ?, 'queued')",
+                           [(job_id, number) for number in page_numbers])
+
+    def lease(self, worker_id):
+        """Lease the oldest available task to a worker, or return None if there is none"""
+        with self._transaction() as db:
+            while True:
+                now = time.time()
+                row = db.execute(
+                    "SELECT id, job_id, page, attempts FROM tasks WHERE state = 'queued' "
+                    "OR (state = 'leased' AND lease_until < ?) ORDER BY id LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    return None
+                task = QueueTask(*row)
+                if task.attempts >= self.max_attempts:
+                    # Every worker that took it timed out, so don't hand it out again
+                    db.execute("UPDATE tasks SET state = 'failed', result = ? WHERE id = ?",
+                               (json.dumps({'error': f'Lease expired {task.attempts} times'}), task.id))
+                    continue
+                db.execute("UPDATE tasks SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                           "WHERE id = ?", (worker_id, now + self.lease_seconds, task.id))
+                return task._replace(attempts=task.attempts + 1)
+
+    def document(self, job_id):
+        """Return (suffix, document bytes) of a job, or None if it has been deleted"""
+        return self._db().execute('SELECT suffix, document FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+    def complete(self, task_id, result):
+        """Record a task's JSON-serializable result"""
+        with self._transaction() as db:
+            db.execute("UPDATE tasks SET state = 'done', result = ? WHERE id = ? AND state != 'done'",
+                       (json.dumps(result), task_id))
+
+    def fail(self, task_id, error):
+        """Put a task back on the queue, or fail it for good once it has used up its attempts"""
+        with self._transaction() as db:
+            db.execute("UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                       "result = ? WHERE id = ? AND state = 'leased'",
+                       (self.max_attempts, json.dumps({'error': error}), task_id))
+
+    def take_results(self, job_id):
+        """Remove and return {page: result} for a job's finished tasks; failed ones are {'error': ...}"""
+        with self._transaction() as db:
+            rows = db.execute("SELECT page, result FROM tasks WHERE job_id = ? AND state IN ('done', 'failed')",
+                              (job_id,)).fetchall()
+            db.execute("DELETE FROM tasks WHERE job_id = ? AND state IN ('done', 'failed')", (job_id,))
+        return {page: json.loads(result) for page, result in rows}
+
+    def delete(self, job_id):
+        """Drop a job, its document and any of its tasks still queued or running"""
+        with self._transaction() as db:
+            db.execute('DELETE FROM tasks WHERE job_id = ?', (job_id,))
+            db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def stats(self):
+        counts = dict(self._db().execute('SELECT state, COUNT(*) FROM tasks GROUP BY state').fetchall())
+        return {'queued': counts.get('queued', 0), 'leased': counts.get('leased', 0)}
+
+
+# Returns expired leases to the queue, then pops a task id and, if its task
+# still exists, counts the attempt and leases it to the worker, all in one
+# step. KEYS are the queue, leases, tasks (id -> attempts) and workers
+# (id -> worker) keys; every key the script touches is passed in KEYS so it
+# also runs on Redis Cluster. Returns [id] for a task whose job was deleted,
+# otherwise [id, attempts]; a task past its attempts is returned without a
+# lease.
+_LEASE_SCRIPT = """
+for _, expired in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])) do
+    redis.call('ZREM', KEYS[2], expired)
+    redis.call('LPUSH', KEYS[1], expired)
+end
+local task_id = redis.call('LPOP', KEYS[1])
+if not task_id then return false end
+if redis.call('HEXISTS', KEYS[3], task_id) == 0 then return {task_id} end
+local attempts = redis.call('HINCRBY', KEYS[3], task_id, 1)
+if attempts <= tonumber(ARGV[4]) then
+    redis.call('HSET', KEYS[4], task_id, ARGV[2])
+    redis.call('ZADD', KEYS[2], ARGV[3], task_id)
+end
+return {task_id, tostring(attempts)}
+"""
+
+# Puts a leased task back on the queue, unless its lease already expired and
+# another worker requeued it. KEYS are the leases and queue keys.
+_RELEASE_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+    redis.call('LPUSH', KEYS[2], ARGV[1])
+end
+"""
+
+
+class RedisBroker:
+    """SQLiteBroker's protocol on a Redis server, so workers can run on any host.
+
+    Plain list, hash, sorted-set and string commands are used, plus two Lua
+    scripts that move a task between the queue and its lease in a single
+    step, so a worker dying in between can't lose the task. Any
+    Redis-compatible server with scripting (or fakeredis with lupa) works.
+    Expired leases are returned to the queue by whichever worker asks for
+    a task next. The default prefix is a hash tag, which keeps the keys the
+    scripts share in one Redis Cluster slot.
+    """
+
+    def __init__(self, client, lease_seconds=120, max_attempts=3, prefix='{ocr}', document_ttl=86400):
+        self.client = client
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.prefix = prefix
+        # Documents of frontends that died without deleting their job expire on their own
+        self.document_ttl = document_ttl
+        self._lease_script = client.register_script(_LEASE_SCRIPT)
+        self._release_script = client.register_script(_RELEASE_SCRIPT)
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + parts)
+
+    def submit(self, job_id, document, suffix, page_numbers):
+        pipe = self.client.pipeline()
+        pipe.set(self._key('doc', job_id), document, ex=self.document_ttl)
+        pipe.set(self._key('job', job_id), json.dumps({'suffix': suffix, 'pages': list(page_numbers)}),
+                 ex=self.document_ttl)
+        pipe.hset(self._key('tasks'), mapping={f'{job_id}:{number}': 0 for number in page_numbers})
+        pipe.rpush(self._key('queue'), *[f'{job_id}:{number}' for number in page_numbers])
+        pipe.execute()
+
+    def lease(self, worker_id):
+        while True:
+            now = time.time()
+            leased = self._lease_script(
+                keys=[self._key('queue'), self._key('leases'), self._key('tasks'), self._key('workers')],
+                args=[now, worker_id, now + self.lease_seconds, self.max_attempts])
+            if not leased:
+                return None
+            task_id, *attempts = map(_text, leased)
+            if not attempts:
+                # Its job was deleted while it was queued
+                continue
+            job_id, _, page = task_id.rpartition(':')
+            task = QueueTask(task_id, job_id, int(page), int(attempts[0]))
+            if task.attempts > self.max_attempts:
+                self._finish(task_id, {'error': f'Lease expired {task.attempts - 1} times'})
+                continue
+            return task
+
+    def document(self, job_id):
+        job = self.client.get(self._key('job', job_id))
+        document = self.client.get(self._key('doc', job_id))
+        if job is None or document is None:
+            return None
+        return json.loads(job)['suffix'], document
+
+    def _finish(self, task_id, result):
+        job_id, _, page = task_id.rpartition(':')
+        pipe = self.client.pipeline()
+        pipe.zrem(self._key('leases'), task_id)
+        # Results only land for jobs that still exist
+        if self.client.exists(self._key('job', job_id)):
+            pipe.hsetnx(self._key('results', job_id), page, json.dumps(result))
+            pipe.expire(self._key('results', job_id), self.document_ttl)
+        pipe.hdel(self._key('tasks'), task_id)
+        pipe.hdel(self._key('workers'), task_id)
+        pipe.execute()
+
+    def complete(self, task_id, result):
+        self._finish(task_id, result)
+
+    def fail(self, task_id, error):
+        attempts = self.client.hget(self._key('tasks'), task_id)
+        if attempts is None:
+            return
+        if int(attempts) >= self.max_attempts:
+            self._finish(task_id, {'error': error})
+        else:
+            self._release_script(keys=[self._key('leases'), self._key('queue')], args=[task_id])
+
+    def take_results(self, job_id):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hgetall(self._key('results', job_id))
+        pipe.delete(self._key('results', job_id))
+        results, _ = pipe.execute()
+        return {int(page): json.loads(result) for page, result in results.items()}
+
+    def delete(self, job_id):
+        job = self.client.get(self._key('job', job_id))
+        pipe = self.client.pipeline()
+        if job is not None:
+            for number in json.loads(job)['pages']:
+                task_id = f'{job_id}:{number}'
+                pipe.hdel(self._key('tasks'), task_id)
+                pipe.hdel(self._key('workers'), task_id)
+                pipe.zrem(self._key('leases'), task_id)
+                pipe.lrem(self._key('queue'), 0, task_id)
+        pipe.delete(self._key('job', job_id), self._key('doc', job_id), self._key('results', job_id))
+        pipe.execute()
+
+    def stats(self):
+        return {'queued': self.client.llen(self._key('queue')), 'leased': self.client.zcard(self._key('leases'))}
+
+
+def open_broker(url, lease_seconds=120, max_attempts=3):
+    """Open the broker at `url`: sqlite:///path/to/queue.db or redis://host:6379/0"""
+    if url.startswith('sqlite:'):
+        path = url[len('sqlite:'):]
+        return SQLiteBroker(path[2:] if path.startswith('//') else path, lease_seconds, max_attempts)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        # Optional dependency, only needed for a Redis broker
+        import redis
+        return RedisBroker(redis.Redis.from_url(url), lease_seconds, max_attempts)
+    raise ValueError(f"Unsupported OCR queue URL '{url}', use sqlite:///path or redis://host:port/db")
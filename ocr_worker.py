@@ -0,0 +1,131 @@
+import os
+import time
+import socket
+import argparse
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pdf_ocr
+from ocr_queue import open_broker
+
+# Stateless OCR worker for the distributed queue (OCR_QUEUE_URL). Run any
+# number of these, on any host that can reach the queue:
+#
+#     OCR_QUEUE_URL=redis://queue-host:6379/0 python ocr_worker.py
+#
+# Each worker leases page tasks, renders and OCRs them with the usual
+# pdf_ocr settings (DPI, two-pass, engine, page cache) on its own pool of
+# OCR_WORKERS processes, and posts the results back to the queue.
+
+# Seconds to wait before asking an empty queue again
+WORKER_IDLE_SLEEP = float(os.environ.get('WORKER_IDLE_SLEEP', 0.5))
+
+
+class DocumentFiles:
+    """The documents of recently leased tasks, fetched from the queue once and kept on local disk.
+
+    Each path handed out by get() must be given back with release(); only
+    documents no task is using are removed to stay within `keep`.
+    """
+
+    def __init__(self, broker, keep):
+        self.broker = broker
+        self.keep = keep
+        self._paths = OrderedDict()  # job_id -> [path, tasks using it], least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, job_id):
+        """Return the local path of a job's document, or None if the job is gone"""
+        with self._lock:
+            entry = self._paths.get(job_id)
+            if entry is not None:
+                self._paths.move_to_end(job_id)
+                entry[1] += 1
+                return entry[0]
+            document = self.broker.document(job_id)
+            if document is None:
+                return None
+            suffix, data = document
+            fd, path = tempfile.mkstemp(suffix=suffix)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            self._paths[job_id] = [path, 1]
+            self._evict()
+            return path
+
+    def release(self, job_id):
+        """Give back a path returned by get()"""
+        with self._lock:
+            self._paths[job_id][1] -= 1
+            self._evict()
+
+    def _evict(self):
+        unused = [job_id for job_id, (_, users) in self._paths.items() if not users]
+        for job_id in unused[:max(0, len(self._paths) - self.keep)]:
+            os.remove(self._paths.pop(job_id)[0])
+
+    def close(self):
+        with self._lock:
+            for path, _ in self._paths.values():
+                os.remove(path)
+            self._paths.clear()
+
+
+def run_worker(broker, worker_id, documents, stop):
+    """Lease and OCR tasks until `stop` is set"""
+    while not stop.is_set():
+        task = broker.lease(worker_id)
+        if task is None:
+            stop.wait(WORKER_IDLE_SLEEP)
+            continue
+        started = time.perf_counter()
+        try:
+            path = documents.get(task.job_id)
+            if path is None:
+                # The frontend gave up on the job; its tasks are already gone
+                continue
+            try:
+                text, details = pdf_ocr.ocr_document_page(path, task.page)
+            finally:
+                documents.release(task.job_id)
+        except Exception as e:
+            print(f"{worker_id}: page {task.page} of job {task.job_id} failed (attempt {task.attempts}): {e}")
+            broker.fail(task.id, str(e))
+            continue
+        broker.complete(task.id, {'text': text, 'details': details, 'worker': worker_id,
+                                  'seconds': time.perf_counter() - started})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='OCR worker for the distributed page queue')
+    parser.add_argument('--queue', default=pdf_ocr.OCR_QUEUE_URL,
+                        help='queue URL, sqlite:///path/queue.db or redis://host:port/db (default: OCR_QUEUE_URL)')
+    parser.add_argument('--concurrency', type=int, default=pdf_ocr.OCR_WORKERS,
+                        help='pages OCR\'d at once (default: OCR_WORKERS)')
+    args = parser.parse_args()
+    if not args.queue:
+        parser.error('set OCR_QUEUE_URL or pass --queue')
+
+    broker = open_broker(args.queue, pdf_ocr.OCR_QUEUE_LEASE, pdf_ocr.OCR_QUEUE_MAX_ATTEMPTS)
+    # This process OCRs the pages itself rather than queueing them again
+    pdf_ocr.OCR_QUEUE_URL = ''
+    pdf_ocr.start_ocr_pool()
+
+    documents = DocumentFiles(broker, keep=args.concurrency * 2)
+    stop = threading.Event()
+    name = f'{socket.gethostname()}-{os.getpid()}'
+    threads = [threading.Thread(target=run_worker, args=(broker, f'{name}-{i}', documents, stop), daemon=True)
+               for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    print(f"Worker {name} taking OCR tasks from {args.queue} with concurrency {args.concurrency}")
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        documents.close()
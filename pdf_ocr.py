@@ -1,18 +1,1020 @@
 import os
+import sys
+import atexit
+import collections
+import argparse
+import difflib
+import glob
+import hashlib
+import itertools
+import json
+import re
+import time
+import uuid
+import contextvars
+import zipfile
+import subprocess
 import tempfile
-from flask import Flask, request, jsonify
-from PIL import Image
+import unicodedata
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from flask import Flask, Request, Response, request, jsonify
+from PIL import Image, ImageOps
 import pytesseract
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_path, pdfinfo_from_path
 from werkzeug.utils import secure_filename
+from ocr_cache import OCRCache, make_key
+from ocr_engine import create_engine, resolve_engine
+from ocr_preprocess import PageSignature, binarize, choose_dpi
+from ocr_jobs import JobManager, QueueFull
+from ocr_queue import open_broker
+from admission import AdmissionController, FairScheduler, Overloaded, parse_weights
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, StageTimings
+from resume_parser import find_fields
+
+class TimedRequest(Request):
+    # Multipart parsing happens lazily on first access to request.files
+    def _load_form_data(self):
+        with timings.stage('upload'):
+            super()._load_form_data()
 
 app = Flask(__name__)
+app.request_class = TimedRequest
 
 # Path to Tesseract executable
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+pytesseract.pytesseract.tesseract_cmd = os.environ.get('TESSERACT_CMD', r'C:\Program Files\Tesseract-OCR\tesseract.exe')
+
+# Path to Poppler; set POPPLER_PATH empty to use the binaries on PATH
+POPPLER_PATH = os.environ.get('POPPLER_PATH', r'C:\Program Files\poppler\bin') or None
+
+# OCR worker pool: one Tesseract job per worker process. Keep
+# OCR_WORKERS * OCR_THREADS_PER_WORKER at or below the core count so
+# Tesseract's own OpenMP threads don't oversubscribe the CPU.
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', os.cpu_count() or 1))
+OCR_THREADS_PER_WORKER = int(os.environ.get('OCR_THREADS_PER_WORKER', 1))
+
+# OCR backend: 'pytesseract' runs the tesseract binary per page,
+# 'tesserocr' keeps a libtesseract handle loaded in every worker (falls back
+# to pytesseract when tesserocr isn't installed)
+OCR_ENGINE = os.environ.get('OCR_ENGINE', 'pytesseract')
+
+# Rendering and recognition settings. These are part of every cache key.
+OCR_DPI = int(os.environ.get('OCR_DPI', 200))
+OCR_LANG = os.environ.get('OCR_LANG', 'eng')
+OCR_PSM = int(os.environ.get('OCR_PSM', 3))
+
+# Preprocessing before OCR. Grayscale rendering carries all the information
+# Tesseract uses at a third of the size. With OCR_ADAPTIVE_DPI each page is
+# first rendered at OCR_PREVIEW_DPI to measure its text lines, then rendered
+# at the DPI that makes them about OCR_TARGET_LINE_PX tall (within
+# OCR_MIN_DPI..OCR_MAX_DPI, and at most OCR_MAX_MEGAPIXELS per page).
+# OCR_BINARIZE thresholds pages to black and white before recognition.
+OCR_GRAYSCALE = os.environ.get('OCR_GRAYSCALE', '1') == '1'
+OCR_ADAPTIVE_DPI = os.environ.get('OCR_ADAPTIVE_DPI', '0') == '1'
+OCR_PREVIEW_DPI = int(os.environ.get('OCR_PREVIEW_DPI', 72))
+OCR_TARGET_LINE_PX = int(os.environ.get('OCR_TARGET_LINE_PX', 32))
+OCR_MIN_DPI = int(os.environ.get('OCR_MIN_DPI', 100))
+OCR_MAX_DPI = int(os.environ.get('OCR_MAX_DPI', 300))
+OCR_MAX_MEGAPIXELS = float(os.environ.get('OCR_MAX_MEGAPIXELS', 25))
+OCR_BINARIZE = os.environ.get('OCR_BINARIZE', '0') == '1'
+
+# Two-pass OCR: PDF pages are first rendered and OCR'd at OCR_FAST_DPI. Only
+# pages whose mean word confidence (0-100) is below OCR_MIN_CONFIDENCE are
+# rendered again at the full DPI above and OCR'd a second time, keeping
+# whichever pass is more confident. OCR_FAST_DPI=0 OCRs every page once at
+# the full DPI.
+OCR_FAST_DPI = int(os.environ.get('OCR_FAST_DPI', 150))
+OCR_MIN_CONFIDENCE = float(os.environ.get('OCR_MIN_CONFIDENCE', 75))
+
+# Pages rendered per window when streaming a PDF through OCR. Only the
+# current and next window are held in memory; 0 renders the whole
+# document at once.
+OCR_STREAM_WINDOW = int(os.environ.get('OCR_STREAM_WINDOW', 8))
+
+# Text-layer fast path: a page whose native text has at least
+# TEXT_LAYER_MIN_CHARS non-space characters, of which at least
+# TEXT_LAYER_MIN_QUALITY are letters, digits or punctuation, skips OCR.
+TEXT_LAYER_MIN_CHARS = int(os.environ.get('TEXT_LAYER_MIN_CHARS', 50))
+TEXT_LAYER_MIN_QUALITY = float(os.environ.get('TEXT_LAYER_MIN_QUALITY', 0.8))
+
+# OCR result cache: in-memory LRU in front of an on-disk store, each with
+# its own size budget (0 disables a tier)
+OCR_CACHE_DIR = os.environ.get('OCR_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'pdf_ocr_cache'))
+OCR_CACHE_MEMORY_MB = int(os.environ.get('OCR_CACHE_MEMORY_MB', 64))
+OCR_CACHE_DISK_MB = int(os.environ.get('OCR_CACHE_DISK_MB', 1024))
+
+# Asynchronous jobs (/jobs): documents processed concurrently, how many may
+# wait before new submissions get a 429, and how long results are kept
+JOB_RUNNERS = int(os.environ.get('JOB_RUNNERS', 2))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 32))
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 3600))
+
+# Batch requests (/process-batch): how many documents are extracted at
+# once (their pages share the OCR worker pool), how many files, after
+# unpacking zip archives, one request may contain, and how many MB its
+# archives may unpack to (checked before anything is unpacked)
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', OCR_WORKERS))
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 200))
+BATCH_MAX_UNPACKED_MB = int(os.environ.get('BATCH_MAX_UNPACKED_MB', 1024))
+
+# Distributed OCR: with OCR_QUEUE_URL set, pages that need OCR become tasks
+# on a shared queue instead of going to this process's pool, and any number
+# of `python ocr_worker.py` processes lease and OCR them. Use
+# sqlite:///path/queue.db for workers on this host, or redis://host:6379/0
+# for workers on other hosts. A task whose worker doesn't report back within
+# OCR_QUEUE_LEASE seconds is handed to another worker, up to
+# OCR_QUEUE_MAX_ATTEMPTS times. A request fails if no page of its document
+# finishes for OCR_QUEUE_TIMEOUT seconds.
+OCR_QUEUE_URL = os.environ.get('OCR_QUEUE_URL', '')
+OCR_QUEUE_LEASE = float(os.environ.get('OCR_QUEUE_LEASE', 120))
+OCR_QUEUE_MAX_ATTEMPTS = int(os.environ.get('OCR_QUEUE_MAX_ATTEMPTS', 3))
+OCR_QUEUE_TIMEOUT = float(os.environ.get('OCR_QUEUE_TIMEOUT', 600))
+
+# Admission control for /process-pdfs and /process-batch: at most
+# ADMISSION_MAX_ACTIVE requests are extracted at once (0 turns it off; their
+# pages share the pool in fair order, so this can be well above OCR_WORKERS),
+# at most ADMISSION_PER_CLIENT of them for one client, and the rest wait in
+# weighted fair order, smallest documents first. A request whose estimated
+# wait exceeds ADMISSION_MAX_WAIT seconds, or that would be more than
+# ADMISSION_MAX_QUEUED waiting for its client, gets a 429 with a Retry-After
+# header. Clients are told apart by ADMISSION_CLIENT_HEADER (set it at a
+# trusted proxy or in the n8n workflow), or by address without it.
+# ADMISSION_WEIGHTS such as 'tenant-a=2,tenant-b=0.5' give clients a larger or
+# smaller share; the same weights order pages on the OCR pool.
+ADMISSION_MAX_ACTIVE = int(os.environ.get('ADMISSION_MAX_ACTIVE', max(4, 2 * OCR_WORKERS)))
+ADMISSION_PER_CLIENT = int(os.environ.get('ADMISSION_PER_CLIENT', 2))
+ADMISSION_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', 30))
+ADMISSION_MAX_QUEUED = int(os.environ.get('ADMISSION_MAX_QUEUED', 8))
+ADMISSION_CLIENT_HEADER = os.environ.get('ADMISSION_CLIENT_HEADER', 'X-Client-Id')
+ADMISSION_WEIGHTS = parse_weights(os.environ.get('ADMISSION_WEIGHTS', ''))
+
+STREAM_MIMETYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+
+# Pages are summarised before OCR so blank ones can be skipped and, if
+# enabled, near duplicates of an earlier page in the same document reuse its
+# text. OCR_BLANK_MAX_INK is the share of a downscaled page that may be ink
+# for it to count as blank; OCR_DUPLICATE_MIN_SIMILARITY is how closely
+# (0-1) two pages' normalised thumbnails must correlate to be candidates,
+# e.g. 0.75. 0 disables either check; duplicate detection is off by default,
+# since forms that differ in a few words look alike. A candidate's text is
+# only reused once a quick OCR of both pages at half scale reads the same.
+OCR_BLANK_MAX_INK = float(os.environ.get('OCR_BLANK_MAX_INK', 0.0003))
+OCR_DUPLICATE_MIN_SIMILARITY = float(os.environ.get('OCR_DUPLICATE_MIN_SIMILARITY', 0))
+# Earlier pages a page is compared against (each keeps a half-scale copy, ~1-2MB, while the document runs)
+OCR_DUPLICATE_LOOKBACK = 32
+
+# Fields a request can ask extraction to stop at once they have all been found
+STOP_FIELDS = ('email', 'phone', 'linkedin')
+
+# Image uploads are OCR'd directly, one page per frame
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.webp')
+
+_ocr_pool = None
+_page_scheduler = None
+_admission = None
+_ocr_cache = None
+_ocr_queue = None
+_job_manager = None
+_engine_id = None
+
+# Threads are only started as documents are submitted, so this costs nothing until the first batch
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix='ocr-batch')
+
+# Per-worker OCR engine, created by the pool initializer
+_engine = None
+
+# Client whose pages are being OCR'd, for fair scheduling on the pool
+_client = contextvars.ContextVar('ocr_client', default=None)
+
+# Prometheus metrics served at /metrics. Stage timings also go out per
+# request in the Server-Timing header.
+metrics = MetricsRegistry()
+timings = StageTimings(metrics.histogram(
+    'pdf_ocr_stage_seconds', 'Time spent in each processing stage (ocr is summed across workers)', ['stage']))
+request_seconds = metrics.histogram('pdf_ocr_request_seconds', 'Request handling time', ['route', 'status'])
+pages_in_flight = metrics.gauge('pdf_ocr_pages_in_flight', 'Pages submitted to the OCR pool and not yet recognised')
+pages_processed = metrics.counter('pdf_ocr_pages_processed_total', 'Pages extracted, by source', ['source'])
+second_pass_pages = metrics.counter('pdf_ocr_second_pass_pages_total',
+                                    'Pages OCR\'d again at full DPI after a low-confidence first pass')
+bytes_processed = metrics.counter('pdf_ocr_bytes_processed_total', 'Bytes of uploaded documents spooled for extraction')
+metrics.gauge('pdf_ocr_pages_waiting', 'Pages waiting for their fair turn on the OCR pool',
+              fn=lambda: _page_scheduler.waiting() if _page_scheduler else 0)
+metrics.gauge('pdf_ocr_admission_requests', 'Requests running or waiting for admission, by state', ['state'],
+              fn=lambda: [({'state': state}, get_admission().stats()[state]) for state in ('active', 'waiting')]
+              if _admission else [])
+metrics.counter('pdf_ocr_admission_decisions_total', 'Requests admitted or turned away with a 429', ['decision'],
+                fn=lambda: [({'decision': decision}, get_admission().stats()[decision])
+                            for decision in ('admitted', 'rejected')] if _admission else [])
+metrics.gauge('pdf_ocr_job_queue_depth', 'Jobs waiting for a runner',
+              fn=lambda: _job_manager.queue_depth() if _job_manager else 0)
+metrics.gauge('pdf_ocr_queue_tasks', 'Page tasks on the distributed OCR queue, by state', ['state'],
+              fn=lambda: [({'state': state}, count) for state, count in get_ocr_queue().stats().items()]
+              if OCR_QUEUE_URL else [])
+metrics.gauge('pdf_ocr_cache_hit_ratio', 'Share of result cache lookups that hit',
+              fn=lambda: get_ocr_cache().stats()['hit_ratio'])
+metrics.counter('pdf_ocr_cache_lookups_total', 'Result cache lookups, by outcome', ['result'],
+                fn=lambda: [({'result': result}, get_ocr_cache().stats()[result])
+                            for result in ('memory_hits', 'disk_hits', 'misses')])
+metrics.gauge('pdf_ocr_cache_bytes', 'Bytes held by each result cache tier', ['tier'],
+              fn=lambda: [({'tier': tier}, get_ocr_cache().stats()[f'{tier}_bytes']) for tier in ('memory', 'disk')])
+
+def _init_ocr_worker(tesseract_cmd, threads, engine, lang, psm):
+    global _engine
+    # Read by libtesseract in this process and inherited by any tesseract subprocess
+    os.environ['OMP_THREAD_LIMIT'] = str(threads)
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    _engine = create_engine(engine, lang, psm)
+
+def _ocr_page(page, binarized=False):
+    """OCR one page in a worker, returning (text, mean word confidence, seconds spent)"""
+    started = time.perf_counter()
+    if binarized:
+        page = binarize(page)
+    text, confidence = _engine.recognize(page)
+    return text.strip(), confidence, time.perf_counter() - started
+
+def _worker_engine_id():
+    return f'{_engine.name}-{_engine.version()}'
+
+def start_ocr_pool():
+    """Start the shared OCR worker pool (no-op if already running)"""
+    global _ocr_pool
+    if _ocr_pool is None:
+        engine = resolve_engine(OCR_ENGINE)
+        _ocr_pool = ProcessPoolExecutor(
+            max_workers=OCR_WORKERS,
+            initializer=_init_ocr_worker,
+            initargs=(pytesseract.pytesseract.tesseract_cmd, OCR_THREADS_PER_WORKER, engine, OCR_LANG, OCR_PSM)
+        )
+        print(f"Started OCR pool with {OCR_WORKERS} {engine} workers, {OCR_THREADS_PER_WORKER} thread(s) each")
+    return _ocr_pool
+
+@atexit.register
+def shutdown_ocr_pool():
+    global _ocr_pool
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown(cancel_futures=True)
+        _ocr_pool = None
+
+def get_page_scheduler():
+    """Return the scheduler that hands pages to the OCR pool in fair order across clients"""
+    global _page_scheduler
+    if _page_scheduler is None:
+        # One page per worker plus one queued keeps the pool busy; the rest wait in fair order
+        _page_scheduler = FairScheduler(start_ocr_pool, OCR_WORKERS + 1, ADMISSION_WEIGHTS)
+    return _page_scheduler
+
+def get_admission():
+    """Return the admission controller of the extraction routes, or None if it is turned off"""
+    global _admission
+    if _admission is None and ADMISSION_MAX_ACTIVE > 0:
+        _admission = AdmissionController(ADMISSION_MAX_ACTIVE, ADMISSION_PER_CLIENT, ADMISSION_MAX_WAIT,
+                                         ADMISSION_MAX_QUEUED, ADMISSION_WEIGHTS)
+    return _admission
+
+def get_ocr_cache():
+    """Return the shared OCR result cache, creating it on first use"""
+    global _ocr_cache
+    if _ocr_cache is None:
+        _ocr_cache = OCRCache(OCR_CACHE_DIR, OCR_CACHE_MEMORY_MB * 1024 * 1024,
+                              OCR_CACHE_DISK_MB * 1024 * 1024)
+    return _ocr_cache
+
+def get_ocr_queue():
+    """Return the broker of the distributed OCR queue, opening it on first use"""
+    global _ocr_queue
+    if _ocr_queue is None:
+        _ocr_queue = open_broker(OCR_QUEUE_URL, OCR_QUEUE_LEASE, OCR_QUEUE_MAX_ATTEMPTS)
+        print(f"Sending OCR pages to the queue at {OCR_QUEUE_URL}")
+    return _ocr_queue
+
+def ocr_params():
+    """Settings that change OCR output, used to key cached results"""
+    global _engine_id
+    if OCR_QUEUE_URL:
+        # The workers' engine isn't known here, only which one they are configured with
+        _engine_id = _engine_id or f'queue-{OCR_ENGINE}'
+    if _engine_id is None:
+        # Ask a worker, so the version comes from the engine that actually runs
+        try:
+            _engine_id = start_ocr_pool().submit(_worker_engine_id).result()
+        except Exception as e:
+            print(f"Could not determine OCR engine version: {e}")
+    if OCR_ADAPTIVE_DPI:
+        dpi = f'auto-{OCR_TARGET_LINE_PX}px-{OCR_MIN_DPI}-{OCR_MAX_DPI}-{OCR_MAX_MEGAPIXELS}mp'
+    else:
+        dpi = OCR_DPI
+    return {'dpi': dpi, 'grayscale': OCR_GRAYSCALE, 'binarize': OCR_BINARIZE,
+            'two_pass': [OCR_FAST_DPI, OCR_MIN_CONFIDENCE] if two_pass_enabled() else None,
+            'lang': OCR_LANG, 'psm': OCR_PSM, 'engine': _engine_id or 'unknown'}
+
+def two_pass_enabled():
+    # A first pass is only worth it if it renders fewer pixels than the full pass
+    return bool(OCR_FAST_DPI) and (OCR_ADAPTIVE_DPI or OCR_FAST_DPI < OCR_DPI)
+
+def _image_digest(image):
+    digest = hashlib.sha256(f'{image.mode}{image.size}'.encode('utf-8'))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def _page_windows(page_numbers, size):
+    """Split page numbers into runs of consecutive pages at most `size` long"""
+    window = []
+    for number in page_numbers:
+        if window and (number != window[-1] + 1 or len(window) == size):
+            yield window
+            window = []
+        window.append(number)
+    if window:
+        yield window
+
+def _render(pdf_path, first_page, last_page, dpi, grayscale):
+    with timings.stage('render'):
+        return convert_from_path(pdf_path, dpi=dpi, grayscale=grayscale, first_page=first_page,
+                                 last_page=last_page, poppler_path=POPPLER_PATH)
+
+def _window_dpis(pdf_path, window):
+    """Choose a render DPI for each page in the window from a cheap preview render"""
+    if not OCR_ADAPTIVE_DPI:
+        return [OCR_DPI] * len(window)
+    previews = _render(pdf_path, window[0], window[-1], OCR_PREVIEW_DPI, True)
+    return [choose_dpi(preview, OCR_PREVIEW_DPI, OCR_TARGET_LINE_PX, OCR_MIN_DPI, OCR_MAX_DPI,
+                       OCR_MAX_MEGAPIXELS * 1000000, OCR_DPI)
+            for preview in previews]
+
+def render_pages(pdf_path, page_numbers, window_size=None, dpi=None):
+    """Render the given pages a window at a time, yielding (page_numbers, images).
+
+    Pages are rendered at `dpi` if given, otherwise at OCR_DPI or the adaptive DPI.
+    """
+    if window_size is None:
+        window_size = OCR_STREAM_WINDOW
+    for window in _page_windows(page_numbers, window_size):
+        images = []
+        dpis = [dpi] * len(window) if dpi else _window_dpis(pdf_path, window)
+        # Consecutive pages that need the same DPI are rendered in one poppler call
+        for dpi, group in itertools.groupby(zip(window, dpis), key=lambda item: item[1]):
+            group = [number for number, _ in group]
+            images.extend(_render(pdf_path, group[0], group[-1], dpi, OCR_GRAYSCALE))
+        yield window, images
+        del images
+
+def _submit_ocr(image, cache, params):
+    """Look a page up in the cache or send it to the pool, returning (key, result, cached).
+
+    `result` is (text, confidence) if cached, otherwise a future.
+    """
+    key = None
+    if cache is not None:
+        key = make_key(_image_digest(image), params)
+        cached = cache.get(key)
+        if cached is not None:
+            return key, tuple(cached), True
+    future = get_page_scheduler().submit(_client.get(), _ocr_page, image, OCR_BINARIZE)
+    pages_in_flight.inc()
+    future.add_done_callback(lambda future: pages_in_flight.dec())
+    return key, future, False
+
+def _finish_ocr(key, result, cache):
+    """Wait for a page submitted by _submit_ocr, returning (text, confidence)"""
+    if isinstance(result, tuple):
+        return result
+    text, confidence, seconds = result.result()
+    timings.record('ocr', seconds)
+    if cache is not None:
+        cache.put(key, [text, confidence])
+    return text, confidence
+
+def _round_confidence(confidence):
+    return None if confidence is None else round(confidence, 1)
+
+def _collect_pages(pending, cache, params, rerender):
+    """Finish OCRing a window, running the second pass on its weak pages, and yield its pages in order"""
+    weak = []
+    for number, key, slot, details in pending:
+        if details['method'] != 'ocr':
+            continue
+        slot['result'] = _finish_ocr(key, slot['result'], cache)
+        confidence = slot['result'][1]
+        details['confidence'] = _round_confidence(confidence)
+        if rerender is not None and (confidence is None or confidence < OCR_MIN_CONFIDENCE):
+            weak.append(number)
+
+    second = {}
+    try:
+        if weak:
+            # Render all of the window's weak pages before waiting on any, so the pool has them together
+            for number, image in zip(weak, rerender(weak)):
+                second[number] = _submit_ocr(image, cache, params)
+            second_pass_pages.inc(len(weak))
+
+        for number, _, slot, details in pending:
+            if number in second:
+                key, result, cached = second.pop(number)
+                text, confidence = _finish_ocr(key, result, cache)
+                first_confidence = slot['result'][1]
+                details.update(passes=2, first_pass_confidence=_round_confidence(first_confidence),
+                               cached=details['cached'] and cached)
+                if confidence is not None and (first_confidence is None or confidence >= first_confidence):
+                    slot['result'] = (text, confidence)
+                    details['confidence'] = _round_confidence(confidence)
+            confirm = details.pop('confirm', None)
+            if confirm is not None and not _same_words(_check_text(confirm[0], cache, params),
+                                                       _check_text(confirm[1], cache, params)):
+                # The pages only looked alike, so this one is OCR'd after all
+                key, result, cached = _submit_ocr(confirm[2], cache, params)
+                text, confidence = _finish_ocr(key, result, cache)
+                yield number, text, {'method': 'ocr', 'cached': cached, 'confidence': _round_confidence(confidence)}
+                continue
+            # Duplicates share their original's slot, which is always finished first
+            yield number, slot['result'][0], details
+    finally:
+        for _, result, _ in second.values():
+            if not isinstance(result, tuple):
+                result.cancel()
+
+def _find_duplicate(signature, seen):
+    """Return the (page_number, signature, slot, check) entry of an earlier page that `signature` matches"""
+    if not OCR_DUPLICATE_MIN_SIMILARITY:
+        return None
+    return next((entry for entry in seen if signature.matches(entry[1], OCR_DUPLICATE_MIN_SIMILARITY)), None)
+
+def _check_text(check, cache, params):
+    """Text of a page OCR'd at half scale to confirm a duplicate: `check` holds the 'image' or its 'submitted' OCR"""
+    if 'text' not in check:
+        key, result, _ = check.pop('submitted', None) or _submit_ocr(check.pop('image'), cache, params)
+        check['text'] = _finish_ocr(key, result, cache)[0]
+    return check['text']
+
+def _same_words(first, second):
+    return re.findall(r'\w+', first.lower()) == re.findall(r'\w+', second.lower())
+
+def _ocr_windows(windows, use_cache, rerender=None):
+    """OCR (page_numbers, images) windows on the pool, yielding (page_number, text, details) in order.
+
+    `details` is {'method': 'ocr', 'cached': ..., 'confidence': ...},
+    {'method': 'blank'} for pages skipped as blank, or
+    {'method': 'duplicate', 'duplicate_of': n} for pages that reuse the text
+    of an earlier near-identical page. Such a page and its original are
+    first OCR'd at half scale, and the page is OCR'd in full unless both
+    read the same words.
+
+    The next window is produced while the current one is being OCR'd, so
+    the pool stays busy and at most two windows are in memory at a time.
+    Pages are cached by their pixels, so a page shared with an earlier
+    document is not OCR'd again. If `rerender(page_numbers)` is given, it
+    yields full-resolution images of the pages whose first pass came out
+    below OCR_MIN_CONFIDENCE, and those are OCR'd again.
+    """
+    cache = get_ocr_cache() if use_cache else None
+    params = ocr_params()
+    pending = submitted = []
+    # (page_number, signature, slot, check) of the pages OCR'd most recently.
+    # A slot holds a page's future, replaced by (text, confidence) once done;
+    # a check holds the page at half scale for confirming duplicates of it.
+    seen = collections.deque(maxlen=OCR_DUPLICATE_LOOKBACK)
+    try:
+        for window, images in windows:
+            submitted = []
+            for number, image in zip(window, images):
+                signature = None
+                if OCR_BLANK_MAX_INK or OCR_DUPLICATE_MIN_SIMILARITY:
+                    with timings.stage('classify'):
+                        signature = PageSignature(image)
+                        original = None if signature.ink < OCR_BLANK_MAX_INK else _find_duplicate(signature, seen)
+                    if signature.ink < OCR_BLANK_MAX_INK:
+                        submitted.append((number, None, {'result': ('', None)}, {'method': 'blank'}))
+                        continue
+                    if original is not None:
+                        check, original_check = {'submitted': _submit_ocr(image.reduce(2), cache, params)}, original[3]
+                        if 'image' in original_check:
+                            original_check['submitted'] = _submit_ocr(original_check.pop('image'), cache, params)
+                        submitted.append((number, None, original[2],
+                                          {'method': 'duplicate', 'duplicate_of': original[0],
+                                           'confirm': (check, original_check, image)}))
+                        continue
+
+                key, result, cached = _submit_ocr(image, cache, params)
+                slot = {'result': result}
+                if signature is not None and OCR_DUPLICATE_MIN_SIMILARITY:
+                    seen.append((number, signature, slot, {'image': image.reduce(2)}))
+                submitted.append((number, key, slot, {'method': 'ocr', 'cached': cached}))
+            del images
+            yield from _collect_pages(pending, cache, params, rerender)
+            pending = submitted
+        yield from _collect_pages(pending, cache, params, rerender)
+    finally:
+        # If the caller stopped early, drop the pages still queued for the pool
+        for _, _, slot, details in itertools.chain(pending, submitted):
+            if not isinstance(slot['result'], tuple):
+                slot['result'].cancel()
+            for check in details.get('confirm', ())[:2]:
+                result = check.get('submitted', (None, ()))[1]
+                if not isinstance(result, tuple):
+                    result.cancel()
+
+def iter_ocr_pdf(pdf_path, page_numbers, window_size=None, use_cache=True):
+    """OCR pages of a PDF on disk, yielding (page_number, text, details) in page order"""
+    if not two_pass_enabled():
+        return _ocr_windows(render_pages(pdf_path, page_numbers, window_size), use_cache)
+
+    def rerender(page_numbers):
+        for _, images in render_pages(pdf_path, page_numbers, window_size=0):
+            yield from images
+
+    return _ocr_windows(render_pages(pdf_path, page_numbers, window_size, dpi=OCR_FAST_DPI), use_cache, rerender)
+
+def is_image_file(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+def _prepare_frame(frame):
+    # Decodes just this frame; bilevel fax pages stay 1 bit per pixel
+    frame = ImageOps.exif_transpose(frame)
+    if frame.mode == '1' or frame.mode == 'L' or (frame.mode == 'RGB' and not OCR_GRAYSCALE):
+        return frame.copy()
+    return frame.convert('L' if OCR_GRAYSCALE else 'RGB')
+
+def image_frames(image_path, page_numbers, window_size=None):
+    """Decode the given frames of an image file a window at a time, yielding (page_numbers, images).
+
+    Multi-page TIFFs are read frame by frame, so only the current window is
+    ever decoded and unrequested frames never are.
+    """
+    if window_size is None:
+        window_size = OCR_STREAM_WINDOW
+    with Image.open(image_path) as image:
+        window, images = [], []
+        for number in page_numbers:
+            with timings.stage('decode'):
+                image.seek(number - 1)
+                images.append(_prepare_frame(image))
+            window.append(number)
+            if len(window) == window_size:
+                yield window, images
+                window, images = [], []
+        if window:
+            yield window, images
+
+def iter_ocr_image(image_path, page_numbers, window_size=None, use_cache=True):
+    """OCR frames of an image file, yielding (page_number, text, details) in frame order"""
+    return _ocr_windows(image_frames(image_path, page_numbers, window_size), use_cache)
+
+def ocr_document_page(path, page_number):
+    """OCR one page of a PDF or image on disk in this process, returning (text, details)"""
+    pages = (iter_ocr_image if is_image_file(path) else iter_ocr_pdf)(path, [page_number])
+    try:
+        _, text, details = next(pages)
+    finally:
+        pages.close()
+    return text, details
+
+def iter_ocr_queue(path, page_numbers):
+    """OCR pages of a PDF or image on the distributed queue, yielding (page_number, text, details) in order.
+
+    Workers render, OCR and cache pages themselves; here the document is
+    handed over once and the results are put back in page order. Each
+    worker sees one page at a time, so near-duplicate pages are not
+    detected across the document.
+    """
+    page_numbers = list(page_numbers)
+    if not page_numbers:
+        return
+    broker = get_ocr_queue()
+    job_id = uuid.uuid4().hex
+    with open(path, 'rb') as f:
+        broker.submit(job_id, f.read(), os.path.splitext(path)[1], page_numbers)
+    results = {}
+    try:
+        for number in page_numbers:
+            deadline = time.monotonic() + OCR_QUEUE_TIMEOUT
+            delay = 0.05
+            while number not in results:
+                finished = broker.take_results(job_id)
+                if finished:
+                    results.update(finished)
+                    deadline = time.monotonic() + OCR_QUEUE_TIMEOUT
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"No OCR worker finished a page in {OCR_QUEUE_TIMEOUT:g}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+            result = results.pop(number)
+            if 'error' in result:
+                raise RuntimeError(f"OCR of page {number} failed: {result['error']}")
+            timings.record('ocr', result['seconds'])
+            yield number, result['text'], dict(result['details'], worker=result['worker'])
+    finally:
+        # Also withdraws the pages still queued if the caller stopped early
+        broker.delete(job_id)
+
+def _iter_ocr(path, page_numbers):
+    """OCR pages of a PDF or image on the queue if one is configured, otherwise on the local pool"""
+    if OCR_QUEUE_URL:
+        return iter_ocr_queue(path, page_numbers)
+    if is_image_file(path):
+        return iter_ocr_image(path, page_numbers)
+    return iter_ocr_pdf(path, page_numbers)
+
+def _poppler_cmd(name):
+    if POPPLER_PATH and os.path.isdir(POPPLER_PATH):
+        return os.path.join(POPPLER_PATH, name)
+    return name
+
+def extract_text_layer(pdf_path, first_page, last_page):
+    """Return the native text layer of each page in the range using pdftotext"""
+    with timings.stage('text_layer'):
+        output = subprocess.run(
+            [_poppler_cmd('pdftotext'), '-q', '-enc', 'UTF-8',
+             '-f', str(first_page), '-l', str(last_page), pdf_path, '-'],
+            capture_output=True, check=True
+        ).stdout
+    # pdftotext ends every page with a form feed
+    texts = output.decode('utf-8', errors='replace').split('\f')
+    return texts[:last_page - first_page + 1]
+
+def is_usable_text(text):
+    """Check whether a page's text layer is good enough to skip OCR"""
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < TEXT_LAYER_MIN_CHARS:
+        return False
+    # Broken font encodings come out as control, private-use or replacement characters
+    good = sum(1 for c in chars if unicodedata.category(c)[0] in 'LNP')
+    return good / len(chars) >= TEXT_LAYER_MIN_QUALITY
+
+def _page_source(details):
+    if details['method'] == 'ocr':
+        return 'page_cache' if details['cached'] else 'ocr'
+    return details['method']
+
+def iter_extract_pdf(pdf_path, page_numbers):
+    """Extract text from a PDF on disk, yielding one result dict per page in order.
+
+    Pages with a usable text layer are returned as-is; only the rest are
+    rendered and OCR'd.
+    """
+    page_numbers = list(page_numbers)
+    if not page_numbers:
+        return
+
+    native = {}
+    try:
+        # One pdftotext call per run of consecutive pages, so unrequested pages are never read
+        for run in _page_windows(page_numbers, 0):
+            texts = extract_text_layer(pdf_path, run[0], run[-1])
+            native.update((number, text) for number, text in zip(run, texts) if is_usable_text(text))
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Text layer extraction failed, falling back to OCR: {e}")
+        native = {}
+
+    ocr_pages = [number for number in page_numbers if number not in native]
+    print(f"{len(native)} page(s) from text layer, {len(ocr_pages)} page(s) need OCR")
+    ocr_results = _iter_ocr(pdf_path, ocr_pages)
+
+    try:
+        for number in page_numbers:
+            if number in native:
+                pages_processed.inc(source='text_layer')
+                yield {'page': number, 'method': 'text_layer', 'text': native[number].strip()}
+            else:
+                _, text, details = next(ocr_results)
+                pages_processed.inc(source=_page_source(details))
+                yield dict(details, page=number, text=text)
+    finally:
+        # Cancels outstanding OCR if the caller stops early
+        ocr_results.close()
+
+def _spool_upload(stream, path):
+    """Copy an uploaded file stream to disk, returning its SHA-256 hex digest"""
+    digest = hashlib.sha256()
+    with timings.stage('spool'), open(path, 'wb') as out:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+            digest.update(chunk)
+            out.write(chunk)
+            bytes_processed.inc(len(chunk))
+    return digest.hexdigest()
+
+def _start_cached_extraction(key, digest, options, count_pages, iter_pages):
+    """Replay a cached extraction, or start a new one that is cached once fully consumed"""
+    cache = get_ocr_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        print(f"Cache hit for {digest}")
+        page_numbers = select_pages(len(cached), options)
+        wanted = set(page_numbers)
+        pages_processed.inc(len(page_numbers), source='document_cache')
+        return len(cached), page_numbers, 'hit', (page for page in cached if page['page'] in wanted)
+
+    page_count = count_pages()
+    page_numbers = select_pages(page_count, options)
+
+    def pages():
+        page_results = []
+        for page in iter_pages(page_numbers):
+            page_results.append(page)
+            yield page
+        # Only an extraction of every page can stand in for the document
+        if len(page_results) == page_count:
+            cache.put(key, page_results)
+
+    return page_count, page_numbers, 'miss', pages()
+
+def start_extract_pdf(pdf_path, digest, options):
+    """Begin extracting text from a PDF on disk whose SHA-256 is `digest`"""
+    key = make_key(digest, dict(ocr_params(), kind='document',
+                                text_layer=[TEXT_LAYER_MIN_CHARS, TEXT_LAYER_MIN_QUALITY],
+                                skip=[OCR_BLANK_MAX_INK, OCR_DUPLICATE_MIN_SIMILARITY]))
+
+    def count_pages():
+        page_count = pdfinfo_from_path(pdf_path, poppler_path=POPPLER_PATH)['Pages']
+        print(f"PDF has {page_count} pages")
+        return page_count
+
+    # Use the text layer where possible, OCR the remaining pages window by window
+    return _start_cached_extraction(key, digest, options, count_pages,
+                                    lambda page_numbers: iter_extract_pdf(pdf_path, page_numbers))
+
+def start_extract_image(image_path, digest, options):
+    """Begin OCRing an image file on disk whose SHA-256 is `digest`, one page per frame"""
+    key = make_key(digest, dict(ocr_params(), kind='image', skip=[OCR_BLANK_MAX_INK, OCR_DUPLICATE_MIN_SIMILARITY]))
+
+    def count_pages():
+        with Image.open(image_path) as image:
+            frame_count = getattr(image, 'n_frames', 1)
+        print(f"Image has {frame_count} frame(s)")
+        return frame_count
+
+    def iter_pages(page_numbers):
+        for number, text, details in _iter_ocr(image_path, page_numbers):
+            pages_processed.inc(source=_page_source(details))
+            yield dict(details, page=number, text=text)
 
-# Path to Poppler
-POPPLER_PATH = r'C:\Program Files\poppler\bin'
+    return _start_cached_extraction(key, digest, options, count_pages, iter_pages)
+
+def start_extract(path, digest, options=None):
+    """Begin extracting text from a PDF or image file on disk whose SHA-256 is `digest`.
+
+    `options` are the page selection options from `extraction_options()`.
+    Returns (page_count, page_numbers, cache_status, pages), where
+    `page_numbers` are the selected pages and `pages` yields one result dict
+    per selected page in order. A fully consumed extraction of the whole
+    document is added to the result cache, and a cached one is replayed
+    from it.
+    """
+    options = options or {}
+    if is_image_file(path):
+        return start_extract_image(path, digest, options)
+    return start_extract_pdf(path, digest, options)
+
+def parse_page_ranges(spec):
+    """Parse a page selection such as '1-3,7,10-' into (first, last) ranges; last is None if open-ended"""
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition('-')
+        try:
+            first = int(first) if first.strip() else 1
+            last = (int(last) if last.strip() else None) if dash else first
+        except ValueError:
+            raise ValueError(f"Invalid page range '{part}'")
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"Invalid page range '{part}'")
+        ranges.append((first, last))
+    if not ranges:
+        raise ValueError('No pages selected')
+    return ranges
+
+def extraction_options(values):
+    """Read page selection and early-stop options from request values, raising ValueError if invalid.
+
+    pages         page ranges to extract, e.g. '1-2,5' (default: all)
+    max_pages     extract at most this many of the selected pages
+    time_budget   seconds after which no further pages are started
+    stop_chars    stop once this many characters of text have been extracted
+    stop_when     stop once all these fields have been found, e.g. 'email,phone'
+    """
+    options = {}
+    if values.get('pages'):
+        options['pages'] = parse_page_ranges(values['pages'])
+    for name, cast in (('max_pages', int), ('stop_chars', int), ('time_budget', float)):
+        if values.get(name):
+            try:
+                value = cast(values[name])
+            except ValueError:
+                raise ValueError(f"{name} must be a number")
+            if value <= 0:
+                raise ValueError(f"{name} must be positive")
+            options[name] = value
+    if values.get('stop_when'):
+        fields = {field.strip().lower() for field in values['stop_when'].split(',') if field.strip()}
+        unknown = fields - set(STOP_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown stop_when field(s) {', '.join(sorted(unknown))}, "
+                             f"choose from: {', '.join(STOP_FIELDS)}")
+        options['stop_when'] = fields
+    return options
+
+def select_pages(page_count, options):
+    """Page numbers to extract, in order, after applying the pages and max_pages options"""
+    if 'pages' in options:
+        page_numbers = sorted({number for first, last in options['pages']
+                               for number in range(first, min(last or page_count, page_count) + 1)})
+    else:
+        page_numbers = list(range(1, page_count + 1))
+    if 'max_pages' in options:
+        page_numbers = page_numbers[:options['max_pages']]
+    return page_numbers
+
+class StopCondition:
+    """Tracks a request's early-stop options as its pages come in"""
+
+    def __init__(self, options):
+        self.options = options or {}
+        self.started = time.perf_counter()
+        self.chars = 0
+        self.fields = set()
+
+    def update(self, page):
+        """Account for an extracted page, returning why extraction should stop, or None"""
+        text = page.get('text', '')
+        self.chars += len(text)
+        if 'stop_chars' in self.options and self.chars >= self.options['stop_chars']:
+            return 'stop_chars'
+        if 'stop_when' in self.options:
+            self.fields |= find_fields(text)
+            if self.fields >= self.options['stop_when']:
+                return 'stop_when'
+        if 'time_budget' in self.options and time.perf_counter() - self.started >= self.options['time_budget']:
+            return 'time_budget'
+        return None
+
+def _skipped_pages(page_results):
+    """Summarise the pages that were not OCR'd because they were blank or duplicates"""
+    return [dict({'page': page['page'], 'reason': page['method']},
+                 **({'duplicate_of': page['duplicate_of']} if 'duplicate_of' in page else {}))
+            for page in page_results if page['method'] in ('blank', 'duplicate')]
+
+def extract_document(path, digest, progress=None, options=None):
+    """Extract text from a PDF or image on disk whose SHA-256 is `digest`, using the result cache.
+
+    `progress(pages_done, pages_total)` is called as pages complete.
+    `options` select pages and set early-stop conditions, see `extraction_options()`.
+    """
+    stop = StopCondition(options)
+    page_count, page_numbers, cache_status, pages = start_extract(path, digest, options)
+    page_results = []
+    stop_reason = None
+    for page in pages:
+        page_results.append(page)
+        if progress:
+            progress(len(page_results), len(page_numbers))
+        stop_reason = stop.update(page)
+        if stop_reason:
+            # Closing the generator cancels the pages still queued for OCR
+            pages.close()
+            break
+    # Where each extracted page starts in the joined text
+    page_offsets = list(itertools.accumulate((len(page['text']) + 1 for page in page_results[:-1]), initial=0))
+    result = {
+        'text': ' '.join(page['text'] for page in page_results),
+        'page_offsets': page_offsets if page_results else [],
+        'pages': page_count,
+        'page_methods': [{field: value for field, value in page.items() if field != 'text'} for page in page_results],
+        'skipped_pages': _skipped_pages(page_results),
+        'cache': cache_status,
+    }
+    if options:
+        result.update(pages_requested=len(page_numbers), pages_extracted=len(page_results), stop_reason=stop_reason)
+    return result
+
+def _stream_document(path, digest, filename, file_key, fmt, timer, options, client):
+    """Yield NDJSON lines or SSE events for each page as soon as it is extracted"""
+    # The headers are gone before any page is done, so the stage timings
+    # are reported in the 'done' event instead of Server-Timing
+    timings.begin(timer)
+    _client.set(client)
+    def encode(event, data):
+        if fmt == 'sse':
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps(dict(data, event=event)) + '\n'
+
+    started = last = time.perf_counter()
+    try:
+        stop = StopCondition(options)
+        page_count, page_numbers, cache_status, pages = start_extract(path, digest, options)
+        yield encode('start', {'info': f"Title: {filename}", 'pages': page_count,
+                               'pages_requested': len(page_numbers),
+                               'cache': cache_status, 'file_key_used': file_key})
+        page_results = []
+        stop_reason = None
+        for page in pages:
+            now = time.perf_counter()
+            page_results.append(page)
+            yield encode('page', dict(page, page_ms=round((now - last) * 1000, 1),
+                                      elapsed_ms=round((now - started) * 1000, 1)))
+            last = now
+            stop_reason = stop.update(page)
+            if stop_reason:
+                pages.close()
+                break
+        yield encode('done', {'pages': page_count,
+                              'pages_extracted': len(page_results),
+                              'stop_reason': stop_reason,
+                              'skipped_pages': _skipped_pages(page_results),
+                              'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+                              'timings': timer.to_dict()})
+    except Exception as e:
+        print(f"Error streaming document: {str(e)}")
+        yield encode('error', {'error': str(e)})
+    finally:
+        os.remove(path)
+
+def request_client():
+    """Name the client of the current request, for admission control and fair page scheduling"""
+    return request.headers.get(ADMISSION_CLIENT_HEADER) or request.remote_addr or 'unknown'
+
+def set_client(client):
+    """Attribute the pages OCR'd from here on in this context to `client`"""
+    _client.set(client)
+
+def _document_cost(path, options):
+    """Pages of a document that will be extracted, the unit admission control schedules by"""
+    try:
+        if is_image_file(path):
+            with Image.open(path) as image:
+                page_count = getattr(image, 'n_frames', 1)
+        else:
+            page_count = pdfinfo_from_path(path, poppler_path=POPPLER_PATH)['Pages']
+    except Exception:
+        # Extraction will report what is wrong with the file
+        return 1
+    return len(select_pages(page_count, options or {}))
+
+def admit(cost):
+    """Wait for the current client's turn to extract `cost` pages, returning the ticket to release.
+
+    Returns None if admission control is off; raises Overloaded if the
+    request should be turned away instead.
+    """
+    controller = get_admission()
+    if controller is None:
+        return None
+    ticket = controller.enter(_client.get(), cost)
+    try:
+        with timings.stage('admission'):
+            ticket.wait()
+    except BaseException:
+        controller.leave(ticket)
+        raise
+    return ticket
+
+def release(ticket):
+    if ticket is not None:
+        get_admission().leave(ticket)
+
+@contextmanager
+def admitted(cost):
+    ticket = admit(cost)
+    try:
+        yield
+    finally:
+        release(ticket)
+
+def _retry_later(e):
+    """429 response for a request turned away by the job queue or admission control"""
+    response = jsonify({'error': str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+def _upload_suffix(filename):
+    """Return the extension to spool a supported upload under, or None if it isn't a PDF or image"""
+    suffix = os.path.splitext(filename)[1].lower()
+    if suffix == '.pdf' or suffix in IMAGE_EXTENSIONS:
+        return suffix
+    return None
+
+def _find_upload():
+    """Pick the uploaded file out of the request, returning (file, file_key)"""
+    # Try to get file0 first, then try other common names
+    file = None
+    file_key = None
+
+    # Try different possible file keys
+    possible_keys = ['file0', 'file', 'upload', 'document', 'pdf']
+
+    for key in possible_keys:
+        if key in request.files:
+            file = request.files[key]
+            file_key = key
+            break
+
+    # If still no file found, get the first file available
+    if not file and request.files:
+        file_key = list(request.files.keys())[0]
+        file = request.files[file_key]
+
+    return file, file_key
 
 @app.route('/process-pdfs', methods=['POST'])
 def process_pdfs():
@@ -26,23 +1028,7 @@ def process_pdfs():
         if not request.files:
             return jsonify({'error': 'No files in the request'}), 400
         
-        # Try to get file0 first, then try other common names
-        file = None
-        file_key = None
-        
-        # Try different possible file keys
-        possible_keys = ['file0', 'file', 'upload', 'document', 'pdf']
-        
-        for key in possible_keys:
-            if key in request.files:
-                file = request.files[key]
-                file_key = key
-                break
-        
-        # If still no file found, get the first file available
-        if not file and request.files:
-            file_key = list(request.files.keys())[0]
-            file = request.files[file_key]
+        file, file_key = _find_upload()
         
         if not file:
             return jsonify({'error': 'No file found in request'}), 400
@@ -52,30 +1038,55 @@ def process_pdfs():
 
         print(f"Found file: {file.filename} with key: {file_key}")
 
-        if file and file.filename.lower().endswith('.pdf'):
+        suffix = _upload_suffix(file.filename)
+        if suffix:
             filename = secure_filename(file.filename)
 
-            # Read PDF bytes
-            pdf_bytes = file.read()
-            
-            print(f"PDF size: {len(pdf_bytes)} bytes")
+            # Opt-in streaming of per-page results: ?stream=ndjson or ?stream=sse
+            stream = request.args.get('stream', '').lower()
+            if stream and stream not in STREAM_MIMETYPES:
+                return jsonify({'error': f"Unsupported stream format '{stream}', use ndjson or sse"}), 400
+            try:
+                options = extraction_options(request.values)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
 
-            # Convert PDF to images
-            pages = convert_from_bytes(pdf_bytes, poppler_path=POPPLER_PATH)
-            
-            print(f"Converted to {len(pages)} pages")
+            # Spool the upload to disk so it can be rendered or decoded a window at a time
+            fd, path = tempfile.mkstemp(suffix=suffix)
+            os.close(fd)
+            if stream:
+                try:
+                    digest = _spool_upload(file.stream, path)
+                    ticket = admit(_document_cost(path, options))
+                except Overloaded as e:
+                    os.remove(path)
+                    return _retry_later(e)
+                except Exception:
+                    os.remove(path)
+                    raise
+                # The generator removes the temp file once the stream ends
+                response = Response(_stream_document(path, digest, filename, file_key, stream, timings.current(),
+                                                     options, _client.get()),
+                                    mimetype=STREAM_MIMETYPES[stream])
+                response.call_on_close(lambda: release(ticket))
+                response.headers['Cache-Control'] = 'no-cache'
+                response.headers['X-Accel-Buffering'] = 'no'
+                return response
 
-            # Perform OCR on each page
-            page_texts = []
-            for i, page in enumerate(pages):
-                print(f"Processing page {i+1}")
-                text = pytesseract.image_to_string(page)
-                page_texts.append(text.strip())
+            try:
+                digest = _spool_upload(file.stream, path)
+                print(f"Upload size: {os.path.getsize(path)} bytes")
+
+                with admitted(_document_cost(path, options)):
+                    extracted = extract_document(path, digest, options=options)
+            except Overloaded as e:
+                return _retry_later(e)
+            finally:
+                os.remove(path)
 
             result = {
                 'info': f"Title: {filename}",
-                'text': ' '.join(page_texts),
-                'pages': len(pages),
+                **extracted,
                 'file_key_used': file_key
             }
 
@@ -83,16 +1094,221 @@ def process_pdfs():
 
         return jsonify({
             'info': f"Title: {secure_filename(file.filename)}",
-            'error': 'Uploaded file is not a PDF'
+            'error': 'Uploaded file is not a PDF or a supported image'
         }), 400
 
     except Exception as e:
         print(f"Error processing PDF: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def get_job_manager():
+    """Return the shared job manager, starting its runners on first use"""
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager(_run_job, JOB_RUNNERS, JOB_QUEUE_SIZE, JOB_RESULT_TTL)
+    return _job_manager
+
+def _run_job(job):
+    path, digest, filename, file_key, options, client = job.payload
+    _client.set(client)
+    try:
+        result = extract_document(path, digest, progress=job.progress, options=options)
+    finally:
+        os.remove(path)
+    return {'info': f"Title: {filename}", **result, 'file_key_used': file_key}
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    try:
+        if not request.files:
+            return jsonify({'error': 'No files in the request'}), 400
+
+        file, file_key = _find_upload()
+        if not file or file.filename == '':
+            return jsonify({'error': 'No selected file'}), 400
+
+        filename = secure_filename(file.filename)
+        suffix = _upload_suffix(filename)
+        if not suffix:
+            return jsonify({'info': f"Title: {filename}",
+                            'error': 'Uploaded file is not a PDF or a supported image'}), 400
+        try:
+            options = extraction_options(request.values)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        try:
+            digest = _spool_upload(file.stream, path)
+            job = get_job_manager().submit((path, digest, filename, file_key, options, _client.get()))
+        except QueueFull as e:
+            os.remove(path)
+            return _retry_later(e)
+        except Exception:
+            os.remove(path)
+            raise
+
+        print(f"Queued job {job.id} for {filename}")
+        return jsonify({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f"/jobs/{job.id}"
+        }), 202
+
+    except Exception as e:
+        print(f"Error queueing job: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(job.to_dict())
+
+def _spool_document(stream, filename, file_key):
+    fd, path = tempfile.mkstemp(suffix=_upload_suffix(filename))
+    os.close(fd)
+    try:
+        digest = _spool_upload(stream, path)
+    except Exception:
+        os.remove(path)
+        raise
+    return {'filename': filename, 'file_key': file_key, 'path': path, 'digest': digest}
+
+class BatchTooLarge(Exception):
+    """Raised when a batch has more files than BATCH_MAX_FILES or its archives unpack to too much"""
+
+def _check_batch_room(documents, count):
+    if len(documents) + count > BATCH_MAX_FILES:
+        raise BatchTooLarge(f'Too many files in batch, the limit is {BATCH_MAX_FILES}')
+
+def _spool_batch_upload(file, file_key, documents, unpacked):
+    """Spool one batch upload to disk, unpacking zip archives, and append it to documents.
+
+    `unpacked` is a one-item list with the bytes the request's archives have
+    unpacked to so far. Raises BatchTooLarge before spooling anything past
+    BATCH_MAX_FILES documents or BATCH_MAX_UNPACKED_MB.
+    """
+    filename = secure_filename(file.filename)
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(file.stream) as archive:
+            members = [member for member in archive.infolist() if not member.is_dir()]
+            _check_batch_room(documents, len(members))
+            # zipfile never inflates a member past its declared size, so the directory can be trusted here
+            unpacked[0] += sum(member.file_size for member in members)
+            if unpacked[0] > BATCH_MAX_UNPACKED_MB * 1024 * 1024:
+                raise BatchTooLarge(f'Batch archives unpack to more than {BATCH_MAX_UNPACKED_MB}MB')
+            for member in members:
+                name = secure_filename(os.path.basename(member.filename))
+                if not _upload_suffix(name):
+                    documents.append({'filename': name, 'file_key': f"{file_key}:{member.filename}",
+                                      'error': 'Archive member is not a PDF or a supported image'})
+                    continue
+                with archive.open(member) as stream:
+                    documents.append(_spool_document(stream, name, f"{file_key}:{member.filename}"))
+    elif _upload_suffix(filename):
+        _check_batch_room(documents, 1)
+        documents.append(_spool_document(file.stream, filename, file_key))
+    else:
+        _check_batch_room(documents, 1)
+        documents.append({'filename': filename, 'file_key': file_key,
+                          'error': 'Uploaded file is not a PDF or a supported image'})
+
+def _process_batch_document(document, options):
+    result = {'info': f"Title: {document['filename']}"}
+    if 'error' in document:
+        return dict(result, error=document['error'], file_key_used=document['file_key'])
+    try:
+        result.update(extract_document(document['path'], document['digest'], options=options))
+    except Exception as e:
+        print(f"Error processing {document['filename']} in batch: {str(e)}")
+        result['error'] = str(e)
+    result['file_key_used'] = document['file_key']
+    return result
+
+@app.route('/process-batch', methods=['POST'])
+def process_batch():
+    """Extract text from many PDFs and images (or zip archives of them) in one request"""
+    try:
+        uploads = [(key, file) for key, file in request.files.items(multi=True) if file.filename]
+        if not uploads:
+            return jsonify({'error': 'No files in the request'}), 400
+        try:
+            # The same page selection and early-stop options apply to every document
+            options = extraction_options(request.values)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        documents = []
+        unpacked = [0]
+        try:
+            for file_key, file in uploads:
+                try:
+                    _spool_batch_upload(file, file_key, documents, unpacked)
+                except zipfile.BadZipFile as e:
+                    _check_batch_room(documents, 1)
+                    documents.append({'filename': secure_filename(file.filename), 'file_key': file_key,
+                                      'error': f'Invalid zip archive: {e}'})
+
+            print(f"Processing batch of {len(documents)} document(s)")
+            # The whole batch is admitted as one request, costed by all of its pages
+            cost = sum(_document_cost(document['path'], options) for document in documents if 'path' in document)
+            with admitted(cost):
+                # Documents run side by side so their pages keep the whole OCR pool busy. Each runs in a
+                # copy of this request's context so its stages count towards it
+                context = contextvars.copy_context()
+                results = list(_batch_executor.map(
+                    lambda document: context.copy().run(_process_batch_document, document, options), documents))
+        except BatchTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        except Overloaded as e:
+            return _retry_later(e)
+        finally:
+            for document in documents:
+                if 'path' in document:
+                    os.remove(document['path'])
+
+        failed = sum(1 for result in results if 'error' in result)
+        return jsonify({
+            'files': len(results),
+            'succeeded': len(results) - failed,
+            'failed': failed,
+            'results': results
+        })
+
+    except Exception as e:
+        print(f"Error processing batch: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'ok', 'service': 'pdf-ocr-service'})
+    status = {'status': 'ok', 'service': 'pdf-ocr-service', 'cache': get_ocr_cache().stats()}
+    if OCR_QUEUE_URL:
+        status['queue'] = get_ocr_queue().stats()
+    if get_admission() is not None:
+        status['admission'] = get_admission().stats()
+    return jsonify(status)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype=METRICS_CONTENT_TYPE)
+
+@app.before_request
+def start_request_timer():
+    timings.begin()
+    _client.set(request_client())
+
+@app.after_request
+def add_server_timing(response):
+    timer = timings.current()
+    if timer is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_seconds.observe(timer.elapsed(), route=route, status=response.status_code)
+        if not response.is_streamed:
+            response.headers['Server-Timing'] = timer.server_timing()
+    return response
 
 @app.route('/test-upload', methods=['POST'])
 def test_upload():
@@ -124,18 +1340,117 @@ def test_upload():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Preprocessing settings compared by --benchmark, first one is the baseline
+BENCHMARK_SETTINGS = [
+    {'name': 'rgb-200dpi', 'grayscale': False, 'adaptive_dpi': False, 'dpi': 200, 'binarize': False, 'fast_dpi': 0},
+    {'name': 'gray-200dpi', 'grayscale': True, 'adaptive_dpi': False, 'dpi': 200, 'binarize': False, 'fast_dpi': 0},
+    {'name': 'gray-150dpi', 'grayscale': True, 'adaptive_dpi': False, 'dpi': 150, 'binarize': False, 'fast_dpi': 0},
+    {'name': 'gray-adaptive', 'grayscale': True, 'adaptive_dpi': True, 'dpi': 200, 'binarize': False, 'fast_dpi': 0},
+    {'name': 'gray-adaptive-binarized', 'grayscale': True, 'adaptive_dpi': True, 'dpi': 200, 'binarize': True,
+     'fast_dpi': 0},
+    {'name': 'gray-two-pass-150-200dpi', 'grayscale': True, 'adaptive_dpi': False, 'dpi': 200, 'binarize': False,
+     'fast_dpi': 150},
+]
+
+def _text_similarity(expected, actual):
+    return difflib.SequenceMatcher(None, expected.split(), actual.split(), autojunk=False).ratio()
+
+def run_preprocess_benchmark(corpus_dir):
+    """OCR every PDF in corpus_dir under each BENCHMARK_SETTINGS entry.
+
+    Reports pages/sec and, for PDFs with a matching <name>.txt ground
+    truth, word-level accuracy. The text layer and cache are bypassed so
+    every page is rendered and OCR'd.
+    """
+    global OCR_GRAYSCALE, OCR_ADAPTIVE_DPI, OCR_DPI, OCR_BINARIZE, OCR_FAST_DPI
+    pdf_paths = sorted(glob.glob(os.path.join(corpus_dir, '*.pdf')))
+    if not pdf_paths:
+        raise SystemExit(f"No PDFs found in {corpus_dir}")
+
+    start_ocr_pool()
+    report = {'corpus': corpus_dir, 'documents': len(pdf_paths), 'workers': OCR_WORKERS, 'settings': []}
+    for settings in BENCHMARK_SETTINGS:
+        OCR_GRAYSCALE = settings['grayscale']
+        OCR_ADAPTIVE_DPI = settings['adaptive_dpi']
+        OCR_DPI = settings['dpi']
+        OCR_BINARIZE = settings['binarize']
+        OCR_FAST_DPI = settings['fast_dpi']
+
+        pages = 0
+        second_pass = 0
+        confidences = []
+        accuracies = []
+        started = time.perf_counter()
+        for pdf_path in pdf_paths:
+            page_count = pdfinfo_from_path(pdf_path, poppler_path=POPPLER_PATH)['Pages']
+            texts = []
+            for _, text, details in iter_ocr_pdf(pdf_path, range(1, page_count + 1), use_cache=False):
+                texts.append(text)
+                second_pass += details.get('passes') == 2
+                if details.get('confidence') is not None:
+                    confidences.append(details['confidence'])
+            text = ' '.join(texts)
+            pages += page_count
+            truth_path = os.path.splitext(pdf_path)[0] + '.txt'
+            if os.path.exists(truth_path):
+                with open(truth_path, encoding='utf-8') as f:
+                    accuracies.append(_text_similarity(f.read(), text))
+        seconds = time.perf_counter() - started
+
+        result = dict(settings, pages=pages, seconds=round(seconds, 3),
+                      pages_per_sec=round(pages / seconds, 3) if seconds else None,
+                      second_pass_pages=second_pass,
+                      mean_confidence=round(sum(confidences) / len(confidences), 1) if confidences else None,
+                      accuracy=round(sum(accuracies) / len(accuracies), 4) if accuracies else None)
+        print(f"{settings['name']}: {result['pages_per_sec']} pages/sec, accuracy {result['accuracy']}")
+        report['settings'].append(result)
+
+    baseline = report['settings'][0]
+    for result in report['settings']:
+        if baseline['pages_per_sec'] and result['pages_per_sec']:
+            result['speedup'] = round(result['pages_per_sec'] / baseline['pages_per_sec'], 3)
+    return report
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PDF OCR service')
+    parser.add_argument('--benchmark', metavar='CORPUS_DIR',
+                        help='compare preprocessing settings on a folder of sample PDFs instead of serving')
+    parser.add_argument('--output', metavar='FILE', help='write the benchmark report here instead of stdout')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        report = json.dumps(run_preprocess_benchmark(args.benchmark), indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(report)
+        else:
+            print(report)
+        sys.exit(0)
+
     port = int(os.environ.get('PORT', 8000))
 
-    if not os.path.exists(POPPLER_PATH):
+    if POPPLER_PATH and not os.path.exists(POPPLER_PATH):
         print(f"Warning: Poppler path not found at {POPPLER_PATH}")
-        print("Please update the POPPLER_PATH variable in the script")
+        print("Set the POPPLER_PATH environment variable, or leave it empty to use PATH")
 
-    try:
-        pytesseract.get_tesseract_version()
-        print("Tesseract is properly configured.")
-    except Exception as e:
-        print(f"Error: Tesseract is not properly installed or configured: {e}")
-        exit(1)
+    # The tesserocr engine links libtesseract directly and doesn't need the
+    # binary, and with a queue the workers do all the OCR
+    if not OCR_QUEUE_URL and resolve_engine(OCR_ENGINE) == 'pytesseract':
+        try:
+            pytesseract.get_tesseract_version()
+            print("Tesseract is properly configured.")
+        except Exception as e:
+            print(f"Error: Tesseract is not properly installed or configured: {e}")
+            exit(1)
+
+    debug = True
+    # With the reloader on, this block also runs in the watcher process,
+    # which never serves requests, so only start the pool where it's needed
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        if OCR_QUEUE_URL:
+            get_ocr_queue()
+        else:
+            start_ocr_pool()
+        get_job_manager()
 
-    app.run(host='0.0.0.0', port=port, debug=True)
+    app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,81 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# One pattern for everything we pull out of a CV, so the text is scanned
+# once. Emails come first so digits inside an address never count as a phone.
+_FIELDS_RE = re.compile(r"""
+    (?P<email>\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b)
+  | (?P<linkedin>linkedin\.com/in/[\w-]+)
+  | (?P<phone>(?<![\w.])\+?[1-9]?[0-9]{7,15}(?![\w@]|\.\d))
+""", re.IGNORECASE | re.VERBOSE)
+
+# Keys n8n nodes commonly put extracted text under, in order of preference
+TEXT_KEYS = ('text', 'extracted_text', 'extractedText', 'content', 'data')
+
+
+def extract_text(payload, parts=None, path=()):
+    """Pull the document text out of a decoded n8n webhook reply.
+
+    If a set is given as `parts`, the path (a tuple of keys and list indexes)
+    of each string the text was joined from is added to it.
+    """
+    if isinstance(payload, str):
+        if payload and parts is not None:
+            parts.add(path)
+        return payload
+    if isinstance(payload, list):
+        return '\n'.join(filter(None, (extract_text(item, parts, path + (index,))
+                                       for index, item in enumerate(payload))))
+    if isinstance(payload, dict):
+        for key in TEXT_KEYS:
+            text = extract_text(payload.get(key), parts, path + (key,))
+            if text:
+                return text
+        return '\n'.join(filter(None, (extract_text(value, parts, path + (key,)) for key, value in payload.items()
+                                       if isinstance(value, (dict, list)))))
+    return ''
+
+
+def _find_name(text_content):
+    # The name is usually one of the first few short, capitalised lines
+    for line in text_content.split('\n', 5)[:5]:
+        line = line.strip()
+        words = line.split()
+        if line and len(words) <= 4 and any(word[0].isupper() for word in words):
+            return line
+    return None
+
+
+def find_fields(text_content):
+    """Return the names of the fields (email, linkedin, phone) that occur in the text"""
+    return {match.lastgroup for match in _FIELDS_RE.finditer(text_content)}
+
+
+def parse_resume_data(text_content):
+    """Parse resume/CV text content and extract structured information"""
+    if not text_content:
+        return None
+
+    emails, phones, linkedin = [], [], None
+    for match in _FIELDS_RE.finditer(text_content):
+        kind = match.lastgroup
+        if kind == 'email':
+            emails.append(match.group())
+        elif kind == 'phone':
+            phones.append(match.group())
+        elif linkedin is None:
+            linkedin = match.group().lower()
+
+    return {
+        'name': _find_name(text_content),
+        'emails': emails,
+        'phones': phones,
+        'linkedin': linkedin,
+        'raw_text': text_content
+    }
+
+
+def parse_many(texts, workers=None, chunksize=64):
+    """Parse many CV texts in parallel across processes, returning results in input order"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(parse_resume_data, texts, chunksize=chunksize))
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py opens its document store on import; keep the tests' documents out of the real one
+os.environ.setdefault('DOCUMENT_STORE_PATH', os.path.join(tempfile.mkdtemp(prefix='app-tests-'), 'documents.db'))
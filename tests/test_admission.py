@@ -0,0 +1,159 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from admission import AdmissionController, FairScheduler, Overloaded, parse_weights
+
+
+def granted(ticket):
+    return ticket.granted_at is not None
+
+
+def test_light_client_goes_ahead_of_a_heavy_one():
+    controller = AdmissionController(max_active=1, per_client=1, max_wait=1000)
+    blocker = controller.enter('other', 1)
+    heavy = [controller.enter('batch', 1) for _ in range(4)]
+    light = controller.enter('single', 1)
+    order = []
+    running = blocker
+    while running is not None:
+        controller.leave(running)
+        running = next((ticket for ticket in heavy + [light] if granted(ticket) and ticket not in order), None)
+        if running is not None:
+            order.append(running)
+    assert order == [heavy[0], light] + heavy[1:]
+
+
+def test_weights_scale_a_clients_share():
+    controller = AdmissionController(max_active=1, per_client=1, max_wait=1000,
+                                     weights=parse_weights('fast=4'))
+    controller.enter('other', 1)
+    slow = controller.enter('slow', 4)
+    fast = [controller.enter('fast', 4) for _ in range(3)]
+    assert all(ticket.tag <= slow.tag for ticket in fast)
+
+
+def test_per_client_cap():
+    controller = AdmissionController(max_active=3, per_client=1, max_wait=1000)
+    first = controller.enter('a', 1)
+    second = controller.enter('a', 1)
+    other = controller.enter('b', 1)
+    assert granted(first) and granted(other) and not granted(second)
+    assert controller.stats()['active'] == 2
+    controller.leave(first)
+    assert granted(second)
+
+
+def test_max_queued_per_client_sheds():
+    controller = AdmissionController(max_active=1, per_client=1, max_wait=1000, max_queued_per_client=2)
+    controller.enter('a', 1)
+    controller.enter('a', 1)
+    controller.enter('a', 1)
+    with pytest.raises(Overloaded) as error:
+        controller.enter('a', 1)
+    assert error.value.retry_after >= 1
+    controller.enter('b', 1)
+    assert controller.stats()['rejected'] == 1
+
+
+def test_max_wait_sheds_without_moving_the_clients_tag():
+    controller = AdmissionController(max_active=1, per_client=1, max_wait=5)
+    controller.enter('a', 10)
+    tag = controller._clock.peek('b', 1)
+    with pytest.raises(Overloaded) as error:
+        controller.enter('b', 1)
+    assert error.value.retry_after == 10
+    assert controller._clock.peek('b', 1) == tag
+    assert controller.stats()['waiting'] == 0
+
+
+def test_estimate_counts_the_soonest_slot_and_the_work_ahead():
+    controller = AdmissionController(max_active=2, per_client=2, max_wait=1000)
+    controller._seconds_per_cost = 0.5
+    controller.enter('a', 4)
+    controller.enter('a', 2)
+    waiting = controller.enter('b', 3)
+    later = controller.enter('b', 1)
+    # The cost-2 request frees its slot after about 1s, then half of b's 3 * 0.5s runs ahead
+    assert controller._estimate(later.tag) == pytest.approx(1.0 + 3 * 0.5 / 2, abs=0.05)
+    assert controller._estimate(waiting.tag) == pytest.approx(1.0, abs=0.05)
+
+
+def test_leave_is_idempotent():
+    controller = AdmissionController(max_active=1, per_client=1, max_wait=1000)
+    first = controller.enter('a', 1)
+    second = controller.enter('b', 1)
+    controller.leave(first)
+    measured = controller.stats()['seconds_per_cost']
+    controller.leave(first)
+    assert controller.stats()['seconds_per_cost'] == measured
+    assert controller.stats()['active'] == 1 and granted(second)
+
+
+def test_withdrawn_ticket_is_never_granted():
+    controller = AdmissionController(max_active=1, per_client=1, max_wait=1000)
+    first = controller.enter('a', 1)
+    waiting = controller.enter('b', 1)
+    controller.leave(waiting)
+    controller.leave(first)
+    assert not granted(waiting)
+    assert controller.stats()['active'] == 0 and controller.stats()['waiting'] == 0
+
+
+def test_admit_waits_for_a_slot():
+    controller = AdmissionController(max_active=1, per_client=1, max_wait=1000)
+    first = controller.enter('a', 1)
+    entered = threading.Event()
+
+    def run():
+        with controller.admit('b', 1):
+            entered.set()
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert not entered.wait(0.1)
+    controller.leave(first)
+    assert entered.wait(5)
+    thread.join()
+    assert controller.stats()['active'] == 0
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(1)
+    yield executor
+    executor.shutdown()
+
+
+def test_scheduler_interleaves_clients_and_cancels_waiting_tasks(executor):
+    scheduler = FairScheduler(lambda: executor, slots=1)
+    release = threading.Event()
+    order = []
+
+    def task(name):
+        if name == 'blocker':
+            release.wait(5)
+        order.append(name)
+        return name
+
+    blocker = scheduler.submit('other', task, 'blocker')
+    heavy = [scheduler.submit('batch', task, f'heavy-{i}') for i in range(3)]
+    light = scheduler.submit('single', task, 'light')
+    assert scheduler.waiting() == 4
+    assert not blocker.cancel()
+    assert heavy[2].cancel()
+    release.set()
+    assert light.result(5) == 'light'
+    assert heavy[1].result(5) == 'heavy-1'
+    assert order == ['blocker', 'heavy-0', 'light', 'heavy-1']
+    assert heavy[2].cancelled() and scheduler.waiting() == 0
+
+
+def test_scheduler_passes_on_task_errors(executor):
+    scheduler = FairScheduler(lambda: executor, slots=1)
+
+    def fail():
+        raise ValueError('bad page')
+    with pytest.raises(ValueError, match='bad page'):
+        scheduler.submit('a', fail).result(5)
+    assert scheduler.submit('a', lambda: 'next').result(5) == 'next'
@@ -0,0 +1,56 @@
+import io
+import zipfile
+
+import pytest
+
+import pdf_ocr
+
+
+@pytest.fixture
+def spooled(monkeypatch):
+    """Names of the documents spooled to disk, which must not happen for rejected batches"""
+    names = []
+    spool = pdf_ocr._spool_document
+
+    def record(stream, filename, file_key):
+        names.append(filename)
+        return spool(stream, filename, file_key)
+    monkeypatch.setattr(pdf_ocr, '_spool_document', record)
+    return names
+
+
+def archive(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipped:
+        for name, data in members.items():
+            zipped.writestr(name, data)
+    return buffer.getvalue()
+
+
+def post_batch(files):
+    client = pdf_ocr.app.test_client()
+    return client.post('/process-batch', data={f'file{i}': (io.BytesIO(data), name)
+                                               for i, (name, data) in enumerate(files)})
+
+
+def test_too_many_archive_members_are_rejected_before_unpacking(monkeypatch, spooled):
+    monkeypatch.setattr(pdf_ocr, 'BATCH_MAX_FILES', 3)
+    response = post_batch([('scans.zip', archive({f'{i}.png': b'x' for i in range(4)}))])
+    assert response.status_code == 413
+    assert spooled == []
+
+
+def test_files_across_uploads_count_towards_the_limit(monkeypatch, spooled):
+    monkeypatch.setattr(pdf_ocr, 'BATCH_MAX_FILES', 2)
+    response = post_batch([('a.txt', b'x'), ('b.txt', b'x'), ('c.txt', b'x')])
+    assert response.status_code == 413
+
+
+def test_archives_that_unpack_too_far_are_rejected_before_unpacking(monkeypatch, spooled):
+    monkeypatch.setattr(pdf_ocr, 'BATCH_MAX_UNPACKED_MB', 1)
+    data = archive({'big.png': b'\0' * (2 * 1024 * 1024)})
+    assert len(data) < 64 * 1024
+    response = post_batch([('bomb.zip', data)])
+    assert response.status_code == 413
+    assert 'unpack' in response.json['error']
+    assert spooled == []
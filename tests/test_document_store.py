@@ -0,0 +1,95 @@
+import re
+
+import pytest
+
+from document_store import DocumentStore, _snippet
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DocumentStore(str(tmp_path / 'data' / 'documents.db'))
+
+
+def shas(result):
+    return [hit['sha256'] for hit in result['hits']]
+
+
+def test_put_and_get(store):
+    store.put('a' * 64, 'cv.pdf', 'Jane Doe\nPage two', [0, 9], {'name': 'Jane Doe', 'emails': []}, 123, 'application/pdf')
+    document = store.get('a' * 64)
+    assert document['text'] == 'Jane Doe\nPage two'
+    assert document['page_offsets'] == [0, 9] and document['pages'] == 2
+    assert document['fields'] == {'name': 'Jane Doe', 'emails': []}
+    assert store.get('b' * 64) is None
+
+
+def test_replacing_a_document_replaces_its_index_entry(store):
+    store.put('a' * 64, 'old.pdf', 'python developer in berlin', fields={'emails': ['old@example.com']})
+    store.put('b' * 64, 'other.pdf', 'python developer in paris')
+    store.put('a' * 64, 'new.pdf', 'rust developer in munich', fields={'emails': ['new@example.com']})
+    assert shas(store.search('berlin')) == []
+    assert shas(store.search('old.pdf')) == []
+    assert shas(store.search('old@example.com')) == []
+    assert shas(store.search('munich')) == ['a' * 64]
+    assert shas(store.search('new@example.com')) == ['a' * 64]
+    assert shas(store.search('python')) == ['b' * 64]
+    assert sorted(shas(store.search('developer'))) == ['a' * 64, 'b' * 64]
+    assert store.stats()['documents'] == 2
+    # Replacing it again still finds the values the index holds for it
+    store.put('a' * 64, 'new.pdf', 'rust developer in munich', fields={'emails': ['new@example.com']})
+    assert shas(store.search('munich')) == ['a' * 64]
+    store.put('a' * 64, 'new.pdf', 'go developer')
+    assert shas(store.search('munich')) == [] and shas(store.search('go')) == ['a' * 64]
+
+
+def test_search_terms_are_not_fts_syntax(store):
+    store.put('a' * 64, 'cv.pdf', 'C++ and "quoted" NEAR OR things')
+    assert shas(store.search('NEAR OR')) == ['a' * 64]
+    assert shas(store.search('"quoted')) == ['a' * 64]
+    assert store.search('***') == {'hits': [], 'has_more': False}
+
+
+def test_prefix_search_and_paging(store):
+    for i in range(3):
+        store.put(str(i) * 64, f'{i}.pdf', f'engineering manager number {i}')
+    first = store.search('engineer*', limit=2)
+    assert len(first['hits']) == 2 and first['has_more']
+    rest = store.search('engineer*', limit=2, offset=2)
+    assert len(rest['hits']) == 1 and not rest['has_more']
+
+
+def test_search_hit_has_page_and_marked_snippet(store):
+    text = 'Jane Doe\n' + 'filler ' * 30 + '\nExperience at <Acme>\n'
+    offsets = [0, 9, len(text) - len('Experience at <Acme>\n')]
+    store.put('a' * 64, 'cv.pdf', text, offsets)
+    hit = store.search('acme')['hits'][0]
+    assert hit['page'] == 3
+    assert '<mark>Acme</mark>' in hit['snippet'] and '&lt;' in hit['snippet']
+
+
+def test_pages(store):
+    store.put('a' * 64, 'cv.pdf', 'one\ntwo\nthree\n', [0, 4, 8])
+    assert store.pages('a' * 64, 2, 5)['items'] == [{'page': 2, 'text': 'two\n'}, {'page': 3, 'text': 'three\n'}]
+    assert store.pages('a' * 64, 4, 5)['items'] == []
+    assert store.pages('b' * 64) is None
+
+
+def test_snippet_page_mapping_at_page_starts():
+    text = 'alpha\nbeta\ngamma\n'
+    pattern = re.compile('beta')
+    assert _snippet(text, [0, 6, 11], pattern, 40) == ('alpha <mark>beta</mark> gamma', 2)
+    assert _snippet(text, [0, 6, 11], re.compile('gamma'), 40)[1] == 3
+    assert _snippet(text, [0, 6, 11], re.compile('alpha'), 40)[1] == 1
+
+
+def test_snippet_without_a_match_in_the_text():
+    assert _snippet('a' * 10, [0], re.compile('zzz'), 4) == ('aaaa…', None)
+
+
+def test_snippet_cuts_at_word_boundaries():
+    text = ' '.join(f'word{i}' for i in range(50)) + ' target ' + ' '.join(f'tail{i}' for i in range(50))
+    snippet, page = _snippet(text, [0], re.compile('target'), 60)
+    assert snippet.startswith('…word') and snippet.endswith('…')
+    assert '<mark>target</mark>' in snippet
+    assert not re.search(r'…\S*\d…', snippet) and page == 1
+    assert all(part.startswith(('word', 'tail', '<mark>')) for part in snippet.strip('…').split())
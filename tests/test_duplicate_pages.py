@@ -0,0 +1,83 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image, ImageDraw
+
+import pdf_ocr
+
+
+class FakeEngine:
+    """Reads a page as a digest of its pixels, so pages that differ at all read differently"""
+    name = 'fake'
+
+    def version(self):
+        return '1'
+
+    def recognize(self, image):
+        return 'page ' + hashlib.sha256(image.tobytes()).hexdigest()[:16], 90.0
+
+
+def form_page(values):
+    image = Image.new('L', (1275, 1650), 255)
+    draw = ImageDraw.Draw(image)
+    for line, value in enumerate(values):
+        draw.text((120, 80 + line * 36), f'Field {line + 1:02d}: {value}', fill=0)
+    return image
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    pool = ThreadPoolExecutor(2)
+    monkeypatch.setattr(pdf_ocr, '_ocr_pool', pool)
+    monkeypatch.setattr(pdf_ocr, '_page_scheduler', None)
+    monkeypatch.setattr(pdf_ocr, '_engine', FakeEngine())
+    monkeypatch.setattr(pdf_ocr, 'OCR_DUPLICATE_MIN_SIMILARITY', 0.75)
+    yield
+    pool.shutdown()
+
+
+def ocr(pages):
+    windows = [(list(range(1, len(pages) + 1)), pages)]
+    return list(pdf_ocr._ocr_windows(windows, use_cache=False))
+
+
+def test_duplicate_detection_is_off_by_default():
+    signature = pdf_ocr.PageSignature(form_page(['value a'] * 40))
+    assert pdf_ocr._find_duplicate(signature, [(1, signature, {}, {})]) is None
+
+
+@pytest.mark.parametrize('changed', [
+    {17: 'Jane Smith'},
+    {3: 'Berlin', 29: '2024-06-01'},
+    {line: 'value b' for line in range(40)},
+])
+def test_near_identical_form_pages_keep_their_own_text(fake_pool, changed):
+    values = ['value a'] * 40
+    first = form_page(values)
+    second = form_page([changed.get(line, value) for line, value in enumerate(values)])
+    assert pdf_ocr.PageSignature(second).matches(pdf_ocr.PageSignature(first), 0.75)
+    pages = ocr([first, second])
+    assert [details['method'] for _, _, details in pages] == ['ocr', 'ocr']
+    assert pages[0][1] != pages[1][1]
+
+
+def test_identical_pages_reuse_text(fake_pool):
+    page = form_page(['value a'] * 40)
+    pages = ocr([page, page.copy()])
+    assert pages[1][2] == {'method': 'duplicate', 'duplicate_of': 1}
+    assert pages[1][1] == pages[0][1]
+
+
+def gradient_page(darkening):
+    image = Image.new('L', (900, 600), 255)
+    draw = ImageDraw.Draw(image)
+    for x in range(600):
+        shade = x * 200 // 600
+        draw.line([(150 + x, 100), (150 + x, 500)], fill=200 - shade if darkening else shade)
+    return image
+
+
+@pytest.mark.parametrize('darkening, dhash', [(False, 0), (True, (1 << 64) - 1)])
+def test_dhash_compares_neighbouring_pixels(darkening, dhash):
+    assert pdf_ocr.PageSignature(gradient_page(darkening)).dhash == dhash
@@ -0,0 +1,145 @@
+import io
+import json
+import time
+import zipfile
+
+import pytest
+
+import local_extract
+
+
+def extract(data, filename, max_chars=10 ** 6, page_chars=0):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return local_extract.extract_file(io.BytesIO(data), filename, max_chars, page_chars)
+
+
+def zipped(parts):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in parts.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+S = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+R = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+
+
+def docx(body):
+    return zipped({'word/document.xml': f'<w:document {W}><w:body>{body}</w:body></w:document>'})
+
+
+def xlsx(shared_strings, sheets):
+    parts = {
+        'xl/workbook.xml': f'<workbook {S} {R}><sheets>' + ''.join(
+            f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>' for i, name in enumerate(sheets, 1)) +
+        '</sheets></workbook>',
+        'xl/_rels/workbook.xml.rels': '<Relationships>' + ''.join(
+            f'<Relationship Id="rId{i}" Target="worksheets/sheet{i}.xml"/>' for i in range(1, len(sheets) + 1)) +
+        '</Relationships>',
+        'xl/sharedStrings.xml': f'<sst {S}>' + ''.join(f'<si><t>{s}</t></si>' for s in shared_strings) + '</sst>',
+    }
+    for i, rows in enumerate(sheets.values(), 1):
+        parts[f'xl/worksheets/sheet{i}.xml'] = f'<worksheet {S}><sheetData>' + ''.join(
+            '<row>' + ''.join(f'<c r="{cell}" t="s"><v>{value}</v></c>' if isinstance(value, int)
+                              else f'<c r="{cell}"><v>{value}</v></c>' for cell, value in row) + '</row>'
+            for row in rows) + '</sheetData></worksheet>'
+    return zipped(parts)
+
+
+def test_text_form_feeds_start_pages():
+    result = extract('Jane Doe\nEngineer\fPage two', 'cv.txt')
+    assert result['text'] == 'Jane Doe\nEngineer\nPage two'
+    assert result['page_offsets'] == [0, 18]
+    assert result['format'] == 'txt'
+
+
+def test_text_is_truncated_at_max_chars():
+    result = extract('x' * 100, 'notes.md', max_chars=10)
+    assert result['text'] == 'x' * 10 and result['truncated']
+
+
+def test_text_in_cp1252():
+    assert extract('Café'.encode('cp1252'), 'a.txt')['text'] == 'Café'
+
+
+def test_html_blocks_become_lines_and_scripts_are_skipped():
+    result = extract('<html><head><script>var x = 1;</script></head>'
+                     '<body><h1>Jane  Doe</h1><p>Senior <b>engineer</b></p></body></html>', 'cv.html')
+    assert result['text'] == 'Jane Doe\nSenior engineer\n'
+
+
+def test_xml_elements_become_lines():
+    assert extract('<cv><name>Jane Doe</name><email>jane@example.com</email></cv>', 'cv.xml')['text'] == \
+        'Jane Doe\njane@example.com\n'
+
+
+def test_malformed_xml_is_read_as_text():
+    result = extract('<cv><name>Jane</cv>', 'cv.xml')
+    assert result['text'] == '<cv><name>Jane</cv>' and result['format'] == 'xml'
+
+
+def test_csv_rows_become_tab_separated_lines():
+    assert extract('name;email\nJane Doe; jane@example.com\n', 'people.csv')['text'] == \
+        'name\temail\nJane Doe\tjane@example.com\n'
+
+
+def test_malformed_csv_is_read_as_text():
+    # A field over the csv module's size limit
+    data = 'name,notes\nJane,"' + 'x' * 200000 + '"\n'
+    assert extract(data, 'people.csv')['text'] == data
+
+
+def test_json_values_follow_their_keys():
+    data = json.dumps({'name': 'Jane Doe', 'skills': ['Python', 'SQL'], 'address': {'city': 'Berlin'},
+                       'age': 41, 'manager': None, 'quote': 'say "hi"\n'})
+    assert extract(data, 'cv.json')['text'] == \
+        'name: Jane Doe\nskills: Python\nskills: SQL\ncity: Berlin\nage: 41\nquote: say "hi"\n\n'
+
+
+def test_json_lines():
+    assert extract('{"a": 1}\n{"b": true}\n', 'rows.json')['text'] == 'a: 1\nb: true\n'
+
+
+@pytest.mark.parametrize('data', ['{"a": 1', '{"a" 1}', '"a": 1', '[1, "a": 2]', '{"a": 1]', 'not json at all'])
+def test_malformed_json_is_read_as_text(data):
+    result = extract(data, 'cv.json')
+    assert result['text'] == data and result['format'] == 'json'
+
+
+def test_long_json_string_is_read_in_linear_time():
+    data = json.dumps({'blob': 'A' * 8 * 1024 * 1024, 'name': 'Jane'})
+    started = time.perf_counter()
+    result = extract(data, 'blob.json', max_chars=10 ** 8)
+    assert time.perf_counter() - started < 5
+    assert result['text'].endswith('\nname: Jane\n') and len(result['text']) > 8 * 1024 * 1024
+
+
+def test_docx_paragraphs_and_page_breaks():
+    body = ('<w:p><w:r><w:t>Jane</w:t></w:r><w:r><w:t xml:space="preserve"> Doe</w:t></w:r></w:p>'
+            '<w:p><w:r><w:br w:type="page"/><w:t>Page two</w:t></w:r></w:p>')
+    result = extract(docx(body), 'cv.docx')
+    assert result['text'] == 'Jane Doe\nPage two\n'
+    assert result['page_offsets'] == [0, 9]
+
+
+def test_damaged_docx_returns_none():
+    assert extract(docx('<w:p>')[:-40], 'cv.docx') is None
+    assert extract(b'not a zip', 'cv.docx') is None
+    assert extract(zipped({'other.xml': '<a/>'}), 'cv.docx') is None
+
+
+def test_xlsx_sheets_are_pages_of_rows():
+    data = xlsx(['Name', 'Jane Doe'], {'People': [[('A1', 0), ('C1', 'Age')], [('A2', 1), ('C2', '41')]],
+                                       'Other': [[('B1', 0)]]})
+    result = extract(data, 'people.xlsx')
+    assert result['text'] == 'People\nName\t\tAge\nJane Doe\t\t41\nOther\n\tName\n'
+    assert result['pages'] == 2
+
+
+def test_xlsx_shared_strings_are_capped_at_max_chars():
+    data = xlsx(['x' * 50] * 100 + ['last'], {'Sheet': [[('A1', 100)], [('A2', 0)]]})
+    result = extract(data, 'big.xlsx', max_chars=200)
+    assert result['text'] == 'Sheet\n' + 'x' * 50 + '\n'
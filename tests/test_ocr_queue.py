@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+from ocr_queue import RedisBroker, SQLiteBroker, open_broker
+
+
+def redis_broker(lease_seconds, max_attempts):
+    fakeredis = pytest.importorskip('fakeredis')
+    # Lease scripts need Lua, which fakeredis only has with its lua extra
+    pytest.importorskip('lupa')
+    return RedisBroker(fakeredis.FakeRedis(), lease_seconds, max_attempts)
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def make_broker(request, tmp_path):
+    def make(lease_seconds=60, max_attempts=3):
+        if request.param == 'sqlite':
+            return SQLiteBroker(str(tmp_path / 'queue.db'), lease_seconds, max_attempts)
+        return redis_broker(lease_seconds, max_attempts)
+    return make
+
+
+def test_submit_lease_complete(make_broker):
+    broker = make_broker()
+    broker.submit('job', b'%PDF', '.pdf', [1, 2])
+    assert broker.stats() == {'queued': 2, 'leased': 0}
+    assert broker.document('job') == ('.pdf', b'%PDF')
+
+    first = broker.lease('worker-1')
+    second = broker.lease('worker-2')
+    assert (first.job_id, first.page, first.attempts) == ('job', 1, 1)
+    assert (second.job_id, second.page) == ('job', 2)
+    assert broker.lease('worker-3') is None
+    assert broker.stats() == {'queued': 0, 'leased': 2}
+
+    broker.complete(first.id, {'text': 'one'})
+    broker.complete(first.id, {'text': 'late duplicate'})
+    assert broker.take_results('job') == {1: {'text': 'one'}}
+    assert broker.take_results('job') == {}
+    broker.complete(second.id, {'text': 'two'})
+    assert broker.take_results('job') == {2: {'text': 'two'}}
+
+
+def test_expired_lease_is_leased_again(make_broker):
+    broker = make_broker(lease_seconds=0.05)
+    broker.submit('job', b'%PDF', '.pdf', [1])
+    first = broker.lease('worker-1')
+    assert broker.lease('worker-2') is None
+    time.sleep(0.1)
+    second = broker.lease('worker-2')
+    assert (second.id, second.attempts) == (first.id, 2)
+
+
+def test_task_fails_after_max_attempts(make_broker):
+    broker = make_broker(lease_seconds=0.05, max_attempts=2)
+    broker.submit('job', b'%PDF', '.pdf', [1])
+    for _ in range(2):
+        assert broker.lease('worker') is not None
+        time.sleep(0.1)
+    assert broker.lease('worker') is None
+    assert broker.take_results('job') == {1: {'error': 'Lease expired 2 times'}}
+    assert broker.stats() == {'queued': 0, 'leased': 0}
+
+
+def test_fail_requeues_until_attempts_run_out(make_broker):
+    broker = make_broker(max_attempts=2)
+    broker.submit('job', b'%PDF', '.pdf', [1])
+    broker.fail(broker.lease('worker').id, 'tesseract crashed')
+    assert broker.take_results('job') == {}
+    task = broker.lease('worker')
+    assert task.attempts == 2
+    broker.fail(task.id, 'tesseract crashed again')
+    assert broker.lease('worker') is None
+    assert broker.take_results('job') == {1: {'error': 'tesseract crashed again'}}
+
+
+def test_delete_drops_queued_and_leased_tasks(make_broker):
+    broker = make_broker()
+    broker.submit('job', b'%PDF', '.pdf', [1, 2])
+    leased = broker.lease('worker')
+    broker.delete('job')
+    assert broker.document('job') is None
+    assert broker.lease('worker') is None
+    broker.complete(leased.id, {'text': 'too late'})
+    assert broker.take_results('job') == {}
+    assert broker.stats() == {'queued': 0, 'leased': 0}
+
+
+def test_redis_script_keys_share_a_cluster_slot():
+    broker = redis_broker(60, 3)
+    keys = [broker._key(name) for name in ('queue', 'leases', 'tasks', 'workers')]
+    assert all(key.startswith('{ocr}:') for key in keys)
+
+
+def test_open_broker(tmp_path):
+    assert isinstance(open_broker(f'sqlite:///{tmp_path}/queue.db'), SQLiteBroker)
+    with pytest.raises(ValueError):
+        open_broker('memcached://localhost')
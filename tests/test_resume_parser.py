@@ -0,0 +1,25 @@
+import pytest
+
+from resume_parser import extract_text, parse_resume_data
+
+
+@pytest.mark.parametrize('text, phones', [
+    ('Call +201234567890 any time', ['+201234567890']),
+    ('Phone: 01234567890.', ['01234567890']),
+    ('Revenue grew to 1234567.89 last year', []),
+    ('Budget 12345678.5 USD', []),
+    ('Ref 123456789@example.com', []),
+])
+def test_phones(text, phones):
+    assert parse_resume_data(text)['phones'] == phones
+
+
+def test_emails_linkedin_and_name():
+    parsed = parse_resume_data('Jane Doe\njane.doe@example.com\nLinkedIn.com/in/Jane-Doe\n')
+    assert parsed['name'] == 'Jane Doe'
+    assert parsed['emails'] == ['jane.doe@example.com']
+    assert parsed['linkedin'] == 'linkedin.com/in/jane-doe'
+
+
+def test_extract_text_joins_items():
+    assert extract_text([{'text': 'page one'}, {'extractedText': 'page two'}]) == 'page one\npage two'
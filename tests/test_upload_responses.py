@@ -0,0 +1,76 @@
+import io
+import gzip
+import json
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def upload(client, text, query='', headers=None, filename='cv.txt'):
+    return client.post(f'/api/upload{query}', data={'file': (io.BytesIO(text.encode('utf-8')), filename)},
+                       headers=headers)
+
+
+CV = 'Jane Doe\nEngineer at Acme\njane@example.com\n+201234567890\n'
+
+
+def test_raw_response_keeps_metadata_that_occurs_in_the_text():
+    result, status = app.reply_result('cv.pdf', {'text': CV + 'Speaks en and de', 'languages': ['en', 'de'],
+                                                 'id': 'Acme', 'pages': 1})
+    assert status == 200
+    assert json.loads(result['raw_response']) == {'languages': ['en', 'de'], 'id': 'Acme', 'pages': 1}
+    assert result['response']['raw_text'] == CV + 'Speaks en and de'
+
+
+def test_raw_response_drops_every_joined_text_item():
+    reply = [{'text': 'Jane Doe\njane@example.com', 'page': 1}, {'extractedText': 'Page two', 'page': 2}]
+    result, _ = app.reply_result('cv.pdf', reply)
+    assert result['response']['raw_text'] == 'Jane Doe\njane@example.com\nPage two'
+    assert json.loads(result['raw_response']) == [{'page': 1}, {'page': 2}]
+
+
+def test_raw_response_drops_joined_list_of_strings():
+    result, _ = app.reply_result('cv.pdf', {'data': ['Jane Doe', 'jane@example.com'], 'format': 'pdf'})
+    assert json.loads(result['raw_response']) == {'data': [], 'format': 'pdf'}
+
+
+def test_fields_selects_keys_and_subkeys(client):
+    response = upload(client, CV, '?fields=filename,response.emails,response.phones,nope')
+    assert response.status_code == 200
+    assert response.json == {'filename': 'cv.txt',
+                             'response': {'emails': ['jane@example.com'], 'phones': ['+201234567890']}}
+
+
+def test_large_responses_are_gzipped(client):
+    response = upload(client, CV + 'x' * 5000, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.data))['response']['emails'] == ['jane@example.com']
+
+
+def test_small_responses_are_not_compressed(client):
+    response = upload(client, CV, '?fields=filename', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.json == {'filename': 'cv.txt'}
+
+
+def test_text_pages_are_read_from_the_document_store(client):
+    response = upload(client, CV + '\fPage two\fPage three', '?text=pages')
+    body = response.json
+    assert 'raw_text' not in body['response'] and body['response']['emails'] == ['jane@example.com']
+    assert body['pages'] == 3
+    pages = client.get(body['text_url'] + '?start=2&count=1').json
+    assert pages['items'] == [{'page': 2, 'text': 'Page two\n'}]
+    assert pages['next'] == 3
+    last = client.get(body['text_url'] + '?start=3&count=5').json
+    assert last['items'] == [{'page': 3, 'text': 'Page three'}] and last['next'] is None
+
+
+def test_document_pages_rejects_bad_numbers():
+    assert app.document_pages('0' * 64, {'start': 'x'})[1] == 400
@@ -0,0 +1,128 @@
+import hashlib
+import threading
+
+import pytest
+
+import app
+from upload_sessions import IncompleteUpload, UploadFinalized, UploadLimit, UploadSession, UploadSessions
+
+DATA = bytes(range(256)) * 40  # 10240 bytes, in chunks of 1000
+
+
+def chunks(data=DATA, size=1000):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = UploadSession(str(tmp_path), 'scan.pdf', len(DATA), 1000, buffer_bytes=2500)
+    yield session
+    session.close()
+
+
+def assembled(session):
+    return session.open().read()
+
+
+def test_chunks_in_order(session):
+    for index, chunk in enumerate(chunks()):
+        session.write_chunk(index, chunk)
+    assert session.finalize() == hashlib.sha256(DATA).hexdigest()
+    assert assembled(session) == DATA
+
+
+def test_chunks_out_of_order_beyond_the_hash_buffer(session):
+    parts = chunks()
+    # Everything but chunk 0 arrives first, so most chunks have to be read back from disk to be hashed
+    for index in reversed(range(1, len(parts))):
+        session.write_chunk(index, parts[index])
+    assert session.missing() == [0]
+    with pytest.raises(IncompleteUpload) as missing:
+        session.finalize()
+    assert missing.value.missing == [0]
+    session.write_chunk(0, parts[0])
+    assert session.finalize() == hashlib.sha256(DATA).hexdigest()
+    assert assembled(session) == DATA
+
+
+def test_resent_chunks_are_ignored(session):
+    parts = chunks()
+    for index in [3, 0, 3, 1, 0] + list(range(len(parts))):
+        session.write_chunk(index, parts[index])
+    assert session.finalize() == hashlib.sha256(DATA).hexdigest()
+
+
+def test_chunks_of_the_wrong_size_or_index_are_refused(session):
+    with pytest.raises(ValueError):
+        session.write_chunk(0, b'short')
+    with pytest.raises(ValueError):
+        session.write_chunk(11, b'x' * 240)
+    session.write_chunk(10, DATA[10000:])
+    assert session.missing() == list(range(10))
+
+
+def test_finalize_only_once_until_reopened(session):
+    for index, chunk in enumerate(chunks()):
+        session.write_chunk(index, chunk)
+    digest = session.finalize()
+    with pytest.raises(UploadFinalized):
+        session.finalize()
+    with pytest.raises(ValueError):
+        session.write_chunk(0, chunks()[0])
+    session.reopen()
+    assert session.finalize() == digest
+
+
+def test_sessions_per_client_and_total_bytes_are_capped(tmp_path):
+    sessions = UploadSessions(str(tmp_path), ttl=3600, buffer_bytes=0, per_client=2, max_bytes=3000)
+    sessions.create('a.pdf', 1000, 1000, 'alice')
+    second = sessions.create('b.pdf', 1000, 1000, 'alice')
+    with pytest.raises(UploadLimit):
+        sessions.create('c.pdf', 1000, 1000, 'alice')
+    with pytest.raises(UploadLimit):
+        sessions.create('d.pdf', 1001, 1000, 'bob')
+    sessions.remove(second.id)
+    sessions.create('c.pdf', 1000, 1000, 'alice')
+    sessions.create('d.pdf', 1000, 1000, 'bob')
+
+
+def open_upload(client):
+    body = client.post('/api/uploads', json={'filename': 'cv.txt', 'size': len(DATA)}).json
+    for index, chunk in enumerate(chunks(size=body['chunk_size'])):
+        client.put(f"{body['upload_url']}/chunks/{index}", data=chunk)
+    return body['upload_url']
+
+
+def test_concurrent_complete_gets_409(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_process_upload(*args):
+        started.set()
+        release.wait(5)
+        return {'response': {}}, 200
+    monkeypatch.setattr(app, 'process_upload', slow_process_upload)
+    client = app.app.test_client()
+    url = open_upload(client)
+    first = {}
+    thread = threading.Thread(target=lambda: first.update(response=client.post(f'{url}/complete')))
+    thread.start()
+    assert started.wait(5)
+    second = client.post(f'{url}/complete')
+    release.set()
+    thread.join()
+    assert second.status_code == 409 and 'missing' not in second.json
+    assert first['response'].status_code == 200
+    assert client.get(url).status_code == 404
+
+
+def test_failed_complete_keeps_the_upload(monkeypatch):
+    replies = iter([({'error': 'n8n webhook returned status 502'}, 500), ({'response': {}}, 200)])
+    monkeypatch.setattr(app, 'process_upload', lambda *args: next(replies))
+    client = app.app.test_client()
+    url = open_upload(client)
+    assert client.post(f'{url}/complete', json={'sha256': '0' * 64}).status_code == 422
+    assert client.post(f'{url}/complete').status_code == 500
+    assert client.get(url).json['missing'] == []
+    response = client.post(f'{url}/complete')
+    assert response.status_code == 200 and response.json['sha256'] == hashlib.sha256(DATA).hexdigest()
+    assert client.get(url).status_code == 404
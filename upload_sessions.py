@@ -0,0 +1,192 @@
+import os
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+
+
+class IncompleteUpload(Exception):
+    """Raised when an upload is finalized before all of its chunks have arrived"""
+
+    def __init__(self, missing):
+        super().__init__(f"{len(missing)} chunk(s) missing")
+        self.missing = missing
+
+
+class UploadLimit(Exception):
+    """Raised when opening an upload would go over the per-client or total limits on open uploads"""
+
+
+class UploadFinalized(Exception):
+    """Raised when an upload is finalized while another request is already processing it"""
+
+    def __init__(self):
+        super().__init__('Upload is already being completed')
+
+
+class UploadSession:
+    """One chunked upload, assembled in place in a preallocated file.
+
+    Chunks may arrive in any order and more than once. Each is written at
+    its offset and hashed as soon as every chunk before it has been, so
+    the SHA-256 is ready when the last chunk lands and the file is never
+    read back as a whole. Chunks that arrive ahead of the hash are kept in
+    memory up to `buffer_bytes`; beyond that they are read back from disk
+    when their turn comes.
+    """
+
+    def __init__(self, directory, filename, size, chunk_size, buffer_bytes, client=None):
+        self.id = uuid.uuid4().hex
+        self.client = client
+        self.filename = filename
+        self.size = size
+        self.chunk_size = chunk_size
+        self.chunk_count = max(1, -(-size // chunk_size))
+        self.buffer_bytes = buffer_bytes
+        self.received = set()
+        self.finalized = False
+        self.updated_at = time.time()
+
+        fd, self.path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1].lower(), dir=directory)
+        self._file = os.fdopen(fd, 'w+b')
+        self._file.truncate(size)
+        self._lock = threading.Lock()
+        self._hash = hashlib.sha256()
+        self._hashed = 0  # chunks before this index have been hashed
+        self._buffered = {}
+        self._buffered_bytes = 0
+
+    def chunk_length(self, index):
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def write_chunk(self, index, data):
+        """Store chunk `index`, raising ValueError if it doesn't fit the upload"""
+        if not 0 <= index < self.chunk_count:
+            raise ValueError(f"Chunk {index} is out of range, the upload has {self.chunk_count} chunk(s)")
+        if len(data) != self.chunk_length(index):
+            raise ValueError(f"Chunk {index} must be {self.chunk_length(index)} bytes, got {len(data)}")
+        with self._lock:
+            if self.finalized:
+                raise ValueError('Upload has already been finalized')
+            self.updated_at = time.time()
+            if index in self.received:
+                # A retry of a chunk whose first attempt did arrive
+                return
+            self._file.seek(index * self.chunk_size)
+            self._file.write(data)
+            self.received.add(index)
+            if index > self._hashed and self._buffered_bytes + len(data) <= self.buffer_bytes:
+                self._buffered[index] = data
+                self._buffered_bytes += len(data)
+            elif index == self._hashed:
+                self._hash.update(data)
+                self._hashed += 1
+            self._advance_hash()
+
+    def _advance_hash(self):
+        while self._hashed in self.received:
+            data = self._buffered.pop(self._hashed, None)
+            if data is None:
+                self._file.seek(self._hashed * self.chunk_size)
+                data = self._file.read(self.chunk_length(self._hashed))
+            else:
+                self._buffered_bytes -= len(data)
+            self._hash.update(data)
+            self._hashed += 1
+
+    def missing(self):
+        return sorted(set(range(self.chunk_count)) - self.received)
+
+    def finalize(self):
+        """Seal the upload and return its SHA-256 hex digest.
+
+        Raises IncompleteUpload if chunks are missing, or UploadFinalized if
+        the upload has been finalized already, so only one request gets it.
+        """
+        with self._lock:
+            if self.finalized:
+                raise UploadFinalized()
+            missing = self.missing()
+            if missing:
+                raise IncompleteUpload(missing)
+            self.finalized = True
+            self._file.flush()
+            return self._hash.hexdigest()
+
+    def reopen(self):
+        """Undo finalize() so the upload can be finalized again later, e.g. after processing was turned away"""
+        with self._lock:
+            self.finalized = False
+            self.updated_at = time.time()
+
+    def open(self):
+        """Return the assembled file, positioned at its start"""
+        self._file.seek(0)
+        return self._file
+
+    def close(self):
+        self._file.close()
+        os.remove(self.path)
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'chunks': self.chunk_count,
+            'chunks_received': len(self.received),
+            'missing': self.missing(),
+        }
+
+
+class UploadSessions:
+    """Open chunked uploads. Sessions idle for longer than `ttl` seconds are dropped.
+
+    A client may have at most `per_client` uploads open, and all open
+    uploads together may be at most `max_bytes` (0 for no limit), as each
+    one reserves its full size on disk when it is created.
+    """
+
+    def __init__(self, directory, ttl, buffer_bytes, per_client=4, max_bytes=0):
+        self.directory = directory
+        self.ttl = ttl
+        self.buffer_bytes = buffer_bytes
+        self.per_client = per_client
+        self.max_bytes = max_bytes
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, filename, size, chunk_size, client=None):
+        """Open an upload, raising UploadLimit if it would go over the limits"""
+        self._expire()
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            if sum(1 for session in self._sessions.values() if session.client == client) >= self.per_client:
+                raise UploadLimit(f"Client already has {self.per_client} uploads open")
+            if self.max_bytes and sum(session.size for session in self._sessions.values()) + size > self.max_bytes:
+                raise UploadLimit('Too much upload space is in use, try again later')
+            session = UploadSession(self.directory, filename, size, chunk_size, self.buffer_bytes, client)
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, upload_id):
+        with self._lock:
+            return self._sessions.get(upload_id)
+
+    def remove(self, upload_id):
+        with self._lock:
+            session = self._sessions.pop(upload_id, None)
+        if session is not None:
+            session.close()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [session for session in self._sessions.values()
+                       if session.updated_at < cutoff and not session.finalized]
+            for session in expired:
+                del self._sessions[session.id]
+        for session in expired:
+            session.close()
@@ -0,0 +1,174 @@
+import time
+import random
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {502, 503, 504}
+
+
+class WebhookClient:
+    """Thread-safe keep-alive HTTP client for posting uploads to one webhook.
+
+    Connections come from a shared pool of `pool_size`; callers block when
+    all of them are busy. Connection errors and 502/503/504 responses are
+    retried up to `retries` times with full-jitter exponential backoff.
+    """
+
+    def __init__(self, url, pool_size, connect_timeout, read_timeout, retries, backoff, backoff_max):
+        self.url = url
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+        self._session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self._session.mount('http://', self._adapter)
+        self._session.mount('https://', self._adapter)
+
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._stats = {'requests': 0, 'retries': 0, 'failures': 0}
+
+    def post(self, body, headers=None):
+        """POST a body to the webhook. `body` may be bytes, or a file-like object with `rewind()`"""
+        with self._lock:
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._stats['requests'] += 1
+        try:
+            attempt = 0
+            while True:
+                if attempt and hasattr(body, 'rewind'):
+                    body.rewind()
+                try:
+                    response = self._session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+                except requests.ConnectionError:
+                    if attempt >= self.retries:
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                        return response
+                    response.close()
+                attempt += 1
+                with self._lock:
+                    self._stats['retries'] += 1
+                time.sleep(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** (attempt - 1))))
+        except Exception:
+            with self._lock:
+                self._stats['failures'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_use -= 1
+
+    def stats(self):
+        idle = 0
+        opened = 0
+        for key in self._adapter.poolmanager.pools.keys():
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            opened += pool.num_connections
+            # Empty slots in urllib3's pool queue are None
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'pool_size': self.pool_size,
+                'in_use': self._in_use,
+                'idle': idle,
+                'connections_opened': opened,
+                # Connections opened beyond the peak concurrency had to replace dropped ones
+                # (urllib3 keeps at most pool_size per host, whatever the peak)
+                'reconnects': max(0, opened - min(self._peak_in_use, self.pool_size)),
+            })
+        return stats
+
+
+class AsyncWebhookClient:
+    """asyncio counterpart of WebhookClient built on httpx.
+
+    Waiting on the webhook holds no thread, so one process can keep many
+    uploads in flight; at most `pool_size` of them have a connection at a
+    time. Retry behaviour matches WebhookClient.
+    """
+
+    def __init__(self, url, pool_size, connect_timeout, read_timeout, retries, backoff, backoff_max):
+        # Optional dependency, only needed for the ASGI app
+        import httpx
+        self._httpx = httpx
+        self.url = url
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=None),
+        )
+        self._in_use = 0
+        self._connections_opened = 0
+        self._stats = {'requests': 0, 'retries': 0, 'failures': 0}
+
+    @staticmethod
+    async def _iter_body(body, chunk_size=64 * 1024):
+        # The body is a spooled file that may be on disk, so reads stay off the event loop
+        while True:
+            chunk = await asyncio.to_thread(body.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    async def _send(self, body, headers):
+        if hasattr(body, 'read'):
+            headers = dict(headers or {}, **{'Content-Length': str(body.len)})
+            return await self._client.post(self.url, content=self._iter_body(body), headers=headers)
+        return await self._client.post(self.url, content=body, headers=headers)
+
+    async def post(self, body, headers=None):
+        """POST a body to the webhook. `body` may be bytes, or a file-like object with `rewind()` and `len`"""
+        retryable = (self._httpx.ConnectError, self._httpx.ConnectTimeout, self._httpx.RemoteProtocolError)
+        self._in_use += 1
+        self._stats['requests'] += 1
+        try:
+            attempt = 0
+            while True:
+                if attempt and hasattr(body, 'rewind'):
+                    body.rewind()
+                try:
+                    response = await self._send(body, headers)
+                except retryable:
+                    if attempt >= self.retries:
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                        return response
+                attempt += 1
+                self._stats['retries'] += 1
+                await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** (attempt - 1))))
+        except Exception:
+            self._stats['failures'] += 1
+            raise
+        finally:
+            self._in_use -= 1
+
+    def stats(self):
+        # httpx doesn't expose its pool publicly; fall back to zeros if that changes
+        pool = getattr(getattr(self._client, '_transport', None), '_pool', None)
+        connections = list(getattr(pool, 'connections', []))
+        stats = dict(self._stats)
+        stats.update({
+            'pool_size': self.pool_size,
+            'in_use': self._in_use,
+            'idle': sum(1 for conn in connections if conn.is_idle()),
+            'connections': len(connections),
+        })
+        return stats
+
+    async def aclose(self):
+        await self._client.aclose()